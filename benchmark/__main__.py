@@ -0,0 +1,10 @@
+import os
+import sys
+
+# the benchmark imports the shared protocol from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark.load import main
+
+if __name__ == '__main__':
+    main()
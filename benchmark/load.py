@@ -0,0 +1,440 @@
+"""
+Load generator which plays full games against a local headless server with simulated players
+
+Players are asyncio coroutines speaking the wire protocol directly, a process pool runs more of them
+than one event loop keeps up with. Every run is seeded so that the same arguments draw the same answers
+and answer delays.
+"""
+import asyncio
+import math
+import multiprocessing
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from json import dumps
+from typing import Dict, List, Tuple, Any, Optional, Callable, Sequence
+
+from common.protocol import FrameDecoder, MessageType, ProtocolError, encode_text, encode_join, decode_question
+from common.heartbeat import PONG_FRAME
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'exponential', 'lognormal')
+REPORT_PERCENTILES = (50, 99)
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def latency_sampler(spec: str, rng: random.Random) -> Callable[[], float]:
+    """
+    Make a function drawing answer delays from a distribution
+    :param spec: distribution and its parameters in seconds separated by colons, constant:0.5, uniform:0.1:2,
+    exponential:0.5 with the mean or lognormal:0.5:0.3 with the median and the sigma
+    :param rng: random number generator of the caller
+    :return: function returning a delay in seconds
+    """
+    name, *values = spec.split(':')
+    try:
+        params = [float(value) for value in values]
+    except ValueError:
+        raise ValueError(f'Invalid answer latency {spec}')
+
+    if name == 'constant' and len(params) == 1:
+        return lambda: params[0]
+    if name == 'uniform' and len(params) == 2:
+        return lambda: rng.uniform(params[0], params[1])
+    if name == 'exponential' and len(params) == 1:
+        return lambda: rng.expovariate(1 / params[0]) if params[0] > 0 else 0.0
+    if name == 'lognormal' and len(params) == 2:
+        return lambda: rng.lognormvariate(math.log(params[0]), params[1])
+    raise ValueError(f'Invalid answer latency {spec}, expected one of {", ".join(LATENCY_DISTRIBUTIONS)}')
+
+
+def percentiles(values: Sequence[float], ranks: Sequence[float] = REPORT_PERCENTILES) -> Dict[str, Any]:
+    """
+    Summarize samples with the nearest rank method
+    :param values: samples in seconds
+    :param ranks: percentiles to report
+    :return: count, mean and the percentiles in milliseconds
+    """
+    if not values:
+        return {'count': 0}
+
+    ordered = sorted(values)
+    summary: Dict[str, Any] = {'count': len(ordered), 'mean_ms': sum(ordered) / len(ordered) * 1000}
+    for rank in ranks:
+        index = max(0, min(len(ordered) - 1, math.ceil(rank / 100 * len(ordered)) - 1))
+        summary[f'p{rank:g}_ms'] = ordered[index] * 1000
+    summary['max_ms'] = ordered[-1] * 1000
+    return summary
+
+
+class SimulatedPlayer:
+    def __init__(self, name: str, room: Optional[str], games: int, draw_latency: Callable[[], float],
+                 rng: random.Random):
+        """
+        Initialize a player which joins, answers every question after a random delay and plays a number of games
+        :param name: name of the player
+        :param room: room to join, None to send only the name
+        :param games: number of games to play before leaving
+        :param draw_latency: function returning the delay before an answer
+        :param rng: random number generator drawing the answers
+        """
+        self.name = name
+        self.room = room
+        self.games = games
+        self.draw_latency = draw_latency
+        self.rng = rng
+
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.decoder = FrameDecoder()
+
+        self.started_at: Optional[float] = None  # time the player starts connecting
+        self.joined_at: Optional[float] = None  # time the server accepts the name of the player
+        self.error: Optional[str] = None
+        self.fan_out: List[float] = []  # seconds between the server sending a question and the player receiving it
+        self.results: List[float] = []  # seconds between the answer and the results of the round
+        # round key with the time of the answer and the time the results are received
+        self.rounds: Dict[Tuple[str, int, int], Tuple[float, float]] = {}
+
+    async def join(self, port: int) -> bool:
+        """
+        Connect and wait until the server accepts the player
+        :param port: port of the server on localhost
+        :return: True if the player joined, False otherwise
+        """
+        self.started_at = time.time()
+        try:
+            self.reader, self.writer = await asyncio.open_connection('localhost', port)
+            self.writer.write(encode_text(self.name) if self.room is None else encode_join(self.name, self.room))
+
+            while True:
+                frame = self.decoder.next_frame()
+                if frame is None:
+                    data = await self.reader.read(65536)
+                    if not data:
+                        self.error = 'closed before joining'
+                        return False
+                    self.decoder.feed(data)
+                elif frame[0] == MessageType.TEXT:
+                    break
+
+        except OSError as error:
+            self.error = f'connect: {error}'
+            return False
+
+        if frame[1] != b'Connected':
+            self.error = f'rejected: {frame[1].decode()}'
+            return False
+
+        self.joined_at = time.time()
+        return True
+
+    async def play(self) -> None:
+        """
+        Play until the games are over or the server closes the connection
+        :return: None
+        """
+        game, question = 0, 0
+        answer_task: Optional[asyncio.Task] = None
+        try:
+            while game < self.games:
+                for message_type, payload in self.decoder.frames():
+                    if message_type == MessageType.PING:
+                        self.writer.write(PONG_FRAME)
+
+                    elif message_type == MessageType.TEXT:
+                        text = payload.decode()
+                        if text == 'start':
+                            question = 0
+                        elif text in ('restart', 'terminate'):
+                            game = self.games if text == 'terminate' else game + 1
+
+                    elif message_type == MessageType.QUESTION:
+                        received_at = time.time()
+                        _, sent_at = decode_question(payload)
+                        self.fan_out.append(received_at - sent_at)
+                        question += 1
+                        answer_task = asyncio.ensure_future(self._answer())
+
+                    elif message_type == MessageType.RESULTS:
+                        received_at = time.time()
+                        # the round may be closed by its deadline before the answer is sent
+                        if answer_task is not None and answer_task.done():
+                            answered_at = answer_task.result()
+                            self.results.append(received_at - answered_at)
+                            self.rounds[(self.room or '', game, question)] = (answered_at, received_at)
+                        elif answer_task is not None:
+                            answer_task.cancel()
+                        answer_task = None
+
+                if game >= self.games:
+                    break
+
+                await self.writer.drain()
+                data = await self.reader.read(65536)
+                if not data:
+                    break
+                self.decoder.feed(data)
+
+        except (OSError, ProtocolError) as error:
+            self.error = f'connection: {error}'
+        finally:
+            if answer_task is not None:
+                answer_task.cancel()
+            self.writer.close()
+
+    async def _answer(self) -> float:
+        """
+        Answer the current question after a delay drawn from the latency distribution
+        :return: time the answer is sent
+        """
+        await asyncio.sleep(self.draw_latency())
+        self.writer.write(encode_text(str(self.rng.randint(0, 2100))))
+        return time.time()
+
+
+async def play_shard(names: List[Tuple[str, Optional[str]]], port: int, games: int, latency: str, seed: int,
+                     concurrency: int) -> List[SimulatedPlayer]:
+    """
+    Run players on one event loop
+    :param names: name and room of the players
+    :param port: port of the server
+    :param games: number of games each player plays
+    :param latency: answer latency distribution, see latency_sampler
+    :param seed: seed of the players of the shard
+    :param concurrency: number of connections opened at the same time
+    :return: players after their games
+    """
+    rng = random.Random(seed)
+    players = [SimulatedPlayer(name, room, games, latency_sampler(latency, rng), random.Random(rng.random()))
+               for name, room in names]
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run(player: SimulatedPlayer) -> None:
+        # only the handshake is gated, the game is played with every other player
+        async with gate:
+            is_joined = await player.join(port)
+        if is_joined:
+            await player.play()
+        elif player.writer is not None:
+            player.writer.close()
+
+    await asyncio.gather(*(run(player) for player in players))
+    return players
+
+
+def run_shard(arguments: Tuple[List[Tuple[str, Optional[str]]], int, int, str, int, int]) -> Dict[str, Any]:
+    """
+    Entry point of a worker process of the pool, runs a shard of the players
+    :param arguments: arguments of play_shard
+    :return: samples of the shard
+    """
+    raise_file_limit()
+    cpu = resource.getrusage(resource.RUSAGE_SELF)
+    players = asyncio.run(play_shard(*arguments))
+    used = resource.getrusage(resource.RUSAGE_SELF)
+
+    return {
+        'connect': [(player.started_at, player.joined_at) for player in players if player.joined_at is not None],
+        'fan_out': [sample for player in players for sample in player.fan_out],
+        'results': [sample for player in players for sample in player.results],
+        'rounds': [(key, answered_at, received_at) for player in players
+                   for key, (answered_at, received_at) in player.rounds.items()],
+        'errors': [f'{player.name}: {player.error}' for player in players if player.error],
+        'cpu': used.ru_utime + used.ru_stime - cpu.ru_utime - cpu.ru_stime,
+    }
+
+
+def raise_file_limit() -> None:
+    """
+    Allow as many open sockets as the hard limit of the process
+    :return: None
+    """
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+
+def process_usage(pid: int) -> Dict[str, float]:
+    """
+    Read the CPU time and memory of a process from /proc
+    :param pid: process id
+    :return: cpu_seconds, rss_mb and peak_rss_mb while the process runs, empty if the process is gone
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as file:
+            fields = file.read().rsplit(')', 1)[1].split()
+        with open(f'/proc/{pid}/status') as file:
+            status = dict(line.split(':', 1) for line in file if ':' in line)
+    except OSError:
+        return {}
+
+    # utime and stime are the 14th and 15th fields, counted after the command name
+    usage = {'cpu_seconds': (int(fields[11]) + int(fields[12])) / CLOCK_TICKS}
+
+    # an exited process which is not reaped yet keeps its CPU time but has no memory lines
+    if 'VmRSS' in status:
+        usage['rss_mb'] = int(status['VmRSS'].split()[0]) / 1024
+        usage['peak_rss_mb'] = int(status['VmHWM'].split()[0]) / 1024
+    return usage
+
+
+def wait_for_port(port: int, process: subprocess.Popen, timeout: float = 10.0) -> None:
+    """
+    Block until the server accepts connections
+    :param port: port of the server
+    :param process: server process
+    :param timeout: seconds to wait
+    :return: None
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'Server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('localhost', port), 0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f'Server did not listen on port {port} in {timeout} seconds')
+
+
+def start_server(args) -> subprocess.Popen:
+    """
+    Start the headless server for the benchmark
+    :param args: parsed arguments of the benchmark
+    :return: server process
+    """
+    players_per_room = args.players // args.rooms
+    command = [sys.executable, '-m', 'service', '--port', str(args.port), '--questions', str(args.questions),
+               '--min-players', str(players_per_room), '--max-players', str(players_per_room)]
+    if args.games > 1:
+        command.append('--auto-restart')
+    if args.rooms > 1:
+        command.append('--rooms')
+    command.extend(args.server_args)
+
+    output = None if args.verbose else subprocess.DEVNULL
+    return subprocess.Popen(command, cwd=ROOT, stdout=output, stderr=output, preexec_fn=raise_file_limit)
+
+
+def round_close_latency(rounds: List[Tuple[Tuple[str, int, int], float, float]]) -> List[float]:
+    """
+    Get the time between the last answer of every round and the first player getting its results
+    :param rounds: round key, answer time and results time of every player
+    :return: seconds for every round
+    """
+    closes: Dict[Tuple[str, int, int], Tuple[float, float]] = {}
+    for key, answered_at, received_at in rounds:
+        last_answer, first_result = closes.get(key, (answered_at, received_at))
+        closes[key] = (max(last_answer, answered_at), min(first_result, received_at))
+    return [first_result - last_answer for last_answer, first_result in closes.values()]
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    """
+    Start a server, play the games with the simulated players and measure the server
+    :param args: parsed arguments
+    :return: report
+    """
+    raise_file_limit()
+    server = start_server(args)
+    try:
+        wait_for_port(args.port, server)
+        baseline = process_usage(server.pid)
+
+        # players of a room are spread over the shards so that every shard plays in every room
+        rooms = [None] if args.rooms == 1 else [f'room{index}' for index in range(args.rooms)]
+        names = [(f'bot{index}', rooms[index % len(rooms)]) for index in range(args.players)]
+        shards = [(names[index::args.processes], args.port, args.games, args.latency, args.seed + index,
+                   args.connect_concurrency) for index in range(args.processes)]
+
+        started = time.monotonic()
+        if args.processes == 1:
+            samples = [run_shard(shards[0])]
+        else:
+            with multiprocessing.Pool(args.processes) as pool:
+                samples = pool.map(run_shard, shards)
+        elapsed = time.monotonic() - started
+
+        usage = process_usage(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    connects = [sample for shard in samples for sample in shard['connect']]
+    connect_window = max(joined_at for _, joined_at in connects) - min(started_at for started_at, _ in connects) \
+        if connects else 0.0
+    server_cpu = usage.get('cpu_seconds', 0.0) - baseline.get('cpu_seconds', 0.0)
+    return {
+        'config': {'players': args.players, 'rooms': args.rooms, 'games': args.games, 'questions': args.questions,
+                   'latency': args.latency, 'seed': args.seed, 'processes': args.processes,
+                   'server_args': args.server_args},
+        'elapsed_seconds': elapsed,
+        'connected': len(connects),
+        'errors': [error for shard in samples for error in shard['errors']],
+        # players joined per second, from the first connection attempt to the last player getting Connected
+        'connect_rate': len(connects) / connect_window if connect_window else 0.0,
+        'connect_latency': percentiles([joined_at - started_at for started_at, joined_at in connects]),
+        'fan_out_latency': percentiles([sample for shard in samples for sample in shard['fan_out']]),
+        'round_close_latency': percentiles(round_close_latency([item for shard in samples
+                                                                for item in shard['rounds']])),
+        'results_latency': percentiles([sample for shard in samples for sample in shard['results']]),
+        'server': dict(usage, cpu_seconds=server_cpu,
+                       cpu_ms_per_player=server_cpu / args.players * 1000 if args.players else 0.0),
+        'client_cpu_seconds': sum(shard['cpu'] for shard in samples),
+    }
+
+
+def parse_arguments(arguments: Optional[List[str]] = None):
+    """
+    Parse command line arguments of the benchmark
+    :param arguments: arguments to parse, command line arguments by default
+    :return: parsed arguments
+    """
+    parser = ArgumentParser(prog='python -m benchmark',
+                            description='Play games against a local server with simulated players and report JSON')
+    parser.add_argument('--players', type=int, default=100, help='number of simulated players')
+    parser.add_argument('--rooms', type=int, default=1, help='number of rooms the players are spread over')
+    parser.add_argument('--games', type=int, default=1, help='number of games each player plays')
+    parser.add_argument('--questions', type=int, default=5, help='number of questions in a game')
+    parser.add_argument('--latency', default='uniform:0.05:0.5',
+                        help='answer delay distribution: constant:S, uniform:MIN:MAX, exponential:MEAN '
+                             'or lognormal:MEDIAN:SIGMA, in seconds')
+    parser.add_argument('--seed', type=int, default=408, help='seed of the answers and the answer delays')
+    parser.add_argument('--processes', type=int, default=1, help='processes running the players')
+    parser.add_argument('--connect-concurrency', type=int, default=256,
+                        help='connections opened at the same time by a process')
+    parser.add_argument('--port', type=int, default=5400, help='port of the benchmarked server')
+    parser.add_argument('--output', default=None, help='file to write the report to, standard output by default')
+    parser.add_argument('--verbose', action='store_true', help='show the logs of the server')
+    parser.add_argument('server_args', nargs='*', help='extra arguments of the server, after --')
+
+    args = parser.parse_args(arguments)
+    if args.players < 2 * args.rooms:
+        parser.error('every room needs at least 2 players')
+    if args.players % args.rooms:
+        parser.error('players must be a multiple of rooms')
+    latency_sampler(args.latency, random.Random())
+    return args
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """
+    Run the benchmark and write its report
+    :param arguments: command line arguments, sys.argv by default
+    :return: None
+    """
+    args = parse_arguments(arguments)
+    report = dumps(run_benchmark(args), indent=2)
+
+    if args.output is None:
+        print(report)
+    else:
+        with open(args.output, 'w') as file:
+            file.write(report + '\n')
@@ -0,0 +1,171 @@
+"""
+Bot players built on the asyncio session, thousands of them can play in one process for soak tests
+
+    python client/bots.py --count 1000 --games 3
+"""
+import asyncio
+import os
+import random
+import sys
+from argparse import ArgumentParser
+from typing import Dict, List, Any, Optional
+
+# the client modules import the shared protocol from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import ClientSession, SessionError, SessionEvent, connect
+
+
+class Bot:
+    def __init__(self, name: str, room: Optional[str] = None, think_time: float = 0.5, seed: Optional[int] = None,
+                 reconnect: bool = True):
+        """
+        Initialize a bot which answers a random number after a random think time,
+        override on_question and the other hooks to play differently
+        :param name: name of the bot
+        :param room: room to join, None for the default room
+        :param think_time: mean seconds before an answer, drawn from an exponential distribution
+        :param seed: seed of the answers and think times, None for a random seed
+        :param reconnect: resume the session with its token when the connection is lost during a game
+        """
+        self.name = name
+        self.room = room
+        self.think_time = think_time
+        self.rng = random.Random(seed)
+        self.reconnect = reconnect
+
+        self.games = 0
+        self.rounds = 0
+        self.total = 0.0
+        self.reconnects = 0
+        self.error: Optional[str] = None
+
+    async def on_question(self, question: str) -> Optional[int]:
+        """
+        Choose the answer of a question
+        :param question: question
+        :return: answer, None to not answer
+        """
+        if self.think_time > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think_time))
+        return self.rng.randint(0, 2100)
+
+    async def on_results(self, results: Dict[str, Any]) -> None:
+        """
+        Called with the results of every round
+        :param results: result dictionary
+        :return: None
+        """
+        self.rounds += 1
+        self.total = results['total']
+
+    async def join(self, host: str, port: int) -> Optional[ClientSession]:
+        """
+        Connect to the server and join its game
+        :param host: host of the server
+        :param port: port of the server
+        :return: session, None if the bot could not join
+        """
+        try:
+            return await connect(host, port, self.name, self.room)
+        except SessionError as error:
+            self.error = str(error)
+            return None
+
+    async def play(self, session: ClientSession, games: int = 1) -> None:
+        """
+        Play until the games are over or the connection is lost
+        :param session: session of the bot
+        :param games: number of games to play
+        :return: None
+        """
+        answering: Optional[asyncio.Task] = None
+        try:
+            while True:
+                event = await session.next_event()
+                if event.type == 'closed':
+                    resumed = await session.reconnect() if self.reconnect and session.can_resume else None
+                    if resumed is None:
+                        self.error = event.data
+                        break
+                    session = resumed
+                    self.reconnects += 1
+                elif event.type == 'session':
+                    self.total = event.data['total']
+                elif event.type == 'question':
+                    # answer without holding up the events, a late answer is ignored by the server
+                    if answering is not None:
+                        answering.cancel()
+                    answering = asyncio.ensure_future(self._answer(session, event))
+                elif event.type == 'results':
+                    await self.on_results(event.data)
+                elif event.type in ('restart', 'terminate'):
+                    self.games += 1
+                    if event.type == 'terminate' or self.games >= games:
+                        break
+        finally:
+            if answering is not None:
+                answering.cancel()
+            await session.close()
+
+    async def _answer(self, session: ClientSession, event: SessionEvent) -> None:
+        answer = await self.on_question(event.data['question'])
+        if answer is not None and session.is_connected:
+            await session.answer(answer)
+
+
+async def run_bots(bots: List[Bot], host: str, port: int, games: int = 1, concurrency: int = 256) -> None:
+    """
+    Play the games of many bots on the running event loop
+    :param bots: bots to run
+    :param host: host of the server
+    :param port: port of the server
+    :param games: number of games each bot plays
+    :param concurrency: bots connecting at the same time
+    :return: None
+    """
+    gate = asyncio.Semaphore(concurrency)
+
+    async def run(bot: Bot) -> None:
+        # only the handshake holds the gate, a bot keeps playing after releasing it
+        async with gate:
+            session = await bot.join(host, port)
+        if session is not None:
+            await bot.play(session, games)
+
+    await asyncio.gather(*(run(bot) for bot in bots))
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """
+    Run bots until their games are over and print a summary
+    :param arguments: command line arguments, sys.argv by default
+    :return: None
+    """
+    parser = ArgumentParser(description='Play the quiz game with bot players')
+    parser.add_argument('--host', default='localhost', help='host of the server')
+    parser.add_argument('--port', type=int, default=5000, help='port of the server')
+    parser.add_argument('--count', type=int, default=10, help='number of bots')
+    parser.add_argument('--room', default=None, help='room to join, the default room by default')
+    parser.add_argument('--games', type=int, default=1, help='number of games each bot plays')
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds before an answer')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the answers and think times')
+    parser.add_argument('--concurrency', type=int, default=256, help='bots connecting at the same time')
+    parser.add_argument('--no-reconnect', dest='reconnect', action='store_false',
+                        help='give up when the connection is lost instead of resuming the session')
+    args = parser.parse_args(arguments)
+
+    seed = random.Random(args.seed)
+    bots = [Bot(f'bot{index}', args.room, args.think_time, seed.getrandbits(32), args.reconnect)
+            for index in range(args.count)]
+    asyncio.run(run_bots(bots, args.host, args.port, args.games, args.concurrency))
+
+    errors = [bot for bot in bots if bot.error]
+    print(f'{len(bots) - len(errors)} bot(s) played {sum(bot.rounds for bot in bots)} round(s), '
+          f'{sum(bot.reconnects for bot in bots)} reconnect(s), {len(errors)} error(s)')
+    for bot in errors[:10]:
+        print(f'{bot.name}: {bot.error}')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,291 +1,364 @@
-import json
-from threading import Thread
-from tkinter import Tk, Label, Entry, Button, messagebox, Text
-from typing import Union, Dict, Any
-
-from controller import ClientController
-
-
-class ClientInterface:
-    def __init__(self):
-        self.controller: Union[ClientController, None] = None
-
-        self.root = Tk()
-        self.root.title("Quiz Game Client")
-        self.root.geometry("600x400")
-
-        self.root.resizable(False, False)
-        self.log_count = 1
-        self.is_end = False
-        self.start_client_layout()
-
-        self.root.mainloop()
-        self.connection_thread.join()
-        print("Client closed")
-        self.game_thread.join()
-        self.controller.close()
-
-    def start_client_layout(self) -> None:
-        """
-        Set start client layout
-        :return:
-        """
-        # write welcome message
-        welcome_message = Label(self.root, text="Welcome to the Quiz Game Client", font=("Arial", 20))
-        welcome_message.place(relx=0.5, rely=0.25, anchor="center")
-
-        # get host and port number from user under the welcome message
-        host_label = Label(self.root, text="Host Address:", font=("Arial", 12))
-        host_label.place(relx=0.25, rely=0.4, anchor="center")
-
-        self.host_entry = Entry(self.root, width=38)
-        self.host_entry.insert(0, "localhost")
-        self.host_entry.place(relx=0.65, rely=0.4, anchor="center")
-
-        port_number_label = Label(self.root, text="Port Number: ", font=("Arial", 12))
-        port_number_label.place(relx=0.25, rely=0.5, anchor="center")
-
-        self.port_number_entry = Entry(self.root, width=38)
-        self.port_number_entry.insert(0, "5000")
-        self.port_number_entry.place(relx=0.65, rely=0.5, anchor="center")
-
-        self.name_label = Label(self.root, text="Name:", font=("Arial", 12))
-        self.name_label.place(relx=0.25, rely=0.6, anchor="e")
-
-        self.name_entry = Entry(self.root, width=38)
-        self.name_entry.place(relx=0.65, rely=0.6, anchor="center")
-
-        # start client button
-        self.start_client_button = Button(self.root, text="Start Client", font=("Arial", 12),
-                                          command=self.start_client)
-        self.start_client_button.place(relx=0.5, rely=0.8, anchor="center")
-
-    def start_client(self):
-        """
-        Start client after button clicked
-        :return:
-        """
-        # add loading image under the start button
-        loading_image = Label(self.root, text="Loading...", font=("Arial", 12))
-        loading_image.place(relx=0.5, rely=0.9, anchor="center")
-
-        # lock the start client button
-        self.start_client_button.config(state="disabled")
-
-        try:
-            # get host and port number from user
-            self.host = self.host_entry.get()
-            self.port = int(self.port_number_entry.get())
-            self.name = self.name_entry.get()
-
-            # create controller and start client
-            self.controller = ClientController(self.host, self.port, self.name)
-            message = self.controller.connect()
-
-            # raise error if connection failed
-            if message != "Connected":
-                messagebox.showerror("Error", message)
-                loading_image.destroy()
-                self.start_client_button.config(state="normal")
-                self.host_entry.delete(0, "end")
-                self.port_number_entry.delete(0, "end")
-                self.name_entry.delete(0, "end")
-                return
-
-        except ValueError:
-            # if port number is not integer
-            messagebox.showerror("Error", "Port number must be integer")
-            loading_image.destroy()
-            self.start_client_button.config(state="normal")
-            self.host_entry.delete(0, "end")
-            self.port_number_entry.delete(0, "end")
-            self.name_entry.delete(0, "end")
-            return
-
-        except Exception as e:
-            # if any other error occurred
-            messagebox.showerror("Error", e.args[0])
-            loading_image.destroy()
-            self.start_client_button.config(state="normal")
-            self.host_entry.delete(0, "end")
-            self.port_number_entry.delete(0, "end")
-            self.name_entry.delete(0, "end")
-            return
-
-        # remove all widgets from the window
-        for widget in self.root.winfo_children():
-            widget.destroy()
-
-        # set client layout
-        self.client_layout()
-
-    def client_layout(self):
-        # set geometry
-        self.root.geometry("750x500")
-
-        # write welcome message
-        welcome_message = Label(self.root, text="Quiz Game Player", font=("Arial", 20))
-        welcome_message.place(relx=0.5, rely=0.15, anchor="center")
-
-        # set rich text box for see logs
-        scores_label = Label(self.root, text="Scores:")
-        scores_label.place(relx=0.375, rely=0.1975, relwidth=0.4)
-
-        self.scores = Text(self.root, width=80, height=20)
-        self.scores.place(relx=0.55, rely=0.25, relwidth=0.4, relheight=0.5)
-
-        self.scores.insert('end', f'Scores will be shown after the first question is answered')
-        self.scores.config(state='disabled')
-
-        # show waiting other players message
-        self.waiting_message = Label(self.root, text="Waiting for other players", font=("Arial", 12))
-        self.waiting_message.place(relx=0.275, rely=0.5, anchor="center")
-
-        # start game
-        self.game_thread = Thread(target=self.game)
-        self.game_thread.start()
-
-    def game(self):
-        """
-        Start game
-        :return:
-        """
-
-        # check server status
-        self.connection_thread = Thread(target=self.check_connection)
-        self.connection_thread.start()
-
-        # start game
-        while not self.controller.is_terminated:
-
-            self.waiting_message.config(text="Waiting for other players enter the game")
-            is_start = self.controller.receive_message()
-
-            if is_start == "start":
-                # remove waiting message and set question layout
-                self.scores.config(state='normal')
-                self.scores.delete('1.0', 'end')
-                self.scores.insert('end', f'Scores will be shown after the first question is answered')
-                self.scores.config(state='disabled')
-
-                self.waiting_message.config(text="")
-                self.question_label = Label(self.root)
-                self.question_label.place(relx=0.25, rely=0.1975, anchor="center")
-
-                self.answer_entry = Entry(self.root, width=38)
-                self.answer_entry.place(relx=0.25, rely=0.25, anchor="center")
-
-                self.answer_button = Button(self.root, text="Answer", command=self.send_answer)
-                self.answer_button.place(relx=0.275, rely=0.4, anchor="center")
-
-                self.is_end = False
-                question_count = 1
-
-                while not self.is_end:
-                    # get question from server
-                    question = self.controller.receive_message()
-
-                    # set waiting message
-                    self.waiting_message.config(text="")
-
-                    # set question
-                    self.question_label.config(text=f'Question {question_count}: {question}')
-
-                    # get message from server
-                    message = self.controller.receive_message()
-                    if message == "only_one_player":
-                        # if there is only one player in the game
-                        messagebox.showinfo("Error", "There is only one player in the game. You win")
-                        self.question_label.destroy()
-                        self.answer_button.destroy()
-                        self.answer_entry.destroy()
-
-                        # wait restart message
-                        self.wait_restart_message()
-
-                    else:
-                        result = json.loads(message)
-
-                        # set scores
-                        self.show_results(result)
-
-                        # check if game is end
-                        if result['is_end']:
-                            self.is_end = True
-
-                            messagebox.showinfo("Game is end", "Game is end")
-                            self.question_label.destroy()
-                            self.answer_button.destroy()
-                            self.answer_entry.destroy()
-
-                            # wait restart message
-                            self.wait_restart_message()
-
-                    # increase question count
-                    question_count += 1
-
-                    # clear answer entry
-                    if not self.is_end:
-                        self.answer_entry.delete(0, "end")
-
-    def send_answer(self):
-        """
-        Send answer to server
-        :return:
-        """
-        answer = self.answer_entry.get()
-        self.controller.send_message(answer)
-
-        # set waiting message
-        self.waiting_message.config(text="Waiting for other players answer")
-
-    def show_results(self, response: Dict[str, Any]):
-        """
-        Show scores in rich text box and messagebox
-        :param response: response from server
-
-        :return:
-        """
-        self.scores.config(state='normal')
-        self.scores.delete('1.0', 'end')
-        for name, score in response['scores'].items():
-            self.scores.insert('end', f'{name}: {score} points \n')
-        self.scores.config(state='disabled')
-
-        messagebox.showinfo("Result", f"{response['message']} \n Correct answer: {response['answer']}")
-
-    def check_connection(self):
-        """
-        Check connection with server
-        :return:
-        """
-        while not self.is_end:
-            if not self.controller.is_connected:
-                messagebox.showerror("Error", "Connection is lost")
-                self.is_end = True
-                self.waiting_message.config(text="Connection lost")
-                self.question_label.destroy()
-                self.answer_button.destroy()
-                self.answer_entry.destroy()
-                return
-
-    def wait_restart_message(self):
-        """
-        Wait restart message from server
-        :return:
-        """
-        self.waiting_message.config(text="Waits server message")
-        message = self.controller.receive_message()
-
-        if message != "restart":
-            self.controller.is_terminated = True
-            self.waiting_message.config(text="Game is end")
-
-            # add close button
-            self.close_button = Button(self.root, text="Close", command=self.root.destroy)
-            self.close_button.place(relx=0.5, rely=0.9, anchor="center")
-            # break
-
-
-if __name__ == "__main__":
-    ClientInterface()
+import asyncio
+import os
+import sys
+import time
+from queue import Queue, Empty
+from threading import Thread
+from tkinter import Tk, Label, Entry, Button, messagebox, Text
+from typing import Union, Dict, Any
+
+# the client modules import the shared protocol from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import ClientSession, SessionError, SessionEvent, connect
+
+EVENT_POLL_INTERVAL = 50  # milliseconds between two drains of the event queue
+EVENT_BATCH_SIZE = 64  # events handled in one drain, the rest wait for the next tick
+
+
+class ClientInterface:
+    def __init__(self):
+        self.session: Union[ClientSession, None] = None
+
+        # the session runs on an asyncio loop in the network thread, its events are queued
+        # and handled by the Tk main loop so that the network never waits for the window
+        self.events: Queue = Queue()
+        self.loop = asyncio.new_event_loop()
+        self.network_thread = Thread(target=self.loop.run_forever, name='network', daemon=True)
+        self.network_thread.start()
+
+        self.root = Tk()
+        self.root.title("Quiz Game Client")
+        self.root.geometry("600x400")
+
+        self.root.resizable(False, False)
+        self.log_count = 1
+        self.is_end = False
+        self.question_count = 1
+        self.start_client_layout()
+
+        self.root.after(EVENT_POLL_INTERVAL, self.drain_events)
+        self.root.mainloop()
+        print("Client closed")
+        if self.session is not None:
+            asyncio.run_coroutine_threadsafe(self.session.close(), self.loop).result(1)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.network_thread.join()
+
+    def start_client_layout(self) -> None:
+        """
+        Set start client layout
+        :return:
+        """
+        # write welcome message
+        welcome_message = Label(self.root, text="Welcome to the Quiz Game Client", font=("Arial", 20))
+        welcome_message.place(relx=0.5, rely=0.25, anchor="center")
+
+        # get host and port number from user under the welcome message
+        host_label = Label(self.root, text="Host Address:", font=("Arial", 12))
+        host_label.place(relx=0.25, rely=0.4, anchor="center")
+
+        self.host_entry = Entry(self.root, width=38)
+        self.host_entry.insert(0, "localhost")
+        self.host_entry.place(relx=0.65, rely=0.4, anchor="center")
+
+        port_number_label = Label(self.root, text="Port Number: ", font=("Arial", 12))
+        port_number_label.place(relx=0.25, rely=0.5, anchor="center")
+
+        self.port_number_entry = Entry(self.root, width=38)
+        self.port_number_entry.insert(0, "5000")
+        self.port_number_entry.place(relx=0.65, rely=0.5, anchor="center")
+
+        self.name_label = Label(self.root, text="Name:", font=("Arial", 12))
+        self.name_label.place(relx=0.25, rely=0.6, anchor="e")
+
+        self.name_entry = Entry(self.root, width=38)
+        self.name_entry.place(relx=0.65, rely=0.6, anchor="center")
+
+        # start client button
+        self.start_client_button = Button(self.root, text="Start Client", font=("Arial", 12),
+                                          command=self.start_client)
+        self.start_client_button.place(relx=0.5, rely=0.8, anchor="center")
+
+    def start_client(self):
+        """
+        Start client after button clicked
+        :return:
+        """
+        # add loading image under the start button
+        self.loading_image = Label(self.root, text="Loading...", font=("Arial", 12))
+        self.loading_image.place(relx=0.5, rely=0.9, anchor="center")
+
+        # lock the start client button
+        self.start_client_button.config(state="disabled")
+
+        try:
+            # get host and port number from user
+            self.host = self.host_entry.get()
+            self.port = int(self.port_number_entry.get())
+            self.name = self.name_entry.get()
+
+        except ValueError:
+            # if port number is not integer
+            self.connection_failed("Port number must be integer")
+            return
+
+        # connect without blocking the window, the result comes back as an event
+        asyncio.run_coroutine_threadsafe(self.run_session(), self.loop)
+
+    async def run_session(self) -> None:
+        """
+        Connect and forward every event of the session to the Tk main loop, runs in the network thread
+        :return:
+        """
+        try:
+            session = await connect(self.host, self.port, self.name)
+        except SessionError as error:
+            self.post(SessionEvent('connection_failed', error.args[0], time.time()))
+            return
+
+        self.session = session
+        self.post(SessionEvent('connected', None, time.time()))
+
+        while True:
+            async for event in session:
+                # a connection lost during the game is resumed with the same place and score
+                if event.type == 'closed' and session.can_resume:
+                    self.post(SessionEvent('reconnecting', event.data, event.received_at))
+                    resumed = await session.reconnect()
+                    if resumed is not None:
+                        self.session = session = resumed
+                        break
+                self.post(event)
+            else:
+                return
+
+    def post(self, event: SessionEvent) -> None:
+        """
+        Hand an event over to the Tk main loop, callable from the network thread
+        :param event: event of the session
+        :return:
+        """
+        self.events.put(event)
+
+    def drain_events(self) -> None:
+        """
+        Handle a batch of queued events, runs in the Tk main loop on every tick
+        :return:
+        """
+        for _ in range(EVENT_BATCH_SIZE):
+            try:
+                event = self.events.get_nowait()
+            except Empty:
+                break
+            self.handle_event(event)
+
+        self.root.after(EVENT_POLL_INTERVAL, self.drain_events)
+
+    def connection_failed(self, message: str) -> None:
+        """
+        Show the reason of the failed connection and let the user try again
+        :param message: reason
+        :return:
+        """
+        messagebox.showerror("Error", message)
+        self.loading_image.destroy()
+        self.start_client_button.config(state="normal")
+        self.host_entry.delete(0, "end")
+        self.port_number_entry.delete(0, "end")
+        self.name_entry.delete(0, "end")
+
+    def client_layout(self):
+        # set geometry
+        self.root.geometry("750x500")
+
+        # write welcome message
+        welcome_message = Label(self.root, text="Quiz Game Player", font=("Arial", 20))
+        welcome_message.place(relx=0.5, rely=0.15, anchor="center")
+
+        # set rich text box for see logs
+        scores_label = Label(self.root, text="Scores:")
+        scores_label.place(relx=0.375, rely=0.1975, relwidth=0.4)
+
+        self.scores = Text(self.root, width=80, height=20)
+        self.scores.place(relx=0.55, rely=0.25, relwidth=0.4, relheight=0.5)
+
+        self.scores.insert('end', f'Scores will be shown after the first question is answered')
+        self.scores.config(state='disabled')
+
+        # non-modal panel under the scores for the result of the last round and the game messages
+        self.result_panel = Label(self.root, text="", font=("Arial", 12), justify="left", anchor="w")
+        self.result_panel.place(relx=0.55, rely=0.78, relwidth=0.4)
+
+        # show waiting other players message
+        self.waiting_message = Label(self.root, text="Waiting for other players", font=("Arial", 12))
+        self.waiting_message.place(relx=0.275, rely=0.5, anchor="center")
+
+    def handle_event(self, event: SessionEvent) -> None:
+        """
+        Update the widgets with an event of the session, runs in the Tk main loop
+        :param event: event of the session
+        :return:
+        """
+        if event.type == 'connection_failed':
+            self.connection_failed(event.data)
+
+        elif event.type == 'connected':
+            # remove all widgets from the window and set client layout
+            for widget in self.root.winfo_children():
+                widget.destroy()
+            self.client_layout()
+            self.waiting_message.config(text="Waiting for other players enter the game")
+
+        elif event.type == 'session':
+            self.restore_session(event.data)
+
+        elif event.type == 'start':
+            self.start_game()
+
+        elif event.type == 'question':
+            # set question
+            self.waiting_message.config(text="")
+            self.question_label.config(text=f'Question {self.question_count}: {event.data["question"]}')
+
+        elif event.type == 'results':
+            self.show_results(event.data)
+            self.question_count += 1
+
+            # check if game is end
+            if event.data['is_end']:
+                self.is_end = True
+                self.show_status("Game is end")
+                self.end_game()
+            else:
+                self.answer_entry.delete(0, "end")
+
+        elif event.type == 'only_one_player':
+            # if there is only one player in the game
+            self.is_end = True
+            self.show_status("There is only one player in the game. You win")
+            self.end_game()
+
+        elif event.type == 'restart':
+            self.is_end = False
+            self.waiting_message.config(text="Waiting for other players enter the game")
+
+        elif event.type == 'terminate':
+            self.is_end = True
+            self.waiting_message.config(text="Game is end")
+
+            # add close button
+            self.close_button = Button(self.root, text="Close", command=self.root.destroy)
+            self.close_button.place(relx=0.5, rely=0.9, anchor="center")
+
+        elif event.type == 'reconnecting':
+            self.show_status(f"{event.data}, reconnecting...")
+
+        elif event.type == 'closed':
+            self.connection_lost()
+
+    def restore_session(self, snapshot: Dict[str, Any]):
+        """
+        Show the game joined late or resumed after a lost connection
+        :param snapshot: snapshot of the game sent by the server
+        :return:
+        """
+        # the question widgets are destroyed at the end of a game
+        is_shown = hasattr(self, 'question_label') and self.question_label.winfo_exists()
+        if snapshot['is_started'] and not is_shown:
+            self.start_game()
+            self.question_count = snapshot['round'] + 1
+            self.waiting_message.config(text="Waiting for the next question")
+
+        if snapshot['is_resumed']:
+            self.show_status(f"Reconnected with {snapshot['total']} points")
+
+    def start_game(self):
+        """
+        Set question layout when a game starts
+        :return:
+        """
+        self.scores.config(state='normal')
+        self.scores.delete('1.0', 'end')
+        self.scores.insert('end', f'Scores will be shown after the first question is answered')
+        self.scores.config(state='disabled')
+
+        self.waiting_message.config(text="")
+        self.show_status("")
+        self.question_label = Label(self.root)
+        self.question_label.place(relx=0.25, rely=0.1975, anchor="center")
+
+        self.answer_entry = Entry(self.root, width=38)
+        self.answer_entry.place(relx=0.25, rely=0.25, anchor="center")
+
+        self.answer_button = Button(self.root, text="Answer", command=self.send_answer)
+        self.answer_button.place(relx=0.275, rely=0.4, anchor="center")
+
+        self.is_end = False
+        self.question_count = 1
+
+    def end_game(self):
+        """
+        Remove question layout and wait for the restart message of the server
+        :return:
+        """
+        self.question_label.destroy()
+        self.answer_button.destroy()
+        self.answer_entry.destroy()
+        self.waiting_message.config(text="Waits server message")
+
+    def send_answer(self):
+        """
+        Send answer to server
+        :return:
+        """
+        answer = self.answer_entry.get()
+        asyncio.run_coroutine_threadsafe(self.session.answer(answer), self.loop)
+
+        # set waiting message
+        self.waiting_message.config(text="Waiting for other players answer")
+
+    def show_results(self, response: Dict[str, Any]):
+        """
+        Show scores in rich text box and the result of the player in the result panel
+        :param response: response from server
+
+        :return:
+        """
+        self.scores.config(state='normal')
+        self.scores.delete('1.0', 'end')
+        for rank, (name, score) in enumerate(response['scores'].items(), start=1):
+            self.scores.insert('end', f'{rank}. {name}: {score} points \n')
+        # own rank of the player, the scoreboard only holds the best players
+        self.scores.insert('end', f'\nYou are #{response["rank"]} of {response["players"]} with {response["total"]} points')
+        self.scores.config(state='disabled')
+
+        self.show_status(f"{response['message']}\nCorrect answer: {response['answer']}")
+
+    def show_status(self, message: str):
+        """
+        Show a message in the result panel, unlike a dialog it does not wait for a click
+        :param message: message
+        :return:
+        """
+        self.result_panel.config(text=message)
+
+    def connection_lost(self):
+        """
+        Called when the connection with server is lost
+        :return:
+        """
+        if self.is_end:
+            return
+
+        self.show_status("Connection is lost")
+        self.is_end = True
+        self.waiting_message.config(text="Connection lost")
+        if hasattr(self, 'question_label'):
+            self.question_label.destroy()
+            self.answer_button.destroy()
+            self.answer_entry.destroy()
+
+
+if __name__ == "__main__":
+    ClientInterface()
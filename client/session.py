@@ -0,0 +1,303 @@
+"""
+Asyncio client of the quiz game
+
+    session = await connect('localhost', 5000, 'alice')
+    async for event in session:
+        if event.type == 'question':
+            await session.answer(42)
+
+Frames are decoded incrementally as bytes arrive and heartbeats are answered by the session,
+so a consumer only sees game events and never blocks a thread. A session lost during a game
+is resumed with the same place and score:
+
+    if session.can_resume:
+        session = await session.reconnect()
+"""
+import asyncio
+import time
+from typing import Tuple, Dict, Union, Any, Optional, NamedTuple
+
+from common.heartbeat import HEARTBEAT_TIMEOUT, PONG_FRAME
+from common.protocol import (FrameDecoder, Frame, MessageType, ProtocolError, encode_text, encode_join,
+                             decode_message, decode_question, decode_results)
+
+# text messages of the server which are game events, other texts are delivered as message events
+CONTROL_MESSAGES = ('start', 'restart', 'terminate', 'only_one_player')
+RECONNECT_ATTEMPTS = 5  # default attempts to resume a lost session
+RECONNECT_DELAY = 0.5  # seconds before the first attempt, doubled after every failed attempt
+
+
+class SessionEvent(NamedTuple):
+    # session, start, question, results, restart, terminate, only_one_player, message or closed
+    type: str
+    # session: snapshot of the game, question: question and sent_at, results: result dictionary,
+    # message: text or JSON document, closed: reason, None for the control messages
+    data: Any
+    received_at: float  # seconds since the epoch
+
+
+class SessionError(Exception):
+    pass
+
+
+class ClientSession:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 decoder: Optional[FrameDecoder] = None, heartbeat_timeout: Optional[float] = HEARTBEAT_TIMEOUT):
+        """
+        Initialize the session of a joined player, use connect to join a server
+        :param reader: stream of the connection
+        :param writer: stream of the connection
+        :param decoder: decoder holding the bytes received after the join response
+        :param heartbeat_timeout: seconds without any frame from the server before the connection is lost
+        """
+        self.reader = reader
+        self.writer = writer
+        self.decoder = decoder if decoder is not None else FrameDecoder()
+        self.heartbeat_timeout = heartbeat_timeout
+
+        # send time of the last question given by the server and the time it is received, in seconds since the epoch
+        self.question_sent_at: Optional[float] = None
+        self.question_received_at: Optional[float] = None
+
+        self.close_reason: Optional[str] = None  # set once the connection is lost or closed
+        self.is_closed_locally = False
+        self.is_terminated = False  # set once the server ends the session with terminate
+
+        # token given by the server with the snapshot of the game, and what connect needs to reconnect
+        self.token: Optional[str] = None
+        self.snapshot: Dict[str, Any] = {}
+        self.endpoint: Optional[Tuple[str, int, str, Optional[str]]] = None  # host, port, name and room
+
+    def __aiter__(self) -> 'ClientSession':
+        return self
+
+    async def __anext__(self) -> SessionEvent:
+        if self.close_reason is not None:
+            raise StopAsyncIteration
+        return await self.next_event()
+
+    @property
+    def is_connected(self) -> bool:
+        return self.close_reason is None
+
+    @property
+    def can_resume(self) -> bool:
+        """
+        Check if the session is lost during a game and can be resumed with reconnect
+        :return: True if the server gave a token and the session is not closed or terminated on purpose
+        """
+        return (self.close_reason is not None and self.token is not None and self.endpoint is not None
+                and not self.is_closed_locally and not self.is_terminated)
+
+    @property
+    def response_time(self) -> Optional[float]:
+        """
+        Get the seconds since the last question is received, measured from the receipt of the client
+        :return: seconds, None before the first question
+        """
+        if self.question_received_at is None:
+            return None
+        return time.time() - self.question_received_at
+
+    async def next_event(self) -> SessionEvent:
+        """
+        Wait for the next game event, heartbeats are answered on the way
+        :return: event, a closed event once the connection is lost
+        """
+        while self.close_reason is None:
+            try:
+                frame = self.decoder.next_frame()
+                if frame is None:
+                    await self._receive()
+                    continue
+            except ProtocolError as error:
+                self._lose(f'Protocol error: {error}')
+                break
+
+            event = self._to_event(frame)
+            if event is not None:
+                return event
+
+        return SessionEvent('closed', self.close_reason, time.time())
+
+    async def answer(self, answer: Union[int, str]) -> None:
+        """
+        Send the answer of the current question
+        :param answer: answer
+        :return: None
+        """
+        await self.send(str(answer))
+
+    async def send(self, message: str) -> None:
+        """
+        Send a text message to the server
+        :param message: message
+        :return: None
+        """
+        if self.close_reason is not None:
+            raise SessionError(f'Session is closed: {self.close_reason}')
+        self.writer.write(encode_text(message))
+        await self.writer.drain()
+
+    async def close(self) -> None:
+        """
+        Close the connection, the iteration of the events ends
+        :return: None
+        """
+        if self.close_reason is None:
+            self.close_reason = 'Connection closed'
+            self.is_closed_locally = True
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except OSError:
+            pass
+
+    async def reconnect(self, attempts: int = RECONNECT_ATTEMPTS,
+                        delay: float = RECONNECT_DELAY) -> Optional['ClientSession']:
+        """
+        Join the server again with the token of the session, the server gives back the place and the score
+        of the player and the question of the round if it is still open
+        :param attempts: connection attempts before giving up
+        :param delay: seconds before the first attempt, doubled after every failed attempt
+        :return: new session, None if the player could not be resumed
+        """
+        if self.token is None or self.endpoint is None:
+            return None
+
+        host, port, name, room = self.endpoint
+        for _ in range(attempts):
+            await asyncio.sleep(delay)
+            try:
+                session = await connect(host, port, name, room, self.heartbeat_timeout, token=self.token)
+            except SessionError as error:
+                # a server which forgot the player rejects the token like a taken name
+                if error.args[0] not in ('Connection refused', 'Connection timeout', 'Connection closed'):
+                    return None
+                delay *= 2
+                continue
+            return session
+        return None
+
+    async def _receive(self) -> None:
+        """
+        Read the next bytes of the connection into the decoder
+        :return: None
+        """
+        try:
+            data = await asyncio.wait_for(self.reader.read(65536), self.heartbeat_timeout)
+        except asyncio.TimeoutError:
+            self._lose('Heartbeat timeout')
+            return
+        except OSError:
+            data = b''
+
+        if not data:
+            self._lose('Connection closed')
+            return
+        self.decoder.feed(data)
+
+    def _lose(self, reason: str) -> None:
+        if self.close_reason is None:
+            self.close_reason = reason
+        self.writer.close()
+
+    def _to_event(self, frame: Frame) -> Optional[SessionEvent]:
+        """
+        Turn a frame into a game event
+        :param frame: message type and payload
+        :return: event, None for heartbeats and empty messages
+        """
+        message_type, payload = frame
+        received_at = time.time()
+
+        if message_type == MessageType.PING:
+            self.writer.write(PONG_FRAME)
+            return None
+
+        if message_type == MessageType.QUESTION:
+            question, sent_at = decode_question(payload)
+            self.question_sent_at, self.question_received_at = sent_at, received_at
+            return SessionEvent('question', {'question': question, 'sent_at': sent_at}, received_at)
+
+        if message_type == MessageType.RESULTS:
+            return SessionEvent('results', decode_results(payload), received_at)
+
+        if message_type == MessageType.SESSION:
+            self.snapshot = decode_message(frame)
+            self.token = self.snapshot.get('token')
+            return SessionEvent('session', self.snapshot, received_at)
+
+        if message_type == MessageType.TEXT and payload:
+            text = payload.decode()
+            if text == 'terminate':
+                self.is_terminated = True
+            if text in CONTROL_MESSAGES:
+                return SessionEvent(text, None, received_at)
+            return SessionEvent('message', text, received_at)
+
+        if message_type == MessageType.JSON:
+            return SessionEvent('message', decode_message(frame), received_at)
+
+        return None  # pongs, empty messages and unknown types
+
+
+async def connect(host: str, port: int, name: str, room: Optional[str] = None,
+                  heartbeat_timeout: Optional[float] = HEARTBEAT_TIMEOUT,
+                  connect_timeout: Optional[float] = HEARTBEAT_TIMEOUT, token: Optional[str] = None) -> ClientSession:
+    """
+    Connect to a server and join its game, a player may join a game which is already started
+    :param host: host of the server
+    :param port: port of the server
+    :param name: name of the player
+    :param room: room to join on a server hosting many games, None for the default room
+    :param heartbeat_timeout: seconds without any frame from the server before the connection is lost
+    :param connect_timeout: seconds allowed to connect and get the response of the server
+    :param token: session token of a lost session to resume the player, see ClientSession.reconnect
+    :return: session of the player, its first event is the session snapshot
+    :raise SessionError: with the reason given by the server or the connection error
+    """
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), connect_timeout)
+    except ConnectionRefusedError:
+        raise SessionError('Connection refused')
+    except asyncio.TimeoutError:
+        raise SessionError('Connection timeout')
+    except OSError as error:
+        raise SessionError(str(error) or 'Unknown error')
+
+    writer.write(encode_text(name) if room is None and token is None else encode_join(name, room, token))
+    decoder = FrameDecoder()
+
+    try:
+        response = await asyncio.wait_for(_read_response(reader, writer, decoder), connect_timeout)
+    except asyncio.TimeoutError:
+        response = 'Connection timeout'
+    except (OSError, ProtocolError):
+        response = 'Connection closed'
+
+    if response != 'Connected':
+        writer.close()
+        raise SessionError(response)
+
+    session = ClientSession(reader, writer, decoder, heartbeat_timeout)
+    session.endpoint = (host, port, name, room)
+    return session
+
+
+async def _read_response(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, decoder: FrameDecoder) -> str:
+    """
+    Read the text response of the server to the join message, answering its heartbeats
+    :return: Connected, the reason of the rejection or Connection closed
+    """
+    while True:
+        frame = decoder.next_frame()
+        if frame is None:
+            data = await reader.read(65536)
+            if not data:
+                return 'Connection closed'
+            decoder.feed(data)
+        elif frame[0] == MessageType.PING:
+            writer.write(PONG_FRAME)
+        elif frame[0] == MessageType.TEXT and frame[1]:
+            return frame[1].decode()
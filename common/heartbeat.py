@@ -0,0 +1,32 @@
+"""
+Heartbeat settings and TCP keepalive options shared by the server and the client
+"""
+import socket
+from typing import Optional
+
+from common.protocol import MessageType, encode_frame
+
+HEARTBEAT_INTERVAL = 5.0  # seconds between two PING frames
+HEARTBEAT_TIMEOUT = 15.0  # seconds of silence before a peer is considered dead
+
+PING_FRAME = encode_frame(MessageType.PING)
+PONG_FRAME = encode_frame(MessageType.PONG)
+
+
+def set_keepalive(sock: socket.socket, idle: int = 10, interval: int = 5, count: int = 3) -> None:
+    """
+    Enable TCP keepalive so that the kernel detects dead peers without any traffic from the application
+    :param sock: connected socket
+    :param idle: seconds of idleness before the first probe
+    :param interval: seconds between probes
+    :param count: number of unanswered probes before the connection is dropped
+    :return: None
+    """
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+    # options below are not available on every platform
+    options = {'TCP_KEEPIDLE': idle, 'TCP_KEEPINTVL': interval, 'TCP_KEEPCNT': count}
+    for name, value in options.items():
+        option: Optional[int] = getattr(socket, name, None)
+        if option is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, option, value)
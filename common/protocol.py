@@ -0,0 +1,331 @@
+"""
+Length-prefixed wire protocol shared by the server and the client
+
+Every frame starts with a 5 byte header which holds the payload length (4 bytes, big endian)
+and the message type (1 byte), followed by the payload itself.
+"""
+import struct
+from enum import IntEnum
+from json import dumps, loads
+from socket import socket
+from typing import Tuple, Dict, List, Union, Any, Optional, Iterator
+
+HEADER = struct.Struct('!IB')
+MAX_PAYLOAD_SIZE = 16 * 1024 * 1024
+
+# results payload: verdict, answer, rank and total score of the player | scoreboard shared by every player
+# scoreboard: correct answer, is_end flag, number of ranked players | count of the best players | best players
+VERDICT = struct.Struct('!BqId')
+RESULTS_HEADER = struct.Struct('!qBI')
+SCORES_COUNT = struct.Struct('!I')
+SCORE_NAME = struct.Struct('!H')
+SCORE_TOTAL = struct.Struct('!d')
+
+# question payload: time the server sent the question to the player (seconds since the epoch) | utf-8 question
+QUESTION = struct.Struct('!d')
+
+Frame = Tuple[int, bytes]
+
+
+class MessageType(IntEnum):
+    TEXT = 1      # utf-8 string: names, commands, questions and answers
+    JSON = 2      # utf-8 encoded JSON document
+    RESULTS = 3   # struct-packed round results
+    PING = 4      # heartbeat request, answered with PONG
+    PONG = 5      # heartbeat response
+    JOIN = 6      # JSON document with the name of the player and the room to join
+    QUESTION = 7  # send time of the question followed by its utf-8 text
+    SESSION = 8   # JSON document with the session token of the player and a snapshot of the game
+
+
+class Verdict(IntEnum):
+    WON = 0
+    TIED = 1
+    LOST = 2
+    NO_ANSWER = 3
+
+
+# result messages are rendered by the client from the verdict and the answer of the player
+VERDICT_MESSAGES = {
+    Verdict.WON: 'You won this round with {}.',
+    Verdict.TIED: 'You tied with {}.',
+    Verdict.LOST: 'You lost this round with {}.',
+    Verdict.NO_ANSWER: 'You did not answer this round.',
+}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+def encode_frame(message_type: int, payload: bytes = b'') -> bytes:
+    """
+    Encode a frame
+    :param message_type: type of the message
+    :param payload: payload of the message
+    :return: encoded frame
+    """
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f'Payload of {len(payload)} bytes is too large')
+    return HEADER.pack(len(payload), message_type) + payload
+
+
+def encode_text(message: str) -> bytes:
+    """
+    Encode a text frame
+    :param message: message to encode
+    :return: encoded frame
+    """
+    return encode_frame(MessageType.TEXT, message.encode())
+
+
+def encode_json(document: Any) -> bytes:
+    """
+    Encode a JSON frame
+    :param document: JSON serializable object
+    :return: encoded frame
+    """
+    return encode_frame(MessageType.JSON, dumps(document).encode())
+
+
+def encode_join(name: str, room: Optional[str], token: Optional[str] = None) -> bytes:
+    """
+    Encode the first frame of a client which joins a room
+    :param name: name of the player
+    :param room: name of the room, None for the default room
+    :param token: session token given by the server, to resume the player after a lost connection
+    :return: encoded frame
+    """
+    message = {'name': name}
+    if room is not None:
+        message['room'] = room
+    if token is not None:
+        message['token'] = token
+    return encode_frame(MessageType.JOIN, dumps(message).encode())
+
+
+def decode_join(payload: bytes) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    Decode the payload of a join frame
+    :param payload: payload of the frame
+    :return: name of the player, room and session token, None for the missing ones
+    :raise ValueError: if the payload is not a join message
+    """
+    try:
+        message = loads(payload)
+        room, token = message.get('room'), message.get('token')
+        return str(message['name']), str(room) if room else None, str(token) if token else None
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError('Invalid join message')
+
+
+def encode_session(token: str, total: float, round_number: int, question_count: int, is_started: bool,
+                   is_resumed: bool) -> bytes:
+    """
+    Encode the session of a player, sent right after Connected so that a reconnecting client
+    restores its state without a replay of the game
+    :param token: session token to send back when the client reconnects
+    :param total: total score of the player
+    :param round_number: number of rounds finished in the current game
+    :param question_count: number of questions of a game
+    :param is_started: True if the game is played, the player joined late
+    :param is_resumed: True if the player got back its place and score
+    :return: encoded frame
+    """
+    return encode_frame(MessageType.SESSION, dumps({'token': token, 'total': total, 'round': round_number,
+                                                    'questions': question_count, 'is_started': is_started,
+                                                    'is_resumed': is_resumed}).encode())
+
+
+def encode_scoreboard(answer: int, top: List[Tuple[str, float]], player_count: int, is_end: bool) -> bytes:
+    """
+    Encode the part of the round results which is the same for every player, it is encoded once per round
+    :param answer: correct answer
+    :param top: name and total score of the best players, best first
+    :param player_count: number of ranked players
+    :param is_end: True if it is the last question
+    :return: encoded scoreboard
+    """
+    parts = [RESULTS_HEADER.pack(answer, is_end, player_count), SCORES_COUNT.pack(len(top))]
+
+    for name, total in top:
+        encoded_name = name.encode()
+        parts.append(SCORE_NAME.pack(len(encoded_name)))
+        parts.append(encoded_name)
+        parts.append(SCORE_TOTAL.pack(total))
+
+    return b''.join(parts)
+
+
+def encode_results_prefix(verdict: int, answer: Optional[int], rank: int, total: float, scoreboard: bytes) -> bytes:
+    """
+    Encode the part of the results frame of a player which comes before the shared scoreboard,
+    the frame is the prefix followed by the scoreboard so the scoreboard can be sent without copying it
+    :param verdict: verdict of the player
+    :param answer: answer of the player, None if the player did not answer
+    :param rank: rank of the player, 1 for the best players
+    :param total: total score of the player
+    :param scoreboard: scoreboard of the round encoded by encode_scoreboard
+    :return: frame header and verdict of the player
+    """
+    if answer is None:
+        verdict, answer = Verdict.NO_ANSWER, 0
+
+    payload_size = VERDICT.size + len(scoreboard)
+    if payload_size > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f'Payload of {payload_size} bytes is too large')
+    return HEADER.pack(payload_size, MessageType.RESULTS) + VERDICT.pack(verdict, answer, rank, total)
+
+
+def encode_results(verdict: int, answer: Optional[int], rank: int, total: float, scoreboard: bytes) -> bytes:
+    """
+    Encode round results of a player as a struct-packed frame
+    :param verdict: verdict of the player
+    :param answer: answer of the player, None if the player did not answer
+    :param rank: rank of the player, 1 for the best players
+    :param total: total score of the player
+    :param scoreboard: scoreboard of the round encoded by encode_scoreboard
+    :return: encoded frame
+    """
+    return encode_results_prefix(verdict, answer, rank, total, scoreboard) + scoreboard
+
+
+def encode_question_prefix(sent_at: float, size: int) -> bytes:
+    """
+    Encode the part of the question frame of a player which comes before the shared question text
+    :param sent_at: time the question is sent to the player, seconds since the epoch
+    :param size: size of the encoded question text
+    :return: frame header and send time
+    """
+    payload_size = QUESTION.size + size
+    if payload_size > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f'Payload of {payload_size} bytes is too large')
+    return HEADER.pack(payload_size, MessageType.QUESTION) + QUESTION.pack(sent_at)
+
+
+def decode_question(payload: bytes) -> Tuple[str, float]:
+    """
+    Decode the payload of a question frame
+    :param payload: payload of the frame
+    :return: question and the time the server sent it
+    """
+    sent_at, = QUESTION.unpack_from(payload)
+    return payload[QUESTION.size:].decode(), sent_at
+
+
+def decode_results(payload: bytes) -> Dict[str, Any]:
+    """
+    Decode the payload of a results frame
+    :param payload: payload of the frame
+    :return: result dictionary with message, answer, scores of the best players, rank, total, players and is_end keys
+    """
+    verdict, player_answer, rank, total = VERDICT.unpack_from(payload)
+    message = VERDICT_MESSAGES.get(verdict, '').format(player_answer)
+
+    answer, is_end, player_count = RESULTS_HEADER.unpack_from(payload, VERDICT.size)
+    offset = VERDICT.size + RESULTS_HEADER.size
+
+    count, = SCORES_COUNT.unpack_from(payload, offset)
+    offset += SCORES_COUNT.size
+
+    scores: Dict[str, float] = {}
+    for _ in range(count):
+        name_length, = SCORE_NAME.unpack_from(payload, offset)
+        offset += SCORE_NAME.size
+        name = payload[offset:offset + name_length].decode()
+        offset += name_length
+        scores[name], = SCORE_TOTAL.unpack_from(payload, offset)
+        offset += SCORE_TOTAL.size
+
+    return {'message': message, 'answer': answer, 'scores': scores, 'rank': rank, 'total': total,
+            'players': player_count, 'is_end': bool(is_end)}
+
+
+def decode_message(frame: Frame) -> Union[str, Dict[str, Any], bytes]:
+    """
+    Decode the payload of a frame according to its type
+    :param frame: message type and payload
+    :return: decoded message, raw payload for unknown types
+    """
+    message_type, payload = frame
+    if message_type == MessageType.TEXT:
+        return payload.decode()
+    if message_type in (MessageType.JSON, MessageType.JOIN, MessageType.SESSION):
+        return loads(payload)
+    if message_type == MessageType.RESULTS:
+        return decode_results(payload)
+    if message_type == MessageType.QUESTION:
+        return decode_question(payload)[0]
+    return payload
+
+
+class FrameDecoder:
+    __slots__ = ('max_payload_size', '_buffer', '_offset')
+
+    def __init__(self, max_payload_size: int = MAX_PAYLOAD_SIZE):
+        """
+        Initialize a streaming decoder which handles partial reads and coalesced frames
+        :param max_payload_size: largest payload accepted before raising ProtocolError
+        """
+        self.max_payload_size = max_payload_size
+        self._buffer = bytearray()
+        self._offset = 0
+
+    def feed(self, data: bytes) -> None:
+        """
+        Add received bytes to the decoder
+        :param data: received bytes
+        :return: None
+        """
+        # drop consumed bytes before growing the buffer
+        if self._offset:
+            del self._buffer[:self._offset]
+            self._offset = 0
+        self._buffer += data
+
+    def next_frame(self) -> Optional[Frame]:
+        """
+        Get the next complete frame
+        :return: message type and payload, None if no complete frame is buffered
+        """
+        if len(self._buffer) - self._offset < HEADER.size:
+            return None
+
+        length, message_type = HEADER.unpack_from(self._buffer, self._offset)
+        if length > self.max_payload_size:
+            raise ProtocolError(f'Payload of {length} bytes is too large')
+
+        start = self._offset + HEADER.size
+        if len(self._buffer) < start + length:
+            return None
+
+        self._offset = start + length
+        return message_type, bytes(self._buffer[start:self._offset])
+
+    def frames(self) -> Iterator[Frame]:
+        """
+        Iterate over every complete frame
+        :return: iterator of frames
+        """
+        frame = self.next_frame()
+        while frame is not None:
+            yield frame
+            frame = self.next_frame()
+
+
+def read_frame(sock: socket, decoder: FrameDecoder, buffer_size: int = 65536) -> Optional[Frame]:
+    """
+    Read the next frame from a blocking socket
+    :param sock: socket to read from
+    :param decoder: decoder of the socket
+    :param buffer_size: number of bytes to read at once
+    :return: message type and payload, None if the connection is closed
+    """
+    frame = decoder.next_frame()
+    while frame is None:
+        data = sock.recv(buffer_size)
+        if not data:
+            return None
+        decoder.feed(data)
+        frame = decoder.next_frame()
+    return frame
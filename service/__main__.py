@@ -0,0 +1,10 @@
+import os
+import sys
+
+# modules of the service import each other by name, as when they are run from this directory
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from headless import main
+
+if __name__ == '__main__':
+    main()
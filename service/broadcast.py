@@ -0,0 +1,293 @@
+import math
+import selectors
+import socket
+import time
+from collections import deque
+from typing import Iterable, Callable, Any, Dict, List, Tuple, Sequence, Optional
+
+from io_loop import IOLoop
+from metrics import Metrics
+from player_model import Player
+
+HIGH_WATERMARK = 1024 * 1024  # bytes queued for a player before it is treated as a slow consumer
+MAX_BUFFERS = 512  # buffers written by one sendmsg call, below the IOV_MAX of every platform
+SLOW_CONSUMER_POLICIES = ('disconnect', 'drop')
+DELIVERY_MODES = ('staged', 'sequential')
+SKEW_SAMPLES = 4096  # send offsets kept to compute the skew percentiles
+SKEW_PERCENTILES = (50, 90, 99)
+
+# flag for a send which never blocks, the player sockets stay blocking for the other readers
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
+class Broadcaster:
+    def __init__(self, loop: IOLoop, on_error: Callable[[Player], Any], high_watermark: int = HIGH_WATERMARK,
+                 policy: str = 'disconnect', on_log: Callable[[str], Any] = print,
+                 metrics: Optional[Metrics] = None):
+        """
+        Initialize the engine which writes frames to the players without blocking, every player has its own
+        outbound queue which is flushed when its socket is writable, a shared frame is queued by reference
+        so that it is written to every socket without copying it for each player
+        :param loop: I/O loop watching the player sockets
+        :param on_error: function called with a player whose connection failed or who is a slow consumer to disconnect
+        :param high_watermark: bytes queued for a player before the slow consumer policy applies
+        :param policy: disconnect the slow consumer, or drop the frames sent to it until its queue drains
+        :param on_log: function to call with log lines
+        :param metrics: metrics counting the written bytes, None to not count them
+        """
+        if policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f'Unknown slow consumer policy {policy}')
+
+        self.loop = loop
+        self.on_error = on_error
+        self.high_watermark = high_watermark
+        self.policy = policy
+        self.on_log = on_log
+        self.metrics = metrics
+
+    def send(self, player: Player, *buffers: bytes) -> bool:
+        """
+        Queue buffers forming whole frames for a player and write as much as the socket accepts
+        :param player: player to send to
+        :param buffers: buffers to send in order
+        :return: False if the buffers are dropped or the player is disconnected, True otherwise
+        """
+        size = sum(len(buffer) for buffer in buffers)
+        is_slow = is_failed = False
+
+        with player.send_lock:
+            # a frame larger than the watermark is still sent to a player which keeps up
+            if player.outbound_size and player.outbound_size + size > self.high_watermark:
+                is_slow = True
+                if self.policy == 'disconnect':
+                    # later sends fail at once instead of reporting the slow consumer again
+                    player.outbound, player.outbound_size = [], 0
+                    self._shutdown(player)
+            else:
+                player.outbound.extend(buffers)
+                player.outbound_size += size
+                is_failed = not self._flush(player)
+
+        if is_slow:
+            return self._slow_consumer(player, size)
+        if is_failed:
+            self.on_error(player)
+            return False
+        return True
+
+    def broadcast(self, players: Iterable[Player], *buffers: bytes) -> None:
+        """
+        Send the same buffers to every player, buffers are shared between the outbound queues
+        :param players: players to send to
+        :param buffers: buffers forming whole frames
+        :return: None
+        """
+        for player in list(players):
+            self.send(player, *buffers)
+
+    def fan_out(self, players: Sequence[Player], encode_prefix: Callable[[float], bytes], *buffers: bytes,
+                is_staged: bool = True) -> List[Tuple[Player, float]]:
+        """
+        Send a frame made of a prefix stamped with the send time of each player and shared buffers.
+        Staged delivery first sorts out the players with queued bytes, then writes to the players with empty
+        queues one after another with one sendmsg each, reporting failures only after that loop, and queues
+        the frame behind the bytes of the other players last, so that the backlog of a slow player does not
+        delay the players which keep up
+        :param players: players to send to, staged delivery may write to them in another order
+        :param encode_prefix: function encoding the prefix of a player from its send time
+        :param buffers: buffers shared by every player
+        :param is_staged: stage the writes, otherwise each player is written to in turn like send does
+        :return: players which got the frame and their send times, in send order
+        """
+        stamps: List[Tuple[Player, float]] = []
+
+        if not is_staged:
+            for player in list(players):
+                sent_at = time.time()
+                if self.send(player, encode_prefix(sent_at), *buffers):
+                    stamps.append((player, sent_at))
+            return stamps
+
+        # players with queued bytes cannot get the frame now, it is queued behind their bytes after the pass
+        ready, backlogged = [], []
+        for player in players:
+            (backlogged if player.outbound else ready).append(player)
+
+        shared_size = sum(len(buffer) for buffer in buffers)
+        failed: List[Player] = []
+        for player in ready:
+            sent_at = time.time()
+            prefix = encode_prefix(sent_at)
+            with player.send_lock:
+                # a ping or a result may be queued since the player was sorted out, the frame goes behind it
+                if player.outbound:
+                    backlogged.append(player)
+                    continue
+
+                player.outbound.append(prefix)
+                player.outbound.extend(buffers)
+                player.outbound_size += len(prefix) + shared_size
+                is_failed = not self._flush(player)
+
+            if is_failed:
+                failed.append(player)
+            else:
+                stamps.append((player, sent_at))
+
+        for player in failed:
+            self.on_error(player)
+
+        for player in backlogged:
+            sent_at = time.time()
+            if self.send(player, encode_prefix(sent_at), *buffers):
+                stamps.append((player, sent_at))
+
+        return stamps
+
+    def on_writable(self, player: Player) -> None:
+        """
+        Continue writing the queue of a player, called by the I/O loop when its socket is writable
+        :param player: player whose socket is writable
+        :return: None
+        """
+        with player.send_lock:
+            is_failed = not self._flush(player)
+
+        if is_failed:
+            self.on_error(player)
+
+    def drain(self, player: Player, timeout: float = 1.0) -> None:
+        """
+        Write the whole queue of a player with a blocking socket, used before closing the connection
+        :param player: player to drain
+        :param timeout: seconds allowed for the remaining bytes
+        :return: None
+        """
+        with player.send_lock:
+            if not player.outbound:
+                return
+
+            buffers, player.outbound, player.outbound_size = player.outbound, [], 0
+            try:
+                player.client.settimeout(timeout)
+                for buffer in buffers:
+                    player.client.sendall(buffer)
+            except OSError:
+                pass
+
+    def _flush(self, player: Player) -> bool:
+        """
+        Write queued buffers until the socket would block, call with the send lock of the player held
+        :param player: player to flush
+        :return: False if the connection failed, True otherwise
+        """
+        outbound = player.outbound
+        while outbound:
+            try:
+                sent = player.client.sendmsg(outbound[:MAX_BUFFERS], (), MSG_DONTWAIT)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError:
+                player.outbound, player.outbound_size = [], 0
+                return False
+
+            player.outbound_size -= sent
+            if self.metrics is not None:
+                self.metrics.inc('bytes_out', sent)
+
+            # remove the written buffers and keep the unwritten part of the last one
+            written = 0
+            while written < len(outbound) and sent >= len(outbound[written]):
+                sent -= len(outbound[written])
+                written += 1
+            del outbound[:written]
+            if sent:
+                outbound[0] = memoryview(outbound[0])[sent:]
+
+        self._watch(player, bool(outbound))
+        return True
+
+    @staticmethod
+    def _shutdown(player: Player) -> None:
+        try:
+            player.client.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+
+    def _watch(self, player: Player, is_pending: bool) -> None:
+        """
+        Watch the socket of a player for writability while bytes are queued
+        :param player: player
+        :param is_pending: True if bytes are queued
+        :return: None
+        """
+        if is_pending != player.is_write_watched:
+            player.is_write_watched = is_pending
+            events = selectors.EVENT_READ | selectors.EVENT_WRITE if is_pending else selectors.EVENT_READ
+            self.loop.modify(player.client, events)
+
+    def _slow_consumer(self, player: Player, size: int) -> bool:
+        """
+        Apply the slow consumer policy to a player whose queue is above the high watermark
+        :param player: slow player
+        :param size: bytes which could not be queued
+        :return: False
+        """
+        if self.policy == 'drop':
+            self.on_log(f'{size} bytes dropped for slow player {player.name}')
+        else:
+            self.on_log(f'Player {player.name} disconnected as a slow consumer')
+            self.on_error(player)
+        return False
+
+
+def percentile(ordered: Sequence[float], rank: float) -> float:
+    """
+    Get a percentile of sorted values with the nearest rank method
+    :param ordered: sorted values, not empty
+    :param rank: percentile between 0 and 100
+    :return: value
+    """
+    index = max(0, min(len(ordered) - 1, math.ceil(rank / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class DeliveryStats:
+    def __init__(self, size: int = SKEW_SAMPLES):
+        """
+        Initialize the statistics of the fan-out skew, the offset of a player is the time between the first
+        player and this player got a frame, the spread of a fan-out is the offset of its last player
+        :param size: number of recent offsets and spreads kept
+        """
+        self.offsets: deque = deque(maxlen=size)
+        self.spreads: deque = deque(maxlen=size)
+
+    def record(self, stamps: List[Tuple[Player, float]]) -> float:
+        """
+        Record the send times of a fan-out
+        :param stamps: players and their send times, returned by Broadcaster.fan_out
+        :return: spread of the fan-out in seconds
+        """
+        if not stamps:
+            return 0.0
+
+        first = min(sent_at for _, sent_at in stamps)
+        offsets = [sent_at - first for _, sent_at in stamps]
+        self.offsets.extend(offsets)
+        self.spreads.append(max(offsets))
+        return self.spreads[-1]
+
+    def percentiles(self, ranks: Sequence[float] = SKEW_PERCENTILES) -> Dict[str, float]:
+        """
+        Get the percentiles of the recent offsets and spreads
+        :param ranks: percentiles to compute
+        :return: seconds by name, such as offset_p99 or spread_p50, empty before the first fan-out
+        """
+        result: Dict[str, float] = {}
+        for name, values in (('offset', self.offsets), ('spread', self.spreads)):
+            if not values:
+                continue
+            ordered = sorted(values)
+            for rank in ranks:
+                result[f'{name}_p{rank:g}'] = percentile(ordered, rank)
+        return result
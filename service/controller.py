@@ -1,34 +1,375 @@
-from typing import Tuple, Dict, List, Union, Any
-from socket import socket, AF_INET, SOCK_STREAM, timeout
-from json import dumps
-from threading import Thread
-import random
+from hmac import compare_digest
+from itertools import chain
+from secrets import token_urlsafe
+from typing import Tuple, Dict, List, Set, Union, Any, Optional, Callable
+from selectors import EVENT_READ, EVENT_WRITE
+from socket import socket, AF_INET, SOCK_STREAM
+from threading import Condition, Event
+import time
 
-from service.message_box import MessageBox
-from player_model import Player
+from player_model import Player, PlayerArchive, DEFAULT_ARCHIVE_SIZE
+from events import ServiceObserver
+from io_loop import IOLoop, TimerHandle
+from heartbeat import Heartbeat
+from handshake import Acceptor, Handshake, LISTEN_BACKLOG, HANDSHAKE_TIMEOUT
+from broadcast import Broadcaster, DeliveryStats, HIGH_WATERMARK, DELIVERY_MODES
+from leaderboard import Leaderboard, DEFAULT_TOP_COUNT
+from scoring import ScoreTable, ANSWER_LIMIT
+from metrics import Metrics
+from question_bank import QuestionBank, MappedQuestionBank, QuestionSampler, DEFAULT_QUESTIONS_PATH, open_question_bank
+from common.heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, PONG_FRAME, set_keepalive
+from common.protocol import (FrameDecoder, Frame, MessageType, ProtocolError, Verdict, encode_text,
+                             encode_results_prefix, encode_scoreboard, encode_question_prefix, encode_session,
+                             decode_join)
+
+
+ANSWER_TIMEOUT = 30.0  # default seconds given to the players to answer a question
+DECISION_TIMEOUT = 60.0  # default seconds an observer is given to decide whether to restart after a game
+# auto applies auto_restart as soon as a game ends, ask waits for an observer to call decide first
+END_OF_GAME_POLICIES = ('auto', 'ask')
+TOKEN_BYTES = 16  # random bytes of a session token
 
 
 class ServiceController:
-    def __init__(self, port: int, question_count: int, layout: Any):
+    def __init__(self, port: int, question_count: int, layout: Any = None,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, heartbeat_timeout: Optional[float] = HEARTBEAT_TIMEOUT,
+                 auto_restart: bool = True, min_players: Optional[int] = None, questions_path: Optional[str] = None,
+                 max_players: Optional[int] = None,
+                 question_bank: Union[QuestionBank, MappedQuestionBank, None] = None,
+                 top_count: int = DEFAULT_TOP_COUNT, scoring_rule: str = 'closest',
+                 archive_size: int = DEFAULT_ARCHIVE_SIZE, answer_timeout: Optional[float] = ANSWER_TIMEOUT,
+                 slow_consumer_policy: str = 'disconnect', high_watermark: int = HIGH_WATERMARK,
+                 delivery_mode: str = 'staged', metrics: Optional[Metrics] = None,
+                 end_of_game: str = 'auto', decision_timeout: Optional[float] = DECISION_TIMEOUT,
+                 handshake_timeout: Optional[float] = HANDSHAKE_TIMEOUT, late_join: bool = True):
         """
         Initialize the service controller
         :param port: Port to listen
         :param question_count: number of questions to ask
+        :param layout: observer of the events of the controller, more observers can be added with subscribe
+        :param heartbeat_interval: seconds between two pings sent to every player
+        :param heartbeat_timeout: seconds of silence before a player is dropped, None to wait for the socket to fail
+        :param auto_restart: start a new game after a game ends unless an observer terminates the server
+        :param min_players: start the game automatically once this many players joined, None to wait for start_game
+        :param questions_path: path of the questions file or of a compiled .qbank bank, questions.txt by default
+        :param max_players: number of players allowed to join, None for no limit
+        :param question_bank: questions shared with other controllers, loaded from questions_path by default
+        :param top_count: number of best players sent with the results, every player also gets its own rank
+        :param scoring_rule: rule of the score table, closest, proportional or top3
+        :param archive_size: number of removed players remembered
+        :param answer_timeout: seconds given to answer a question, players who do not answer in time get no point,
+        None to wait for every player
+        :param slow_consumer_policy: disconnect the players whose outbound queue passes the high watermark,
+        or drop the messages sent to them
+        :param high_watermark: bytes queued for a player before the slow consumer policy applies
+        :param delivery_mode: staged to write the question to every player in one tight pass,
+        or sequential to write it to each player in turn
+        :param metrics: counters and histograms of the server process, None to disable the instrumentation
+        :param end_of_game: auto to restart or terminate at once after a game according to auto_restart,
+        or ask to wait for an observer to call decide, the game thread waits without blocking the observers
+        :param decision_timeout: seconds to wait for a decision before auto_restart applies, None to wait forever
+        :param handshake_timeout: seconds a client is given to send its name, None to wait forever
+        :param late_join: let new players join a started game, they play from the next question
         """
+        if delivery_mode not in DELIVERY_MODES:
+            raise ValueError(f'Unknown delivery mode {delivery_mode}')
+        if end_of_game not in END_OF_GAME_POLICIES:
+            raise ValueError(f'Unknown end of game policy {end_of_game}')
+
         # set global variables
         self.server: Union[socket, None] = None
         self.port: int = port
         self.total_question_count: int = question_count
         self.asked_question_count: int = 0
-        self.layout: Any = layout
+        self.auto_restart: bool = auto_restart
+        self.end_of_game: str = end_of_game
+        self.decision_timeout: Optional[float] = decision_timeout
+        self._decision: Optional[bool] = None  # restart decision of an observer, None until it decides
+        self._decision_event = Event()
+        self.min_players: Optional[int] = min_players
+        self.max_players: Optional[int] = max_players
+        self.questions_path: str = questions_path or DEFAULT_QUESTIONS_PATH
+
+        # observers notified about the events of the game
+        self.observers: List[Any] = []
+        if layout is not None:
+            self.subscribe(layout)
+
+        # clients are accepted and send their names on the I/O loop while the game thread waits for the start
+        self.acceptor: Union[Acceptor, None] = None
+        self.handshake_timeout: Optional[float] = handshake_timeout
 
-        # set players and questions dictionary
+        # players who joined or came back during the game, seated by the thread playing the rounds
+        self.late_join: bool = late_join
+        self._joiners: Dict[str, Player] = {}
+
+        # set players dictionary and questions, the bank is loaded once and drawn without replacement
         self.players: Dict[str: Player] = {}
-        self.questions: Dict[str: int] = {}
-        self.removed_players: Dict[str: Player] = {}
+        self.question_bank: Union[QuestionBank, MappedQuestionBank, None] = question_bank
+        self.question_sampler: Union[QuestionSampler, None] = None
+        self.removed_players: PlayerArchive = PlayerArchive(archive_size)  # records of recently removed players
+        self.leaderboard: Leaderboard = Leaderboard()  # players ordered by total score
+        self.top_count: int = top_count
+
+        # answers and totals of the players in contiguous arrays, scored in one pass at the end of a round
+        self.score_table: ScoreTable = ScoreTable(scoring_rule)
+        self._round_winners: Set[str] = set()
+        self._scored_players: List[Player] = []
+
+        # I/O loop which reads from every player socket and the players whose answer is awaited
+        self.loop: Union[IOLoop, None] = None
+        self.round_condition = Condition()
+        self._pending_answers: Set[Player] = set()
+        self._is_round_open = False
+        self._round_listener: Optional[Callable[[], None]] = None
+        self.answer_timeout: Optional[float] = answer_timeout
+        self._round_deadline: Union[TimerHandle, None] = None
+        self._round_number = 0
+
+        # heartbeat and the players whose connection is found dead, removed by check_connections
+        self.heartbeat_interval: float = heartbeat_interval
+        self.heartbeat_timeout: Optional[float] = heartbeat_timeout
+        self.heartbeat: Union[Heartbeat, None] = None
+
+        # non-blocking writes to the players, created with the loop
+        self.broadcaster: Union[Broadcaster, None] = None
+        self.slow_consumer_policy: str = slow_consumer_policy
+        self.high_watermark: int = high_watermark
+        self._dead_players: Set[Player] = set()
+
+        # send times of the last question and the skew of the question fan-outs
+        self.delivery_mode: str = delivery_mode
+        self.delivery_stats: DeliveryStats = DeliveryStats()
+        self.question_sent_at: Dict[str, float] = {}
+        self.current_question: Optional[str] = None  # question of the open round, sent to the players who join
+
+        # the timed methods are wrapped only when metrics are enabled
+        self.metrics: Optional[Metrics] = metrics
+        if metrics is not None:
+            metrics.instrument(self)
 
         self._is_terminated = False  # set is_terminated to True to terminate the game
         self._is_started = False  # set is_started to True to start the game
+        self._is_game_over = False  # set when a game ends early because only one player is left
+
+    def subscribe(self, observer: Union[ServiceObserver, Any]) -> None:
+        """
+        Add an observer, any object implementing some of the ServiceObserver events can subscribe
+        :param observer: observer to notify
+        :return: None
+        """
+        self.observers.append(observer)
+
+    def unsubscribe(self, observer: Union[ServiceObserver, Any]) -> None:
+        """
+        Remove an observer
+        :param observer: observer to remove
+        :return: None
+        """
+        if observer in self.observers:
+            self.observers.remove(observer)
+
+    def notify(self, event: str, *args: Any) -> None:
+        """
+        Call an event on every observer which implements it
+        :param event: name of the event, a method of ServiceObserver
+        :param args: arguments of the event
+        :return: None
+        """
+        for observer in self.observers:
+            handler = getattr(observer, event, None)
+            if handler is not None:
+                handler(*args)
+
+    def log(self, log: str) -> None:
+        """
+        Send a log line to the observers
+        :param log: log
+        :return: None
+        """
+        self.notify('add_log', log)
+
+    def run(self) -> None:
+        """
+        Play games until the server is terminated, blocks the calling thread
+        :return: None
+        """
+        # read questions from file
+        self.read_questions()
+        self.log("Questions read from file")
+
+        while not self._is_terminated:
+
+            self._is_started = False
+            self._is_game_over = False
+            self.asked_question_count = 0
+
+            # wait for players
+            self.notify('waiting_players')
+            self.wait_clients()
+
+            if self._is_terminated:
+                break
+
+            self.log("All players connected. Game started\n")
+            self.notify('game_started')
+
+            # send starting message to players
+            self.send_message_to_clients('start')
+
+            # give delay for players
+            time.sleep(1)
+
+            # send questions to players
+            for i in range(self.total_question_count):
+
+                # players who left during the previous round are removed by this thread only
+                self.check_connections()
+                if len(self.players) <= 1 or self._is_game_over:
+                    break
+
+                answer = self.ask_question(i)
+                self.get_answers(answer)
+                self.send_results(answer)
+
+                if self._is_terminated:
+                    break
+
+            if self._is_terminated:
+                break
+
+            self.finish_game()
+
+        self.log("Server terminated")
+
+    def start_game(self) -> bool:
+        """
+        Stop waiting for players and start the game
+        :return: True if the game is started, False if there are not enough players
+        """
+        # players joining after this point wait for admit_joiners
+        with self.round_condition:
+            if len(self.players) < 2:
+                return False
+
+            self._is_started = True
+            self.round_condition.notify_all()
+        return True
+
+    def terminate(self) -> None:
+        """
+        Terminate the server after the current step of the game
+        :return: None
+        """
+        self._is_terminated = True
+
+        # wake up the threads waiting for players, answers and an end of game decision
+        with self.round_condition:
+            self.round_condition.notify_all()
+        self._decision_event.set()
+
+    def decide(self, restart: bool) -> None:
+        """
+        Decide whether to restart or terminate after a game, callable from any thread
+        while the controller waits for a decision with the ask policy
+        :param restart: True to start a new game, False to terminate the server
+        :return: None
+        """
+        self._decision = restart
+        self._decision_event.set()
+
+    def ask_question(self, question_number: int = 0, on_close: Optional[Callable[[], None]] = None) -> int:
+        """
+        Ask question to all players
+        :param question_number: index of the question in the game
+        :param on_close: function called from the loop thread when every player answered, see open_round
+        :return: answer
+        """
+        question, answer = self.select_question()
+        self.log(f'Question {question_number + 1}: {question}, Answer: {answer}')
+
+        # send question to all players
+        self.open_round(on_close)
+        spread = self.send_question_to_clients(question)
+        self.log(f'Question sent to all players in {spread * 1000:.3f} ms')
+
+        return answer
+
+    def get_answers(self, correct_answer: int) -> None:
+        """
+        Get answers from all players
+        :param correct_answer: correct answer of the question
+        :return: None
+        """
+        # get answers from all players
+        self.wait_for_answer_from_clients()
+        self.score_answers(correct_answer)
+
+    def score_answers(self, correct_answer: int) -> None:
+        """
+        Compare the answers received in the closed round
+        :param correct_answer: correct answer of the question
+        :return: None
+        """
+        if not self._is_terminated and not self._is_game_over:
+            self.log("Answers received from all players")
+
+            # compare answers
+            self.compare_answers(correct_answer)
+            self.log("Answers compared")
+
+    def send_results(self, correct_answer: int) -> None:
+        """
+        Send results to all players
+        :param correct_answer: correct answer of the question
+        :return: None
+        """
+        # send results to all players
+        if not self._is_terminated and not self._is_game_over:
+            self.send_results_to_clients(correct_answer)
+            self.log("Results sent to all players\n")
+
+    def finish_game(self) -> None:
+        """
+        Let the observers decide whether to restart or terminate according to the end of game policy,
+        then inform the players
+        :return: None
+        """
+        if self._is_game_over:
+            message = "Only one player left. Game is over."
+        else:
+            message = "Game finished."
+
+        self._is_started = False
+
+        metrics = self.delivery_metrics()
+        if metrics:
+            self.log('Question delivery skew: ' + ', '.join(f'{name} {seconds * 1000:.3f} ms'
+                                                           for name, seconds in metrics.items()))
+
+        # players who joined during the last round get the end of the game too
+        self.check_connections()
+        self.admit_joiners()
+
+        self._decision = None
+        self._decision_event.clear()
+        self.notify('game_finished', message)
+
+        if not self._is_terminated and self.end_of_game == 'ask':
+            self.log('Waiting for a decision to restart or terminate')
+            self._decision_event.wait(self.decision_timeout)
+
+        restart = self.auto_restart if self._decision is None else self._decision
+        if not restart:
+            self.terminate()
+
+        # players may leave while the decision is awaited
+        self.check_connections()
+        if self._is_terminated:
+            self.send_message_to_clients('terminate')
+        else:
+            self.send_message_to_clients('restart')
+            self.log("New game started")
 
     def connect(self) -> None:
         """
@@ -37,96 +378,324 @@ class ServiceController:
         """
         self.server = socket(AF_INET, SOCK_STREAM)
         self.server.bind(('localhost', self.port))
-        self.server.listen(5)
+        self.server.listen(LISTEN_BACKLOG)
+
+        # start the I/O loop
+        loop = IOLoop()
+        loop.start()
+        self.attach(loop)
+        self.acceptor = Acceptor(loop, self.server, self.on_join, self.log, self.handshake_timeout,
+                                 metrics=self.metrics)
+        if self.metrics is not None:
+            self.metrics.gauge('players', 'players in the game', lambda: len(self.players))
         print('Server is listening')
 
+    def attach(self, loop: IOLoop) -> None:
+        """
+        Use an I/O loop for the sockets of the players, the loop may be shared with other controllers
+        :param loop: running I/O loop
+        :return: None
+        """
+        self.loop = loop
+        self.broadcaster = Broadcaster(loop, self.disconnect_player, self.high_watermark, self.slow_consumer_policy,
+                                       self.log, self.metrics)
+        self.heartbeat = Heartbeat(self.loop, self.connected_players, self.on_heartbeat_timeout,
+                                   self.broadcaster.send, self.heartbeat_interval, self.heartbeat_timeout)
+        self.heartbeat.start()
+
     def close(self) -> None:
         """
         Close server
         :return: None
         """
-        self.server.close()
-        print('Server closed')
+        if self.heartbeat is not None:
+            self.heartbeat.stop()
+
+        # the loop and the listening socket are owned by the controller only if connect is called
+        if self.server is not None:
+            # write the last messages before the loop stops flushing the queues
+            for player in list(self.players.values()):
+                self.broadcaster.drain(player)
+
+            self.loop.call_soon(self.acceptor.close)
+            self.loop.stop()
+            self.server.close()
+            print('Server closed')
 
     def wait_clients(self) -> None:
         """
-        Wait for clients to connect
-        :param layout: layout of the game
+        Accept clients on the I/O loop until the game is started
+        :return: None
         """
+        self.log('Waiting for clients to connect...')
+        self.removed_players.clear()
 
-        self.layout.add_log('Waiting for clients to connect...')
-        self.removed_players = {}
-
-        # set timeout for server
-        self.server.settimeout(1)
+        with self.round_condition:
+            # start the game right away if enough players stayed from the previous game
+            self.check_connections()
+            if self.min_players is not None and len(self.players) >= self.min_players:
+                self.start_game()
 
-        # wait for clients to connect
-        while not self._is_started and not self._is_terminated:
+            # many clients send their names at once, a slow client only holds its own handshake,
+            # clients are still accepted during the game to come back or join late
+            self.acceptor.start()
+            while not self._is_started and not self._is_terminated:
+                # the condition is released while waiting, players leaving before the start are removed here
+                self.round_condition.wait(1)
+                self.check_connections()
 
-            # check if server stop waiting for clients
+    def on_join(self, handshake: Handshake, frame: Frame) -> None:
+        """
+        Add a client which sent its name, called by the I/O loop
+        :param handshake: handshake of the client
+        :param frame: first frame of the client, its name or a join message with a session token
+        :return: None
+        """
+        token = None
+        if frame[0] == MessageType.TEXT:
             try:
-                client, address = self.server.accept()
-            except timeout:
-                continue
+                name = frame[1].decode()
+            except UnicodeDecodeError:
+                self.log(f'Client {handshake.address} sent a name which is not valid utf-8')
+                self.reject(handshake.client, 'Invalid name')
+                return
+        elif frame[0] == MessageType.JOIN:
+            try:
+                name, _, token = decode_join(frame[1])
+            except ValueError:
+                self.reject(handshake.client, 'Invalid join message')
+                return
+        else:
+            self.log(f'Client {handshake.address} disconnected before sending a name')
+            handshake.client.close()
+            return
 
-            name = client.recv(1024).decode()
+        if self.join(name, handshake.client, handshake.address, handshake.decoder, token) \
+                and self.metrics is not None:
+            self.metrics.observe('accept_latency', time.monotonic() - handshake.accepted_at)
 
-            # send message to client if name is empty
-            if name == '':
-                self.layout.add_log(f'Client {address} connected with empty name')
-                client.send('Name cannot be empty'.encode())
-                client.close()
-                continue
+        # start the game if enough players joined
+        if not self._is_started and self.min_players is not None and len(self.players) >= self.min_players:
+            self.start_game()
 
-            # send message to client if name is already taken
-            if name in self.players:
-                self.layout.add_log(f'Client {address} connected with taken name')
-                client.send('Name already exists'.encode())
-                client.close()
-                continue
+    def join(self, name: str, client: socket, address: Tuple[str, int], decoder: FrameDecoder,
+             token: Optional[str] = None) -> bool:
+        """
+        Add a client to the game, a client sending the token of a player resumes that player,
+        a client joining a started game is seated by admit_joiners, called by the I/O loop
+        :param name: name of the client
+        :param client: socket of the client
+        :param address: address of the client
+        :param decoder: decoder holding the bytes received after the join message
+        :param token: session token sent by the client, None for a new player
+        :return: True if the client joined, False otherwise
+        """
+        if token is not None and self.resume_player(name, token, client, address, decoder):
+            return True
+
+        if self._is_started and not self.late_join:
+            self.log(f'Client {address} rejected because the game is started')
+            self.reject(client, 'Game already started')
+            return False
+
+        return self.add_player(name, client, address, decoder)
+
+    def add_player(self, name: str, client: socket, address: Tuple[str, int], decoder: FrameDecoder) -> bool:
+        """
+        Add a client which sent its name to the players, the client is closed if it cannot join
+        :param name: name of the client
+        :param client: socket of the client
+        :param address: address of the client
+        :param decoder: decoder holding the bytes received after the name
+        :return: True if the client joined, False otherwise
+        """
+        # send message to client if name is empty
+        if name == '':
+            self.log(f'Client {address} connected with empty name')
+            self.reject(client, 'Name cannot be empty')
+            return False
+
+        # send message to client if name is already taken, names of the players who left the game are kept
+        if name in self.players or name in self._joiners or name in self.removed_players:
+            self.log(f'Client {address} connected with taken name')
+            self.reject(client, 'Name already exists')
+            return False
+
+        # send message to client if there is no place left
+        if self.max_players is not None and len(self.players) + len(self._joiners) >= self.max_players:
+            self.log(f'Client {address} rejected because the game is full')
+            self.reject(client, 'Game is full')
+            return False
+
+        player = Player(name=name, client=client, address=address, decoder=decoder, token=token_urlsafe(TOKEN_BYTES),
+                        sender=self.broadcaster.send)
+        self.welcome(player, is_resumed=False)
+
+        self.log(f'Client {address} connected with name {name}' + (' during the game' if self._is_started else ''))
+        if self.metrics is not None:
+            self.metrics.inc('accepts')
+        return True
+
+    def resume_player(self, name: str, token: str, client: socket, address: Tuple[str, int],
+                      decoder: FrameDecoder) -> bool:
+        """
+        Give a reconnecting client back the place and the score of the player holding its token
+        :param name: name of the client
+        :param token: session token sent by the client
+        :param client: socket of the client
+        :param address: address of the client
+        :param decoder: decoder holding the bytes received after the join message
+        :return: True if the player is resumed, False if the token does not match a player
+        """
+        with self.round_condition:
+            previous = self.players.get(name) or self._joiners.get(name)
+            record = self.removed_players.get(name) if previous is None else None
+            expected = previous.token if previous is not None else record.token if record is not None else None
+            if expected is None or not compare_digest(expected, token):
+                return False
+
+            player = Player(name=name, client=client, address=address, decoder=decoder, token=token,
+                            sender=self.broadcaster.send)
+            if previous is not None:
+                # the server did not notice yet that the old connection is lost, it is replaced in place
+                player.total, player.score, player.answer = previous.total, previous.score, previous.answer
+                self.close_player(previous)
+            else:
+                # the player left during the game, its total is kept in its record
+                self.removed_players.pop(name)
+                player.total = record.total if self._is_started else 0
+
+            if previous is not None and self.players.get(name) is previous:
+                self.players[name] = player
+                self.loop.register(player.client, lambda mask, player=player: self.on_client_ready(player, mask))
+                self.broadcaster.send(player, encode_text('Connected'), self.encode_session(player, True))
+                if previous in self._pending_answers:
+                    self._pending_answers.discard(previous)
+                    self._pending_answers.add(player)
+                    self.send_question_to(player)
+            else:
+                self.welcome(player, is_resumed=True)
+
+        self.log(f'Client {address} resumed player {name} with {player.total} point(s)')
+        if self.metrics is not None:
+            self.metrics.inc('resumes')
+        return True
+
+    def welcome(self, player: Player, is_resumed: bool) -> None:
+        """
+        Watch the socket of a new player and send its session, the player is seated right away before the game,
+        during the game it waits for admit_joiners
+        :param player: player
+        :param is_resumed: True if the player got back its score
+        :return: None
+        """
+        set_keepalive(player.client)
+        with self.round_condition:
+            # watch its socket and queue Connected and the session before the game thread can see the player,
+            # the question of an open round is queued behind them
+            self.loop.register(player.client, lambda mask, player=player: self.on_client_ready(player, mask))
+            self.broadcaster.send(player, encode_text('Connected'), self.encode_session(player, is_resumed))
 
-            # add client to players dictionary
-            player = Player(name=name, client=client, address=address)
-            self.players[name] = player
+            if self._is_started:
+                self._joiners[player.name] = player
+                # the game thread seats the joiners while it waits for answers
+                self.round_condition.notify_all()
+            else:
+                self.seat(player)
 
-            # send message to client
-            player.send('Connected')
+    def connected_players(self) -> List[Player]:
+        """
+        Get the seated players and the players waiting for their seat, callable from any thread
+        :return: players
+        """
+        with self.round_condition:
+            return list(chain(self.players.values(), self._joiners.values()))
 
-            self.layout.add_log(f'Client {address} connected with name {name}')
+    def seat(self, player: Player) -> None:
+        """
+        Add a player to the players, the leaderboard and the score table
+        :param player: player
+        :return: None
+        """
+        self.players[player.name] = player
+        self.leaderboard.update(player.name, player.total)
+        self.score_table.add(player.name, player.total)
 
-        # remove timeout from server
-        self.server.settimeout(None)
+    def admit_joiners(self) -> None:
+        """
+        Seat the players who joined or came back during the game, called from the thread playing the rounds
+        so that the scores are never changed by two threads, the players get the question of an open round
+        :return: None
+        """
+        with self.round_condition:
+            if not self._joiners:
+                return
+
+            joiners, self._joiners = list(self._joiners.values()), {}
+            for player in joiners:
+                self.seat(player)
+
+                # answers of the round are still awaited, the player can answer too
+                if self._is_round_open and self._pending_answers:
+                    self._pending_answers.add(player)
+                    self.send_question_to(player)
+
+    def encode_session(self, player: Player, is_resumed: bool) -> bytes:
+        """
+        Encode the compact snapshot of the game sent to a player after Connected
+        :param player: player
+        :param is_resumed: True if the player got back its score
+        :return: encoded frame
+        """
+        return encode_session(player.token, player.total, self.asked_question_count, self.total_question_count,
+                              self._is_started, is_resumed)
+
+    def reject(self, client: socket, message: str) -> None:
+        """
+        Reject a client which cannot join the game of the controller
+        :param client: socket of the client
+        :param message: reason of the rejection
+        :return: None
+        """
+        if self.metrics is not None:
+            self.metrics.inc('rejects')
+        self.reject_client(client, message)
+
+    @staticmethod
+    def reject_client(client: socket, message: str) -> None:
+        """
+        Send the reason of the rejection and close the client
+        :param client: socket of the client
+        :param message: reason of the rejection
+        :return: None
+        """
+        try:
+            client.sendall(encode_text(message))
+        except OSError:
+            pass
+        client.close()
 
     def read_questions(self) -> None:
         """
-        Read questions from file
+        Open the question bank unless it is already open, questions are read only once
         :return: None
         """
-        with open('questions.txt', 'r') as file:
-            # read question and answer from file line by line and add them to questions dictionary
-            lines = file.readlines()
-            for line in range(0, len(lines), 2):
-                self.questions[lines[line].strip()] = int(lines[line + 1].strip())
+        if self.question_bank is None:
+            self.question_bank = open_question_bank(self.questions_path)
 
-        file.close()  # close file
+        if self.question_sampler is None:
+            self.question_sampler = self.question_bank.sampler()
 
     def select_question(self) -> Tuple[str, int]:
         """
-        Select question randomly
+        Select question randomly without replacement
         :return: question and answer
         """
-        # add questions if questions dictionary is empty
-        if not self.questions:
+        if self.question_sampler is None:
             self.read_questions()
 
-        # select question randomly
-        question = random.choice(list(self.questions.keys()))
-        answer = self.questions[question]
-
-        # remove question from questions dictionary
-        self.questions.pop(question)
-
-        return question, answer
+        # draw the next question of a random permutation, questions repeat only after every question is asked
+        return self.question_sampler.draw()
 
     def send_message_to_clients(self, message: str) -> None:
         """
@@ -134,25 +703,110 @@ class ServiceController:
         :param message: message to send
         :return: None
         """
-        # send question to clients
-        for player in self.players:
-            self.players[player].send(message)
+        # the frame is encoded once and queued for every player, slow players do not delay the others,
+        # players may be seated by the I/O loop between two games
+        with self.round_condition:
+            players = list(self.players.values())
+        self.broadcaster.broadcast(players, encode_text(message))
+
+    def send_question_to_clients(self, question: str) -> float:
+        """
+        Send a question to clients, every frame holds the time the question is sent to its player
+        so that the clients can measure their response time from their own receipt
+        :param question: question to send
+        :return: seconds between the first and the last player getting the question
+        """
+        self.current_question = question
+        encoded = question.encode()
+        stamps = self.broadcaster.fan_out(list(self.players.values()),
+                                          lambda sent_at: encode_question_prefix(sent_at, len(encoded)), encoded,
+                                          is_staged=self.delivery_mode == 'staged')
+        self.question_sent_at = {player.name: sent_at for player, sent_at in stamps}
 
-    def wait_for_answer_from_clients(self) -> None:
+        spread = self.delivery_stats.record(stamps)
+        if self.metrics is not None:
+            self.metrics.observe('question_spread', spread)
+        return spread
+
+    def send_question_to(self, player: Player) -> None:
         """
-        Wait for answer from clients
+        Send the question of the open round to a player who joined or came back during the round
+        :param player: player
         :return: None
         """
-        # create threads for clients
-        threads = []
-        for player in self.players:
-            thread = Thread(target=self.wait_for_answer_from_client, args=(self.players[player],))
-            thread.start()
-            threads.append(thread)
+        if self.current_question is None:
+            return
 
-        # wait for threads to finish
-        for thread in threads:
-            thread.join()
+        encoded = self.current_question.encode()
+        stamps = self.broadcaster.fan_out([player], lambda sent_at: encode_question_prefix(sent_at, len(encoded)),
+                                          encoded)
+        self.question_sent_at.update((player.name, sent_at) for player, sent_at in stamps)
+
+    def delivery_metrics(self) -> Dict[str, float]:
+        """
+        Get the percentiles of the question fan-out skew
+        :return: seconds by name, offset_p99 is the delay of the 99th percentile player after the first player
+        and spread_p99 is the 99th percentile delay of the last player, empty before the first question
+        """
+        return self.delivery_stats.percentiles()
+
+    def open_round(self, on_close: Optional[Callable[[], None]] = None) -> None:
+        """
+        Start accepting answers from every player, call before sending the question
+        so that answers arriving right after it are not missed
+        :param on_close: function called once from the loop thread when every player answered or left
+        :return: None
+        """
+        with self.round_condition:
+            self.admit_joiners()
+            self._pending_answers = set(self.players.values())
+            for player in self._pending_answers:
+                player.answer = None
+            self.score_table.clear_answers()
+            self._is_round_open = True
+            self._round_listener = on_close
+            self._round_number += 1
+            if self.metrics is not None:
+                self.metrics.inc('rounds')
+
+            # the round ends at the deadline if some players do not answer before
+            if self._round_deadline is not None:
+                self._round_deadline.cancel()
+                self._round_deadline = None
+            if self.answer_timeout is not None and self.loop is not None:
+                self._round_deadline = self.loop.call_later(self.answer_timeout, self._expire_round,
+                                                            self._round_number)
+
+    def close_round(self) -> None:
+        """
+        Stop accepting answers, late answers are ignored
+        :return: None
+        """
+        with self.round_condition:
+            self._pending_answers = set()
+            self._is_round_open = False
+            self._round_listener = None
+            self.current_question = None
+
+            if self._round_deadline is not None:
+                self._round_deadline.cancel()
+                self._round_deadline = None
+
+    def wait_for_answer_from_clients(self, timeout: Optional[float] = None) -> None:
+        """
+        Wait for answer from clients, the round ends when the last answer arrives or the deadline passes
+        :param timeout: seconds to wait for answers, None to wait until every player answers
+        :return: None
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        with self.round_condition:
+            # open the round if it is not opened before sending the question
+            if not self._is_round_open:
+                self.open_round()
+
+            self._wait_pending(lambda: bool(self._pending_answers), deadline)
+            self.close_round()
 
     def wait_for_answer_from_client(self, player: Player) -> None:
         """
@@ -160,51 +814,213 @@ class ServiceController:
         :param player: player object
         :return: None
         """
-        # receive answer from client
-        message = ''
-        player.client.settimeout(1)
+        with self.round_condition:
+            player.answer = None
+            self._pending_answers.add(player)
 
-        while not self._is_terminated and message == '':
-            try:
-                message = player.receive()
-            except timeout:
+            self._wait_pending(lambda: player in self._pending_answers, None)
+            self._pending_answers.discard(player)
+
+    def _wait_pending(self, is_pending: Any, deadline: Optional[float]) -> None:
+        """
+        Block until is_pending returns False, the game is terminated or the deadline passes
+        :param is_pending: function which returns True while answers are awaited
+        :param deadline: monotonic time to stop waiting, None to wait indefinitely
+        :return: None
+        """
+        while True:
+            self.check_connections()
+            self.admit_joiners()
+            if not is_pending() or self._is_terminated or self._is_game_over:
+                return
+
+            # wake up periodically to notice termination
+            wait_time = 1.0
+            if deadline is not None:
+                wait_time = min(wait_time, deadline - time.monotonic())
+                if wait_time <= 0:
+                    return
+            self.round_condition.wait(wait_time)
+
+    def on_client_ready(self, player: Player, mask: int) -> None:
+        """
+        Write the queued messages or read the messages of a client, called by the I/O loop
+        :param player: player object
+        :param mask: ready events
+        :return: None
+        """
+        if mask & EVENT_WRITE:
+            self.broadcaster.on_writable(player)
+        if mask & EVENT_READ:
+            self.read_from_client(player)
+
+    def read_from_client(self, player: Player) -> None:
+        """
+        Read messages from a client socket which is ready, called by the I/O loop
+        :param player: player object
+        :return: None
+        """
+        try:
+            data = player.client.recv(65536)
+            frames = list(player.feed(data))
+        except (OSError, ProtocolError):
+            data = b''
+
+        # connection is closed by the client
+        if not data:
+            self.disconnect_player(player)
+            return
+
+        if self.metrics is not None:
+            self.metrics.inc('bytes_in', len(data))
+
+        for message_type, payload in frames:
+            if message_type == MessageType.PING:
+                self.broadcaster.send(player, PONG_FRAME)
                 continue
-            except:
-                player.answer = -1
+
+            if message_type != MessageType.TEXT:
+                continue  # pong only refreshes last_seen
+
+            try:
+                answer = int(payload.decode())
+            except ValueError:
+                continue  # ignore invalid answers
+
+            # the answer is sent back in the results as a 64 bit integer
+            self.receive_answer(player, max(-ANSWER_LIMIT, min(ANSWER_LIMIT, answer)))
+
+    def disconnect_player(self, player: Player) -> None:
+        """
+        Mark the connection of a player as dead, the player is removed by check_connections
+        :param player: player object
+        :return: None
+        """
+        self.loop.unregister(player.client)
+
+        with self.round_condition:
+            # the connection may be reported dead by the reader, the writer and the heartbeat
+            if player in self._dead_players:
                 return
-        if message != '':
-            player.answer = int(message)
-        player.client.settimeout(None)
-        return
+
+            # do not wait for the answer of a disconnected player
+            self._pending_answers.discard(player)
+            self._dead_players.add(player)
+            self.round_condition.notify_all()
+            listener = self._take_round_listener()
+
+        self.notify('player_disconnected', player)
+
+        if listener is not None:
+            listener()
+
+    def close_player(self, player: Player) -> None:
+        """
+        Stop watching the socket of a player and close it in the loop thread, a socket closed by another thread
+        would free its file descriptor for a new client while the loop still watches it
+        :param player: player object
+        :return: None
+        """
+        if not self.loop.in_loop_thread():
+            self.loop.call_soon(self.close_player, player)
+            return
+
+        self.loop.unregister(player.client)
+        player.close()
+
+    def on_heartbeat_timeout(self, player: Player) -> None:
+        """
+        Drop a player who stayed silent for longer than the heartbeat timeout, called by the heartbeat
+        :param player: silent player
+        :return: None
+        """
+        if self.metrics is not None:
+            self.metrics.inc('heartbeat_failures')
+        self.disconnect_player(player)
+
+    def receive_answer(self, player: Player, answer: int) -> None:
+        """
+        Record the answer of a player if the player's answer is awaited
+        :param player: player object
+        :param answer: answer of the player
+        :return: None
+        """
+        with self.round_condition:
+            if player not in self._pending_answers:
+                return
+
+            player.answer = answer
+            self.score_table.set_answer(player.name, answer)
+            if self.metrics is not None and player.name in self.question_sent_at:
+                self.metrics.observe('answer_latency', time.time() - self.question_sent_at[player.name])
+            self._pending_answers.discard(player)
+            self.round_condition.notify_all()
+            listener = self._take_round_listener()
+
+        if listener is not None:
+            listener()
+
+    def _expire_round(self, round_number: int) -> None:
+        """
+        Stop waiting for the answers of the open round at its deadline, called by the I/O loop
+        :param round_number: number of the round whose deadline passed
+        :return: None
+        """
+        with self.round_condition:
+            # the round may be closed and another one opened while the timer was due
+            if round_number != self._round_number or not self._is_round_open:
+                return
+            self._round_deadline = None
+
+            # players who did not answer are scored as no answer
+            if self._pending_answers:
+                self.log(f'{len(self._pending_answers)} player(s) did not answer in time')
+            self._pending_answers = set()
+            self.round_condition.notify_all()
+            listener = self._take_round_listener()
+
+        if listener is not None:
+            listener()
+
+    def _take_round_listener(self) -> Optional[Callable[[], None]]:
+        """
+        Get the round listener if every awaited answer is received, call with round_condition held
+        :return: listener to call once, None if answers are still awaited
+        """
+        if self._pending_answers or not self._is_round_open:
+            return None
+
+        listener, self._round_listener = self._round_listener, None
+        return listener
 
     def compare_answers(self, answer: int) -> None:
         """
-        Compare answers select winner player who choose the closest answer
+        Compare answers select winner player who choose the closest answer, points are given by the scoring rule
         :param answer: correct answer
         :return: None
         """
-        winner: List[Player] = []
+        # delete previous scores, only the players who got points have one
+        for player in self._scored_players:
+            player.score = 0
 
-        for player in self.players:
-            self.players[player].score = 0  # delete previous score
+        winners, awards = self.score_table.score(answer)
+        self._round_winners = set(winners)
+        self._scored_players = []
 
-            # select winner player(s)
-            if not winner:
-                winner.append(self.players[player])
-            elif abs(self.players[player].answer - answer) < abs(winner[0].answer - answer):
-                winner = [self.players[player]]
-            elif abs(self.players[player].answer - answer) == abs(winner[0].answer - answer):
-                winner.append(self.players[player])
-            else:
-                pass
+        # add score to the players who got points
+        for name, points in awards:
+            player = self.players.get(name)
+            if player is None:
+                continue
 
-        # add score to winner player
-        for player in winner:
-            player.score = 1 / len(winner)
-            player.total += player.score
+            player.score = points
+            player.total += points
+            self.leaderboard.update(name, player.total)
+            self._scored_players.append(player)
 
-            log_text = f'{player.name} answered {player.answer} and got {player.score} point(s)'
-            self.layout.add_log(log_text)
+        for name in winners:
+            log_text = f'{name} answered {self.players[name].answer} and got {self.players[name].score} point(s)'
+            self.log(log_text)
 
     def send_results_to_clients(self, answer: int) -> None:
         """
@@ -216,81 +1032,88 @@ class ServiceController:
         # increase asked question count
         self.increase_asked_question_count()
 
-        # sort players by total score
-        self.sort_players()
+        # the best players are sent to everyone, each player also gets its own rank
+        is_end = self.asked_question_count == self.total_question_count
+        scoreboard = encode_scoreboard(answer, self.sort_players(self.top_count), len(self.leaderboard), is_end)
 
-        # send results to clients
-        for player in self.players:
-            # create result message
-            response: Dict[str: Any] = {}
-
-            # set result message for player
-            if self.players[player].score == 1:
-                response["message"] = f'You won this round with {self.players[player].answer}.'
-            elif self.players[player].score > 0:
-                response["message"] = f'You tied with {self.players[player].answer}.'
+        # send results to clients, only the verdict is encoded for each player
+        for player in list(self.players.values()):
+            if player.name not in self._round_winners:
+                verdict = Verdict.LOST
+            elif len(self._round_winners) == 1:
+                verdict = Verdict.WON
             else:
-                response["message"] = f'You lost this round with {self.players[player].answer}.'
-
-            # set correct answer and total scores for player
-            scores = {player: self.players[player].total for player in self.players}
-            scores.update({player: self.removed_players[player].total for player in self.removed_players})
+                verdict = Verdict.TIED
 
-            response["scores"] = scores
-            response["answer"] = answer
-            response["is_end"] = self.asked_question_count == self.total_question_count
+            # the scoreboard is shared by the queues of every player
+            rank = self.leaderboard.rank(player.name)
+            prefix = encode_results_prefix(verdict, player.answer, rank, player.total, scoreboard)
+            self.broadcaster.send(player, prefix, scoreboard)
 
-            # send result message to player
-            try:
-                self.players[player].send(dumps(response))
-            except:
-                pass
+        # publish total scores before they are reset
+        self.notify('scores_updated', {name: player.total for name, player in self.players.items()})
 
         # close sockets if asked question count is equal to total question count
         if self.asked_question_count == self.total_question_count:
             for player in self.players:
                 self.players[player].total = 0
+                self.leaderboard.update(player, 0)
+            self.score_table.reset_totals()
 
-    def sort_players(self) -> None:
+    def sort_players(self, count: Optional[int] = None) -> List[Tuple[str, float]]:
         """
-        Sort players by total score
-        :return: None
+        Get the players sorted by total score
+        :param count: number of players to get, every player by default
+        :return: name and total score of the players, best first
         """
-        sorted(self.players, key=lambda player: self.players[player].total, reverse=True)
+        return self.leaderboard.top(len(self.leaderboard) if count is None else count)
 
     def check_connections(self) -> None:
         """
-        Check connections
+        Remove the players whose connection is found dead by the I/O loop, called from the thread playing
+        the rounds like admit_joiners so that the players, the leaderboard and the score table are only
+        changed by that thread while it iterates over them
         :return: None
         """
         # check if server is terminated
         if self._is_terminated:
             return
 
-        # check if players are disconnected
-        for player in self.players:
-            try:
-                self.players[player].send('')
-            except Exception:
-                self.layout.add_log(f'Player {player} with address {self.players[player].address} disconnected')
-                self.players[player].client.close()
-                self.players[player].total = 0
-                self.removed_players[player] = self.players[player]
+        with self.round_condition:
+            if not self._dead_players:
+                return
+            dead_players, self._dead_players = self._dead_players, set()
+
+            for player in dead_players:
+                # players waiting for their seat are archived without being seated, they may come back again
+                if self._joiners.get(player.name) is player:
+                    self._joiners.pop(player.name)
+                    self.close_player(player)
+                    self.removed_players.add(player)
+                    continue
 
-        # remove disconnected players
-        for player in self.removed_players:
-            self.players.pop(player)
+                # a player replaced by its new connection is already closed
+                if self.players.get(player.name) is not player:
+                    continue
 
-        if len(self.players) <= 1:
-            self.layout.add_log('Only one player left. Game is over.')
-            self._is_terminated = True
-            # send message to last player
-            self.players[list(self.players.keys())[0]].send('only_one_player')
+                self.log(f'Player {player.name} with address {player.address} disconnected')
+                # only a small record is kept, the socket and the buffers of the player are released,
+                # a player who leaves before the game starts frees its name
+                self.close_player(player)
+                if self._is_started:
+                    self.removed_players.add(player)
+                player.total = 0
+                self.leaderboard.remove(player.name)
+                self.score_table.remove(player.name)
+                self.players.pop(player.name)
 
-            MessageBox(title="Game Finished", command=self.restart_game,
-                       message="Only one player left. Do you want to restart the game?")
+            if self._is_started and not self._is_game_over and len(self.players) <= 1:
+                self.log('Only one player left. Game is over.')
 
-        return None
+                # stop the round and send message to last player
+                self._is_game_over = True
+                self.round_condition.notify_all()
+                self.send_message_to_clients('only_one_player')
 
     def increase_asked_question_count(self) -> None:
         """
@@ -298,13 +1121,3 @@ class ServiceController:
         :return: None
         """
         self.asked_question_count += 1
-
-    def restart_game(self) -> None:
-        """
-        Terminate game
-        :return: None
-        """
-        self.layout.game_thread.join(timeout=0.1)
-        self.layout.start_game()
-
-
@@ -0,0 +1,81 @@
+import time
+from typing import Dict, List, Any
+
+
+class ServiceObserver:
+    """
+    Subscriber of the events of a ServiceController, override the events to handle.
+    Events are called from the game and I/O threads of the controller.
+    """
+
+    def add_log(self, log: str) -> None:
+        """
+        Called with every log line of the server
+        :param log: log
+        :return: None
+        """
+
+    def waiting_players(self) -> None:
+        """
+        Called when the server starts waiting for players to join a new game
+        :return: None
+        """
+
+    def game_started(self) -> None:
+        """
+        Called when the game starts
+        :return: None
+        """
+
+    def scores_updated(self, scores: Dict[str, float]) -> None:
+        """
+        Called after the results of a round are sent
+        :param scores: total scores of the players, including the players who left during the game
+        :return: None
+        """
+
+    def player_disconnected(self, player) -> None:
+        """
+        Called from the I/O loop when the connection of a player is found dead
+        :param player: disconnected player, removed by check_connections
+        :return: None
+        """
+
+    def game_finished(self, message: str) -> None:
+        """
+        Called when a game ends, call terminate on the controller to stop the server instead of restarting,
+        or decide when the controller asks for a decision
+        :param message: reason of the end of the game
+        :return: None
+        """
+
+
+class ConsoleObserver(ServiceObserver):
+    """
+    Observer which prints logs to the standard output, used by the headless server directly
+    or as a sink of a LogPipeline
+    """
+
+    def __init__(self):
+        self.log_count = 1
+
+    def add_log(self, log: str) -> None:
+        """
+        Print log with its number and time
+        :param log: log
+        :return: None
+        """
+        print(f'{time.strftime("%H:%M:%S")} {self.log_count} - {log.rstrip()}', flush=True)
+        self.log_count += 1
+
+    def write_events(self, events: List[Any]) -> None:
+        """
+        Print a batch of log events of a LogPipeline with their own time
+        :param events: log events
+        :return: None
+        """
+        lines = []
+        for event in events:
+            lines.append(f'{time.strftime("%H:%M:%S", time.localtime(event.time))} {self.log_count} - {event.message}')
+            self.log_count += 1
+        print('\n'.join(lines), flush=True)
@@ -0,0 +1,191 @@
+import time
+from socket import socket
+from typing import Dict, Tuple, Union, Any, Optional, Callable
+
+from common.protocol import FrameDecoder, Frame, ProtocolError
+from io_loop import IOLoop, TimerHandle
+from metrics import Metrics
+
+LISTEN_BACKLOG = 4096  # connections queued by the kernel before they are accepted, capped by somaxconn
+HANDSHAKE_TIMEOUT = 10.0  # default seconds a client is given to send its join message
+MAX_HANDSHAKES = 8192  # handshakes in progress before the listening socket is paused
+ACCEPT_BATCH = 256  # connections accepted in one wake-up, the loop serves the handshakes between batches
+MAX_JOIN_SIZE = 64 * 1024  # bytes a client may send before its join message is complete
+
+
+class Handshake:
+    # one per connection between accept and the join message, a connect storm creates thousands of them
+    __slots__ = ('client', 'address', 'decoder', 'received', 'size', 'accepted_at', 'timer')
+
+    def __init__(self, client: socket, address: Tuple[str, int], keep_received: bool = False):
+        self.client = client
+        self.address = address
+        self.decoder = FrameDecoder()
+        self.received: Optional[bytearray] = bytearray() if keep_received else None  # raw bytes for a hand-off
+        self.size = 0  # bytes received so far
+        self.accepted_at = time.monotonic()
+        self.timer: Union[TimerHandle, None] = None
+
+
+class Acceptor:
+    def __init__(self, loop: IOLoop, server: socket, on_join: Callable[[Handshake, Frame], Any],
+                 on_log: Callable[[str], Any] = print, timeout: Optional[float] = HANDSHAKE_TIMEOUT,
+                 max_handshakes: int = MAX_HANDSHAKES, max_join_size: int = MAX_JOIN_SIZE,
+                 keep_received: bool = False, metrics: Optional[Metrics] = None):
+        """
+        Initialize the accept path which runs the handshakes of many clients at once on the I/O loop,
+        a slow or silent client only holds its own handshake until it times out
+        :param loop: I/O loop watching the listening socket and the clients
+        :param server: listening socket
+        :param on_join: function called from the loop with the handshake and the join message of a client,
+        it owns the client afterwards, the client is set back to blocking mode before the call
+        :param on_log: function to call with log lines
+        :param timeout: seconds a client is given to send its join message, None to wait forever
+        :param max_handshakes: handshakes in progress before new connections are left in the backlog
+        :param max_join_size: bytes a client may send before its join message is complete
+        :param keep_received: keep the raw bytes received from every client in its handshake
+        :param metrics: counters of the server process, None to not count the connections
+        """
+        self.loop = loop
+        self.server = server
+        self.on_join = on_join
+        self.on_log = on_log
+        self.timeout = timeout
+        self.max_handshakes = max_handshakes
+        self.max_join_size = max_join_size
+        self.keep_received = keep_received
+        self.metrics = metrics
+
+        self.handshakes: Dict[socket, Handshake] = {}
+        self.is_accepting = False  # set by start and pause, the socket is also paused while handshakes are full
+        self._is_listening = False
+
+    def __len__(self) -> int:
+        return len(self.handshakes)
+
+    def start(self) -> None:
+        """
+        Start accepting clients, callable from any thread
+        :return: None
+        """
+        self.server.setblocking(False)
+        self.loop.call_soon(self._set_accepting, True)
+
+    def pause(self) -> None:
+        """
+        Leave new connections in the backlog, the handshakes in progress go on, callable from any thread
+        :return: None
+        """
+        self.loop.call_soon(self._set_accepting, False)
+
+    def close(self) -> None:
+        """
+        Stop accepting and close the clients whose handshake is in progress, called from the loop
+        :return: None
+        """
+        self._set_accepting(False)
+        for handshake in list(self.handshakes.values()):
+            self._drop(handshake)
+
+    def _set_accepting(self, is_accepting: bool) -> None:
+        self.is_accepting = is_accepting
+        self._update_listening()
+
+    def _update_listening(self) -> None:
+        """
+        Watch the listening socket only while clients are accepted and the handshakes are not full
+        :return: None
+        """
+        should_listen = self.is_accepting and len(self.handshakes) < self.max_handshakes
+        if should_listen and not self._is_listening:
+            self.loop.register(self.server, self._accept)
+        elif not should_listen and self._is_listening:
+            self.loop.unregister(self.server)
+        self._is_listening = should_listen
+
+    def _accept(self, mask: int) -> None:
+        """
+        Accept a batch of pending clients and start their handshakes, called by the I/O loop
+        :param mask: ready events
+        :return: None
+        """
+        for _ in range(ACCEPT_BATCH):
+            if len(self.handshakes) >= self.max_handshakes:
+                self._update_listening()
+                return
+
+            try:
+                client, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as error:
+                # out of file descriptors, the connection stays in the backlog
+                self.on_log(f'Accept failed: {error}')
+                return
+
+            if self.metrics is not None:
+                self.metrics.inc('connections')
+
+            client.setblocking(False)
+            handshake = Handshake(client, address, self.keep_received)
+            if self.timeout is not None:
+                handshake.timer = self.loop.call_later(self.timeout, self._expire, handshake)
+            self.handshakes[client] = handshake
+            self.loop.register(client, lambda mask, handshake=handshake: self._read(handshake))
+
+    def _read(self, handshake: Handshake) -> None:
+        """
+        Read the bytes of a client until its join message is complete, called by the I/O loop
+        :param handshake: handshake of the client
+        :return: None
+        """
+        try:
+            data = handshake.client.recv(65536)
+            handshake.decoder.feed(data)
+            frame = handshake.decoder.next_frame()
+        except (BlockingIOError, InterruptedError):
+            return
+        except (OSError, ProtocolError):
+            data, frame = b'', None
+
+        if not data:
+            self.on_log(f'Client {handshake.address} disconnected before sending a name')
+            self._drop(handshake)
+            return
+
+        handshake.size += len(data)
+        if handshake.received is not None:
+            handshake.received += data
+
+        if frame is None:
+            if handshake.size > self.max_join_size:
+                self.on_log(f'Client {handshake.address} sent a join message larger than {self.max_join_size} bytes')
+                self._drop(handshake)
+            return  # wait for the rest of the frame
+
+        self._finish(handshake)
+        handshake.client.setblocking(True)
+        self.on_join(handshake, frame)
+
+    def _expire(self, handshake: Handshake) -> None:
+        if self.handshakes.get(handshake.client) is handshake:
+            if self.metrics is not None:
+                self.metrics.inc('handshake_timeouts')
+            self.on_log(f'Client {handshake.address} did not send a name in {self.timeout:g} s')
+            self._drop(handshake)
+
+    def _finish(self, handshake: Handshake) -> None:
+        """
+        Forget a handshake, its client is not watched by the acceptor any more
+        :param handshake: handshake
+        :return: None
+        """
+        self.handshakes.pop(handshake.client, None)
+        self.loop.unregister(handshake.client)
+        if handshake.timer is not None:
+            handshake.timer.cancel()
+        self._update_listening()
+
+    def _drop(self, handshake: Handshake) -> None:
+        self._finish(handshake)
+        handshake.client.close()
@@ -0,0 +1,254 @@
+import signal
+import sys
+from argparse import ArgumentParser
+from threading import Thread
+from typing import List, Optional, Callable, Any
+
+from controller import ServiceController, ANSWER_TIMEOUT
+from events import ConsoleObserver
+from handshake import HANDSHAKE_TIMEOUT
+from io_loop import IOLoop
+from log_pipeline import LogPipeline, LOG_MAX_BYTES, LOG_BACKUPS
+from scoring import SCORING_RULES
+from broadcast import SLOW_CONSUMER_POLICIES, DELIVERY_MODES
+from metrics import Metrics, MetricsServer, StatsDump, STATS_INTERVAL
+from profiler import SamplingProfiler, PROFILE_ROUNDS, SAMPLE_INTERVAL, SERVER_THREADS, parse_profile_command
+from server import GameServer
+from workers import WorkerPool
+
+
+def parse_arguments(arguments: Optional[List[str]] = None):
+    """
+    Parse command line arguments of the headless server
+    :param arguments: arguments to parse, command line arguments by default
+    :return: parsed arguments
+    """
+    parser = ArgumentParser(prog='python -m service', description='Run the quiz game server without a display')
+    parser.add_argument('--port', type=int, default=5000, help='port to listen')
+    parser.add_argument('--questions', type=int, default=5, help='number of questions in a game')
+    parser.add_argument('--questions-file', default=None, help='path of the questions file or a compiled .qbank bank')
+    parser.add_argument('--min-players', type=int, default=2,
+                        help='start a game once this many players joined')
+    parser.add_argument('--auto-restart', action='store_true',
+                        help='start a new game after a game ends instead of terminating')
+    parser.add_argument('--max-players', type=int, default=None, help='number of players allowed in a game')
+    parser.add_argument('--scoring', choices=SCORING_RULES, default='closest',
+                        help='scoring rule: closest answers share a point, proportional to the distance or top3')
+    parser.add_argument('--answer-timeout', type=float, default=ANSWER_TIMEOUT,
+                        help='seconds given to answer a question, 0 to wait for every player')
+    parser.add_argument('--handshake-timeout', type=float, default=HANDSHAKE_TIMEOUT,
+                        help='seconds a client is given to send its name, 0 to wait forever')
+    parser.add_argument('--no-late-join', dest='late_join', action='store_false',
+                        help='reject the new players of a started game, players with a session token still come back')
+    parser.add_argument('--slow-consumers', choices=SLOW_CONSUMER_POLICIES, default='disconnect',
+                        help='disconnect the players who do not read their messages or drop their messages')
+    parser.add_argument('--delivery', choices=DELIVERY_MODES, default='staged',
+                        help='write each question to every player in one staged pass or to each player in turn')
+    parser.add_argument('--rooms', action='store_true',
+                        help='host many games on the port, clients choose their room when joining')
+    parser.add_argument('--max-rooms', type=int, default=None, help='number of rooms allowed with --rooms')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='host the rooms in this many processes, implies --rooms')
+    parser.add_argument('--leaderboard-interval', type=float, default=30,
+                        help='seconds between two logs of the global leaderboard with --workers')
+    parser.add_argument('--metrics-port', type=int, default=None,
+                        help='serve the metrics in the Prometheus text format on this local port')
+    parser.add_argument('--stats-interval', type=float, default=None,
+                        help=f'log a summary of the metrics every this many seconds, {STATS_INTERVAL:g} by default '
+                             f'with --metrics-port')
+
+    parser.add_argument('--log-file', default=None, help='write the logs to this rotating JSON lines file')
+    parser.add_argument('--log-max-bytes', type=int, default=LOG_MAX_BYTES, help='size of a log file before rotation')
+    parser.add_argument('--log-backups', type=int, default=LOG_BACKUPS, help='number of rotated log files kept')
+
+    parser.add_argument('--profile-dir', default='.',
+                        help='directory of the collapsed stack profiles, toggle profiling with SIGUSR1 '
+                             'or the "profile [start|stop] [rounds]" command on the standard input')
+    parser.add_argument('--profile-rate', type=float, default=1 / SAMPLE_INTERVAL,
+                        help='stack samples per second while profiling')
+    parser.add_argument('--profile-rounds', type=int, default=PROFILE_ROUNDS,
+                        help='rounds covered by a profile started with SIGUSR1, 0 to profile until toggled again')
+
+    args = parser.parse_args(arguments)
+    if args.workers and (args.metrics_port is not None or args.stats_interval):
+        parser.error('metrics are not available with --workers')
+    if args.workers and args.log_file is not None:
+        parser.error('log files are not available with --workers')
+    return args
+
+
+def start_logs(args) -> LogPipeline:
+    """
+    Start the pipeline which prints the logs and writes them to the log file off the game threads
+    :param args: parsed command line arguments
+    :return: started pipeline, stop it after the server
+    """
+    pipeline = LogPipeline(args.log_file, args.log_max_bytes, args.log_backups)
+    pipeline.add_sink(ConsoleObserver().write_events)
+    pipeline.start()
+    return pipeline
+
+
+def start_metrics(args, metrics: Optional[Metrics], loop: IOLoop, on_log: Callable[[str], Any]) -> List[Any]:
+    """
+    Start the endpoint and the periodic dump of the metrics
+    :param args: parsed command line arguments
+    :param metrics: metrics of the server, None if they are disabled
+    :param loop: running I/O loop of the server
+    :param on_log: function to call with the dumps
+    :return: started services, stop them with the server
+    """
+    if metrics is None:
+        return []
+
+    services: List[Any] = [StatsDump(metrics, loop, on_log, args.stats_interval or STATS_INTERVAL)]
+    if args.metrics_port is not None:
+        services.append(MetricsServer(metrics, args.metrics_port))
+        on_log(f'Metrics served on http://localhost:{args.metrics_port}/metrics')
+
+    for service in services:
+        service.start()
+    return services
+
+
+def start_profiler(args, on_log: Callable[[str], Any]) -> SamplingProfiler:
+    """
+    Create the profiler, which stays idle until SIGUSR1 or a profile command on the standard input starts it
+    :param args: parsed command line arguments
+    :param on_log: function to call with the logs of the profiler
+    :return: idle profiler
+    """
+    profiler = SamplingProfiler(1 / args.profile_rate, args.profile_dir, SERVER_THREADS, on_log=on_log)
+    rounds = args.profile_rounds or None
+
+    if hasattr(signal, 'SIGUSR1'):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: profiler.toggle(rounds))
+
+    def read_commands() -> None:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                action, command_rounds = parse_profile_command(line)
+            except ValueError as error:
+                on_log(str(error))
+                continue
+
+            if action == 'stop':
+                profiler.stop()
+            elif action == 'start':
+                profiler.start(command_rounds or rounds)
+            else:
+                profiler.toggle(command_rounds or rounds)
+
+    Thread(target=read_commands, name='commands', daemon=True).start()
+    return profiler
+
+
+def main(arguments: Optional[List[str]] = None) -> None:
+    """
+    Run the server until it is terminated or interrupted
+    :param arguments: command line arguments, sys.argv by default
+    :return: None
+    """
+    args = parse_arguments(arguments)
+
+    if args.workers:
+        run_workers(args)
+        return
+
+    if args.rooms:
+        run_rooms(args)
+        return
+
+    metrics = Metrics() if args.metrics_port is not None or args.stats_interval else None
+    pipeline = start_logs(args)
+    controller = ServiceController(args.port, args.questions, pipeline, auto_restart=args.auto_restart,
+                                   min_players=max(args.min_players, 2), questions_path=args.questions_file,
+                                   max_players=args.max_players, scoring_rule=args.scoring,
+                                   answer_timeout=args.answer_timeout or None,
+                                   slow_consumer_policy=args.slow_consumers, delivery_mode=args.delivery,
+                                   metrics=metrics, handshake_timeout=args.handshake_timeout or None,
+                                   late_join=args.late_join)
+    controller.connect()
+    controller.log(f'Server started on port {args.port}')
+    services = start_metrics(args, metrics, controller.loop, controller.log)
+    controller.subscribe(start_profiler(args, controller.log))
+
+    try:
+        controller.run()
+    except KeyboardInterrupt:
+        controller.terminate()
+    finally:
+        for service in services:
+            service.stop()
+        controller.close()
+        pipeline.stop()
+
+
+def run_rooms(args) -> None:
+    """
+    Run a server hosting many rooms until it is interrupted
+    :param args: parsed command line arguments
+    :return: None
+    """
+    metrics = Metrics() if args.metrics_port is not None or args.stats_interval else None
+    pipeline = start_logs(args)
+    server = GameServer(args.port, args.questions, [pipeline], auto_restart=args.auto_restart,
+                        min_players=max(args.min_players, 2), max_players=args.max_players,
+                        max_rooms=args.max_rooms, questions_path=args.questions_file, scoring_rule=args.scoring,
+                        answer_timeout=args.answer_timeout or None, slow_consumer_policy=args.slow_consumers,
+                        delivery_mode=args.delivery, metrics=metrics,
+                        handshake_timeout=args.handshake_timeout or None, late_join=args.late_join)
+    profiler = start_profiler(args, lambda log: server.log(log))
+    server.on_scores = lambda room, scores: profiler.round_finished()
+    server.connect()
+    server.log(f'Server started on port {args.port}')
+    services = start_metrics(args, metrics, server.loop, server.log)
+
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        server.terminate()
+    finally:
+        for service in services:
+            service.stop()
+        server.close()
+        pipeline.stop()
+
+
+def run_workers(args) -> None:
+    """
+    Run a pool of worker processes hosting the rooms until it is interrupted
+    :param args: parsed command line arguments
+    :return: None
+    """
+    pipeline = start_logs(args)
+    pool = WorkerPool(args.port, args.workers, [pipeline], question_count=args.questions,
+                      auto_restart=args.auto_restart, min_players=max(args.min_players, 2),
+                      max_players=args.max_players, max_rooms=args.max_rooms, questions_path=args.questions_file,
+                      scoring_rule=args.scoring, answer_timeout=args.answer_timeout or None,
+                      slow_consumer_policy=args.slow_consumers, delivery_mode=args.delivery,
+                      handshake_timeout=args.handshake_timeout or None, late_join=args.late_join)
+    pool.connect()
+    pool.log(f'Server started on port {args.port} with {args.workers} workers')
+
+    def log_leaderboard() -> None:
+        best = pool.leaderboard.top(5)
+        if best:
+            pool.log('Leaderboard: ' + ', '.join(f'{name} ({room}) {total:g}' for room, name, total in best))
+        pool.loop.call_later(args.leaderboard_interval, log_leaderboard)
+
+    pool.loop.call_later(args.leaderboard_interval, log_leaderboard)
+
+    try:
+        pool.run()
+    except KeyboardInterrupt:
+        pool.terminate()
+    finally:
+        pool.close()
+        pipeline.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import time
+from typing import Callable, Iterable, Optional, Union, Any
+
+from common.heartbeat import PING_FRAME
+from io_loop import IOLoop, TimerHandle
+from player_model import Player
+
+
+class Heartbeat:
+    def __init__(self, loop: IOLoop, get_players: Callable[[], Iterable[Player]],
+                 on_dead: Callable[[Player], None], send: Callable[[Player, bytes], Any], interval: float,
+                 timeout: Optional[float]):
+        """
+        Initialize the heartbeat which pings every player on the I/O loop
+        :param loop: I/O loop to schedule the pings on
+        :param get_players: function which returns the players to ping
+        :param on_dead: function to call with a player whose connection is dead
+        :param send: function which queues a frame for a player without blocking
+        :param interval: seconds between two pings
+        :param timeout: seconds of silence before a player is considered dead, None to rely on the socket only
+        """
+        self.loop = loop
+        self.get_players = get_players
+        self.on_dead = on_dead
+        self.send = send
+        self.interval = interval
+        self.timeout = timeout
+
+        self._timer: Union[TimerHandle, None] = None
+
+    def start(self) -> None:
+        """
+        Start sending pings
+        :return: None
+        """
+        self._timer = self.loop.call_later(self.interval, self._beat)
+
+    def stop(self) -> None:
+        """
+        Stop sending pings
+        :return: None
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _beat(self) -> None:
+        """
+        Ping every player and report the silent ones, runs in the loop thread
+        :return: None
+        """
+        now = time.monotonic()
+
+        for player in list(self.get_players()):
+            # player did not send anything, not even a pong, for too long
+            if self.timeout is not None and now - player.last_seen > self.timeout:
+                self.on_dead(player)
+                continue
+
+            # queued behind the frames which are not written yet, failures are reported by the sender
+            self.send(player, PING_FRAME)
+
+        self._timer = self.loop.call_later(self.interval, self._beat)
@@ -1,13 +1,23 @@
-import time
+import os
+import sys
+from queue import Queue, Empty
 from tkinter import Tk, Label, Button, Entry, END, messagebox, Text, NORMAL, DISABLED, Frame
-from typing import Union
+from typing import Tuple, Union, Any
 from threading import Thread
 
+# the service modules import the shared protocol from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 from controller import ServiceController
-from message_box import MessageBox
+from events import ServiceObserver
+from log_pipeline import LogPipeline
+
+LOG_POLL_INTERVAL = 100  # milliseconds between two drains of the log batches into the text box
+EVENT_POLL_INTERVAL = 50  # milliseconds between two drains of the controller events
+MAX_SCROLLBACK = 2000  # log lines kept in the text box
 
 
-class ServiceInterface:
+class ServiceInterface(ServiceObserver):
     def __init__(self):
         self.controller: Union[ServiceController, None] = None
 
@@ -18,15 +28,26 @@ class ServiceInterface:
         self.root.resizable(False, False)
         self.log_count = 1
 
+        # logs are written by the pipeline thread into the queue and shown by the Tk main loop
+        self.logs = LogPipeline()
+        self.log_batches: Queue = Queue()
+        self.logs.add_sink(self.log_batches.put)
+
+        # events of the controller are queued by the game thread and handled by the Tk main loop,
+        # the game thread never touches a widget
+        self.events: Queue = Queue()
+
         self.start_server_layout()
 
         self.root.mainloop()
-        self.controller._is_terminated = True
-        self.connection_thread.join()
-        print("Connection thread joined")
+
+        # widgets are destroyed, stop receiving events of the controller
+        self.controller.unsubscribe(self)
+        self.controller.terminate()
         self.game_thread.join()
         print("Game thread joined")
         self.controller.close()
+        self.logs.stop()
         exit(0)
 
     def start_server_layout(self) -> None:
@@ -76,7 +97,8 @@ class ServiceInterface:
             self.question_count = int(self.question_count_entry.get())
 
             # connect server
-            self.controller = ServiceController(self.port_number, self.question_count, self)
+            self.controller = ServiceController(self.port_number, self.question_count, self, end_of_game='ask')
+            self.controller.subscribe(self.logs)
             self.controller.connect()
 
         except ValueError:
@@ -102,8 +124,11 @@ class ServiceInterface:
         # set service layout
         self.service_layout()
 
-        # add log
-        self.add_log("Server started on port " + str(self.port_number))
+        # show logs
+        self.logs.start()
+        self.root.after(LOG_POLL_INTERVAL, self.show_logs)
+        self.root.after(EVENT_POLL_INTERVAL, self.drain_events)
+        self.controller.log("Server started on port " + str(self.port_number))
 
         # start game
         self.start_game()
@@ -127,13 +152,21 @@ class ServiceInterface:
                                         command=self.finish_waiting)
         self.start_game_button.place(relx=0.5, rely=0.9, anchor="center")
 
+        # end of game prompt shown in the window instead of a modal dialog, the game waits for its answer
+        self.prompt = Frame(self.root)
+        self.prompt_label = Label(self.prompt, font=("Arial", 12))
+        self.prompt_label.grid(row=0, column=0, columnspan=2, pady=(0, 5))
+        Button(self.prompt, text="Restart", font=("Arial", 12),
+               command=lambda: self.decide(True)).grid(row=1, column=0, padx=5)
+        Button(self.prompt, text="Terminate", font=("Arial", 12),
+               command=lambda: self.decide(False)).grid(row=1, column=1, padx=5)
+
     def finish_waiting(self):
         """
         Finish waiting for players
         :return:
         """
-        if len(self.controller.players) >= 2:
-            self.controller._is_started = True
+        if self.controller.start_game():
             self.start_game_button.config(state="disabled")
         else:
             messagebox.showerror("Error", "You must have at least 2 players to start the game")
@@ -144,145 +177,111 @@ class ServiceInterface:
         :return: None
         """
 
-        # start waiting for players
-        self.game_thread = Thread(target=self.game)
+        # play games in thread
+        self.game_thread = Thread(target=self.controller.run, name='game')
         self.game_thread.start()
 
-    def game(self):
+    def waiting_players(self) -> None:
         """
-        Thread for game
+        Queue the event, called from the game thread
         :return: None
         """
+        self.events.put(('waiting_players', ()))
 
-        # read questions from file
-        self.controller.read_questions()
-        self.add_log("Questions read from file")
-
-        # check connections in thread
-        self.connection_thread = Thread(target=self.check_connections)
-        self.connection_thread.start()
-
-        while not self.controller._is_terminated:
-
-            self.controller._is_started = False
-            self.controller.asked_question_count = 0
-
-            # activate start game button
-            self.start_game_button.config(state="normal")
-
-            # wait for players
-            self.controller.wait_clients()
-
-            self.add_log("All players connected. Game started\n")
-
-            # send starting message to players
-            self.controller.send_message_to_clients('start')
-
-            # give delay for players
-            time.sleep(1)
-
-            # send questions to players
-            for i in range(self.question_count):
-
-                if len(self.controller.players) <= 1:
-                    break
-
-                answer = self.ask_question(i)
-                self.get_answers(answer)
-                self.send_results(answer)
-
-                if self.controller._is_terminated:
-                    self.connection_thread.join()
-                    return None
-
-            # start new game
-            MessageBox(title="Game Finished", command=self.terminate_game,
-                       message="Game finished. Do you want to terminate the server?")
-
-            if self.controller._is_terminated:
-                self.controller.send_message_to_clients('terminate')
-                self.connection_thread.join()
-                try:
-                    self.add_log("Server terminated")
-                except:
-                    pass
-            else:
-                self.controller.send_message_to_clients('restart')
-                self.add_log("New game started")
-
-        return None
-
-    def check_connections(self):
+    def game_started(self) -> None:
         """
-        Check connections in thread
+        Queue the event, called from the game thread
         :return: None
         """
-        while not self.controller._is_terminated:
-            if self.controller._is_started:
-                self.controller.check_connections()
-
-        return None
+        self.events.put(('game_started', ()))
 
-    def ask_question(self, question_number: int = 0) -> int:
+    def game_finished(self, message: str) -> None:
         """
-        Ask question to all players
-        :return: answer
+        Queue the event, called from the game thread which then waits for decide
+        :param message: reason of the end of the game
+        :return: None
         """
-        question, answer = self.controller.select_question()
-        self.add_log(f'Question {question_number + 1}: {question}, Answer: {answer}')
-
-        # send question to all players
-        self.controller.send_message_to_clients(question)
-        self.add_log("Question sent to all players")
+        self.events.put(('game_finished', (message,)))
 
-        return answer
-
-    def get_answers(self, correct_answer: int) -> None:
+    def drain_events(self) -> None:
         """
-        Get answers from all players
-        :param correct_answer: correct answer of the question
+        Handle the queued events of the controller, runs in the Tk main loop
         :return: None
         """
-        # get answers from all players
-        self.controller.wait_for_answer_from_clients()
-        if not self.controller._is_terminated:
-            self.add_log("Answers received from all players")
+        try:
+            while True:
+                self.handle_event(*self.events.get_nowait())
+        except Empty:
+            pass
 
-            # compare answers
-            self.controller.compare_answers(correct_answer)
-            self.add_log("Answers compared")
+        self.root.after(EVENT_POLL_INTERVAL, self.drain_events)
 
-    def send_results(self, correct_answer: int) -> None:
+    def handle_event(self, event: str, args: Tuple[Any, ...]) -> None:
         """
-        Send results to all players
-        :param correct_answer: correct answer of the question
+        Update the widgets for an event of the controller
+        :param event: name of the event
+        :param args: arguments of the event
         :return: None
         """
-
-        # send results to all players
-        if not self.controller._is_terminated:
-            self.controller.send_results_to_clients(correct_answer)
-            self.add_log("Results sent to all players\n")
-
-    def add_log(self, log: str) -> None:
+        if event == 'waiting_players':
+            # the prompt is still shown when the controller restarted after the decision timeout
+            self.hide_prompt()
+            self.start_game_button.config(state="normal")
+        elif event == 'game_started':
+            self.start_game_button.config(state="disabled")
+        elif event == 'game_finished':
+            message, = args
+            timeout = self.controller.decision_timeout
+            restart = 'restarts' if self.controller.auto_restart else 'terminates'
+            later = f' The server {restart} in {timeout:g} s otherwise.' if timeout is not None else ''
+            self.prompt_label.config(text=f"{message} Restart or terminate the server?{later}")
+            self.start_game_button.place_forget()
+            self.prompt.place(relx=0.5, rely=0.87, anchor="center")
+
+    def decide(self, restart: bool) -> None:
         """
-        Add log to the rich text box
-        :param log: log
+        Answer the end of game prompt
+        :param restart: True to start a new game, False to terminate the server
         :return: None
         """
-        self.outputs.config(state=NORMAL)
-        self.outputs.insert(END, f'{self.log_count} - {log}\n')
-        self.outputs.see(END)
-        self.outputs.config(state=DISABLED)
+        self.hide_prompt()
+        self.controller.decide(restart)
 
-        self.log_count += 1
+    def hide_prompt(self) -> None:
+        """
+        Replace the end of game prompt with the start game button
+        :return: None
+        """
+        self.prompt.place_forget()
+        self.start_game_button.place(relx=0.5, rely=0.9, anchor="center")
 
-    def terminate_game(self) -> None:
+    def show_logs(self) -> None:
         """
-        Terminate game
+        Add the log batches of the pipeline to the rich text box, runs in the Tk main loop
         :return: None
         """
-        self.controller._is_terminated = True
+        lines = []
+        try:
+            while True:
+                for event in self.log_batches.get_nowait():
+                    lines.append(f'{self.log_count} - {event.message}\n')
+                    self.log_count += 1
+        except Empty:
+            pass
+
+        if lines:
+            self.outputs.config(state=NORMAL)
+            self.outputs.insert(END, ''.join(lines))
+
+            # keep the last lines only, the text box would grow without bound on a long running server
+            line_count = int(self.outputs.index('end-1c').split('.')[0])
+            if line_count > MAX_SCROLLBACK:
+                self.outputs.delete('1.0', f'{line_count - MAX_SCROLLBACK + 1}.0')
+
+            self.outputs.see(END)
+            self.outputs.config(state=DISABLED)
+
+        self.root.after(LOG_POLL_INTERVAL, self.show_logs)
 
 
 if __name__ == '__main__':
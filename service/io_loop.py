@@ -0,0 +1,320 @@
+import math
+import selectors
+import time
+import traceback
+from collections import deque
+from socket import socket, socketpair
+from threading import Thread, get_ident
+from typing import Callable, Deque, List, Tuple, Union, Optional, Any
+
+# timer wheel: 4 levels of 256 slots with 10 ms ticks cover about 49 days
+TIMER_RESOLUTION = 0.01
+TIMER_SLOT_BITS = 8
+TIMER_LEVELS = 4
+
+
+class TimerHandle:
+    __slots__ = ('when', 'callback', 'args', 'is_cancelled')
+
+    def __init__(self, when: float, callback: Callable, args: Tuple[Any, ...]):
+        """
+        Initialize a timer scheduled on the I/O loop
+        :param when: monotonic time to run the callback
+        :param callback: function to call
+        :param args: arguments of the function
+        """
+        self.when = when
+        self.callback = callback
+        self.args = args
+        self.is_cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Cancel the timer, the callback will not be called
+        :return: None
+        """
+        self.is_cancelled = True
+
+        # release what the callback holds, the handle stays in the wheel until its slot is reached
+        self.callback = None
+        self.args = ()
+
+
+class TimerWheel:
+    def __init__(self, resolution: float = TIMER_RESOLUTION, slot_bits: int = TIMER_SLOT_BITS,
+                 levels: int = TIMER_LEVELS, start: Optional[float] = None):
+        """
+        Initialize a hierarchical timer wheel, adding and cancelling a timer costs O(1) whatever the number
+        of pending timers, timers far in the future wait in the upper levels and move down as time passes
+        :param resolution: seconds of a tick, timers never run early but may run up to one tick late
+        :param slot_bits: each level has 2 ** slot_bits slots
+        :param levels: number of levels
+        :param start: monotonic time of the first tick, now by default
+        """
+        self.resolution = resolution
+        self.slot_bits = slot_bits
+        self.mask = (1 << slot_bits) - 1
+        self.start = time.monotonic() if start is None else start
+
+        self._tick = 0  # next tick to expire
+        self._count = 0  # timers in the wheel, including the cancelled ones
+        self._levels: List[List[List[TimerHandle]]] = [[[] for _ in range(1 << slot_bits)] for _ in range(levels)]
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, timer: TimerHandle) -> None:
+        """
+        Add a timer to the wheel
+        :param timer: timer to add
+        :return: None
+        """
+        self._count += 1
+        self._place(timer)
+
+    def next_timeout(self, now: float) -> Optional[float]:
+        """
+        Get the seconds until the wheel needs to be advanced, a lower bound of the time of the next timer
+        :param now: monotonic time
+        :return: seconds to wait, None if there is no timer
+        """
+        if not self._count:
+            return None
+
+        # the first busy slot of the lowest level, or the tick which moves timers down from the upper levels
+        lowest = self._levels[0]
+        tick = self._tick
+        if tick & self.mask:
+            end = (tick | self.mask) + 1
+            while tick < end and not lowest[tick & self.mask]:
+                tick += 1
+        return max(0.0, self.start + tick * self.resolution - now)
+
+    def expire(self, now: float) -> List[TimerHandle]:
+        """
+        Advance the wheel and remove the timers which are due
+        :param now: monotonic time
+        :return: due timers, including the cancelled ones
+        """
+        target = math.floor((now - self.start) / self.resolution)
+        lowest = self._levels[0]
+        expired: List[TimerHandle] = []
+
+        while self._tick <= target and self._count:
+            index = self._tick & self.mask
+            if index == 0 and self._tick:
+                self._cascade(1)
+
+            if lowest[index]:
+                timers, lowest[index] = lowest[index], []
+                self._count -= len(timers)
+                expired.extend(timers)
+            self._tick += 1
+
+        # nothing is left to expire, jump to the current tick
+        if not self._count and self._tick <= target:
+            self._tick = target + 1
+        return expired
+
+    def _place(self, timer: TimerHandle) -> None:
+        due = max(math.ceil((timer.when - self.start) / self.resolution), self._tick)
+        delta = due - self._tick
+
+        for level, slots in enumerate(self._levels):
+            shift = self.slot_bits * level
+            if delta < 1 << (shift + self.slot_bits):
+                slots[(due >> shift) & self.mask].append(timer)
+                return
+
+        # beyond the range of the wheel, wait in the last slot of the top level and move down later
+        shift = self.slot_bits * (len(self._levels) - 1)
+        self._levels[-1][((self._tick >> shift) - 1) & self.mask].append(timer)
+
+    def _cascade(self, level: int) -> None:
+        if level >= len(self._levels):
+            return
+
+        index = (self._tick >> (self.slot_bits * level)) & self.mask
+        if index == 0:
+            self._cascade(level + 1)
+
+        slots = self._levels[level]
+        timers, slots[index] = slots[index], []
+        for timer in timers:
+            self._place(timer)
+
+
+class IOLoop:
+    def __init__(self):
+        """
+        Initialize the I/O loop which multiplexes every socket in a single thread
+        """
+        self.selector = selectors.DefaultSelector()
+        self.thread: Union[Thread, None] = None
+
+        # callbacks scheduled from other threads, executed by the loop thread
+        self._callbacks: Deque[Tuple[Callable, Tuple[Any, ...]]] = deque()
+        self._timers: TimerWheel = TimerWheel()
+
+        # socket pair used to wake up the selector when a callback is scheduled
+        self._waker, self._waker_writer = socketpair()
+        self._waker.setblocking(False)
+        self._waker_writer.setblocking(False)
+        self.selector.register(self._waker, selectors.EVENT_READ, self._drain_waker)
+
+        self._is_running = False
+
+    def start(self) -> None:
+        """
+        Start the loop in a background thread
+        :return: None
+        """
+        self._is_running = True
+        self.thread = Thread(target=self.run, name='io-loop', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the loop and wait for its thread to finish
+        :return: None
+        """
+        self._is_running = False
+        self._wake()
+
+        if self.thread is not None and not self.in_loop_thread():
+            self.thread.join()
+
+    def in_loop_thread(self) -> bool:
+        """
+        Check if the caller runs in the loop thread
+        :return: True if called from the loop thread, False otherwise
+        """
+        return self.thread is not None and self.thread.ident == get_ident()
+
+    def call_soon(self, callback: Callable, *args: Any) -> None:
+        """
+        Schedule a callback to run in the loop thread, safe to call from any thread
+        :param callback: function to call
+        :param args: arguments of the function
+        :return: None
+        """
+        self._callbacks.append((callback, args))
+        if not self.in_loop_thread():
+            self._wake()
+
+    def call_later(self, delay: float, callback: Callable, *args: Any) -> TimerHandle:
+        """
+        Schedule a callback to run in the loop thread after a delay, safe to call from any thread
+        :param delay: seconds to wait
+        :param callback: function to call
+        :param args: arguments of the function
+        :return: handle to cancel the timer
+        """
+        timer = TimerHandle(time.monotonic() + delay, callback, args)
+        if self.in_loop_thread():
+            self._timers.add(timer)
+        else:
+            self.call_soon(self._timers.add, timer)
+        return timer
+
+    def register(self, sock: socket, callback: Callable[[int], None], events: int = selectors.EVENT_READ) -> None:
+        """
+        Register a socket, the callback is called with the ready event mask
+        :param sock: socket to watch
+        :param callback: function to call when the socket is ready
+        :param events: events to watch
+        :return: None
+        """
+        if self.in_loop_thread():
+            self._register(sock, callback, events)
+        else:
+            self.call_soon(self._register, sock, callback, events)
+
+    def unregister(self, sock: socket) -> None:
+        """
+        Stop watching a socket
+        :param sock: socket to forget
+        :return: None
+        """
+        if self.in_loop_thread():
+            self._unregister(sock)
+        else:
+            self.call_soon(self._unregister, sock)
+
+    def modify(self, sock: socket, events: int) -> None:
+        """
+        Change the events watched on a registered socket, the callback stays the same
+        :param sock: registered socket
+        :param events: events to watch
+        :return: None
+        """
+        if self.in_loop_thread():
+            self._modify(sock, events)
+        else:
+            self.call_soon(self._modify, sock, events)
+
+    def run(self) -> None:
+        """
+        Run the loop until it is stopped
+        :return: None
+        """
+        while self._is_running:
+            # sleep until a socket is ready or the next timer is due
+            timeout = self._timers.next_timeout(time.monotonic())
+
+            for key, mask in self.selector.select(timeout):
+                self._run_callback(key.data, (mask,))
+
+            # run due timers
+            for timer in self._timers.expire(time.monotonic()):
+                if not timer.is_cancelled:
+                    self._run_callback(timer.callback, timer.args)
+
+            # run callbacks scheduled by other threads
+            while self._callbacks:
+                callback, args = self._callbacks.popleft()
+                self._run_callback(callback, args)
+
+        self.selector.close()
+        self._waker.close()
+        self._waker_writer.close()
+
+    def _register(self, sock: socket, callback: Callable[[int], None], events: int) -> None:
+        try:
+            self.selector.register(sock, events, callback)
+        except KeyError:
+            self.selector.modify(sock, events, callback)
+        except ValueError:
+            pass  # socket is already closed
+
+    def _modify(self, sock: socket, events: int) -> None:
+        try:
+            self.selector.modify(sock, events, self.selector.get_key(sock).data)
+        except (KeyError, ValueError):
+            pass  # socket is unregistered or closed
+
+    def _unregister(self, sock: socket) -> None:
+        try:
+            self.selector.unregister(sock)
+        except (KeyError, ValueError):
+            pass
+
+    def _wake(self) -> None:
+        try:
+            self._waker_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass  # loop is already awake or closed
+
+    def _drain_waker(self, mask: int) -> None:
+        try:
+            while self._waker.recv(4096):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    @staticmethod
+    def _run_callback(callback: Callable, args: Tuple[Any, ...]) -> None:
+        try:
+            callback(*args)
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,187 @@
+import random
+from typing import Dict, List, Tuple, Union
+
+DEFAULT_TOP_COUNT = 10  # number of players sent with the results of a round
+
+Key = Tuple[float, str]  # negated total and name, the best player has the smallest key
+
+
+class _Node:
+    __slots__ = ('key', 'priority', 'size', 'left', 'right')
+
+    def __init__(self, key: Key):
+        self.key: Key = key
+        self.priority: float = random.random()
+        self.size: int = 1
+        self.left: Union['_Node', None] = None
+        self.right: Union['_Node', None] = None
+
+    def update(self) -> None:
+        self.size = 1 + _size(self.left) + _size(self.right)
+
+
+def _size(node: Union[_Node, None]) -> int:
+    return node.size if node is not None else 0
+
+
+def _split(node: Union[_Node, None], key: Key) -> Tuple[Union[_Node, None], Union[_Node, None]]:
+    """
+    Split a tree into the keys smaller than the given key and the others
+    :param node: root of the tree
+    :param key: key to split at
+    :return: roots of the two trees
+    """
+    if node is None:
+        return None, None
+
+    if node.key < key:
+        node.right, right = _split(node.right, key)
+        node.update()
+        return node, right
+
+    left, node.left = _split(node.left, key)
+    node.update()
+    return left, node
+
+
+def _merge(left: Union[_Node, None], right: Union[_Node, None]) -> Union[_Node, None]:
+    """
+    Merge two trees, every key of the left tree is smaller than the keys of the right tree
+    :param left: root of the left tree
+    :param right: root of the right tree
+    :return: root of the merged tree
+    """
+    if left is None:
+        return right
+    if right is None:
+        return left
+
+    if left.priority > right.priority:
+        left.right = _merge(left.right, right)
+        left.update()
+        return left
+
+    right.left = _merge(left, right.left)
+    right.update()
+    return right
+
+
+class Leaderboard:
+    def __init__(self):
+        """
+        Initialize the leaderboard which keeps players ordered by total score, it is an order statistic treap
+        so that updating a total, finding the rank of a player and reading the best players cost O(log n)
+        """
+        self._root: Union[_Node, None] = None
+        self._totals: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._totals
+
+    def update(self, name: str, total: float) -> None:
+        """
+        Set the total score of a player, the player is added if it is not on the leaderboard
+        :param name: name of the player
+        :param total: total score of the player
+        :return: None
+        """
+        if self._totals.get(name) == total:
+            return
+
+        self.remove(name)
+        self._totals[name] = total
+
+        left, right = _split(self._root, (-total, name))
+        self._root = _merge(_merge(left, _Node((-total, name))), right)
+
+    def remove(self, name: str) -> None:
+        """
+        Remove a player from the leaderboard
+        :param name: name of the player
+        :return: None
+        """
+        total = self._totals.pop(name, None)
+        if total is None:
+            return
+
+        key = (-total, name)
+        left, right = _split(self._root, key)
+        # the smallest key of the right tree is the key of the player
+        right = self._remove_first(right)
+        self._root = _merge(left, right)
+
+    def clear(self) -> None:
+        """
+        Remove every player
+        :return: None
+        """
+        self._root = None
+        self._totals = {}
+
+    def total(self, name: str) -> float:
+        """
+        Get the total score of a player
+        :param name: name of the player
+        :return: total score
+        """
+        return self._totals[name]
+
+    def rank(self, name: str) -> int:
+        """
+        Get the rank of a player, players with the same total share the same rank
+        :param name: name of the player
+        :return: 1 for the best players
+        """
+        # count the players with a greater total, the empty name is smaller than every name
+        key = (-self._totals[name], '')
+        node, rank = self._root, 1
+        while node is not None:
+            if node.key < key:
+                rank += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+    def top(self, count: int = DEFAULT_TOP_COUNT) -> List[Tuple[str, float]]:
+        """
+        Get the best players
+        :param count: number of players
+        :return: name and total score of the players, best first
+        """
+        result: List[Tuple[str, float]] = []
+        stack: List[_Node] = []
+        node = self._root
+
+        # in-order walk which stops after count nodes
+        while (stack or node is not None) and len(result) < count:
+            if node is not None:
+                stack.append(node)
+                node = node.left
+            else:
+                node = stack.pop()
+                result.append((node.key[1], -node.key[0]))
+                node = node.right
+        return result
+
+    @staticmethod
+    def _remove_first(node: Union[_Node, None]) -> Union[_Node, None]:
+        """
+        Remove the smallest key of a tree
+        :param node: root of the tree
+        :return: root of the tree without its smallest key
+        """
+        if node is None:
+            return None
+        if node.left is None:
+            return node.right
+
+        root, parent = node, None
+        while node.left is not None:
+            node.size -= 1
+            parent, node = node, node.left
+        parent.left = node.right
+        return root
@@ -0,0 +1,185 @@
+import os
+import time
+from collections import deque
+from json import dumps
+from threading import Thread, Event, current_thread
+from typing import List, Union, Any, Optional, Callable, NamedTuple
+
+from events import ServiceObserver
+
+RING_CAPACITY = 65536  # events buffered before the oldest ones are dropped
+BATCH_SIZE = 1024  # events handed to the sinks at once
+FLUSH_INTERVAL = 0.1  # seconds between two flushes of the buffer
+LOG_MAX_BYTES = 16 * 1024 * 1024  # size of a log file before it is rotated
+LOG_BACKUPS = 5  # number of rotated log files kept
+
+
+class LogEvent(NamedTuple):
+    time: float  # seconds since the epoch
+    thread: str  # thread which produced the event
+    level: str
+    message: str
+
+    def to_json(self) -> str:
+        return dumps({'time': round(self.time, 6), 'thread': self.thread, 'level': self.level,
+                      'message': self.message})
+
+
+class RotatingWriter:
+    def __init__(self, path: str, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS):
+        """
+        Initialize a file writer which renames a full file to path.1, path.1 to path.2 and so on
+        :param path: path of the current file
+        :param max_bytes: size of a file before it is rotated
+        :param backups: number of rotated files kept
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.file = open(path, 'a', encoding='utf-8')
+        self.size = self.file.tell()
+
+    def write(self, lines: List[str]) -> None:
+        """
+        Append lines and rotate the file once it is full, a batch is never split across files
+        :param lines: lines without line breaks
+        :return: None
+        """
+        text = '\n'.join(lines) + '\n'
+        self.file.write(text)
+        self.file.flush()
+        self.size += len(text.encode())
+
+        if self.size >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self) -> None:
+        """
+        Start a new file, the oldest rotated file is removed
+        :return: None
+        """
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f'{self.path}.{index}'):
+                os.replace(f'{self.path}.{index}', f'{self.path}.{index + 1}')
+        if self.backups:
+            os.replace(self.path, f'{self.path}.1')
+        else:
+            os.remove(self.path)
+
+        self.file = open(self.path, 'a', encoding='utf-8')
+        self.size = 0
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class LogPipeline(ServiceObserver):
+    def __init__(self, path: Optional[str] = None, max_bytes: int = LOG_MAX_BYTES, backups: int = LOG_BACKUPS,
+                 capacity: int = RING_CAPACITY, batch_size: int = BATCH_SIZE,
+                 flush_interval: float = FLUSH_INTERVAL):
+        """
+        Initialize the logging pipeline, producers append events to a bounded ring buffer which never blocks
+        and a background thread writes them in batches to a rotating JSON lines file and to the sinks
+        :param path: path of the JSON lines file, None to only call the sinks
+        :param max_bytes: size of the file before it is rotated
+        :param backups: number of rotated files kept
+        :param capacity: events buffered before the oldest ones are dropped
+        :param batch_size: events handed to the sinks at once
+        :param flush_interval: seconds between two flushes
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # deque appends and pops are atomic, a full buffer drops its oldest event instead of blocking
+        self.buffer: deque = deque(maxlen=capacity)
+        self.sinks: List[Callable[[List[LogEvent]], Any]] = []
+        self.writer: Union[RotatingWriter, None] = None
+        self.thread: Union[Thread, None] = None
+        self.stopped = Event()
+
+        # events overwritten in the full buffer, counted without a lock so the count is approximate
+        self.dropped = 0
+        self._reported_drops = 0
+
+    def add_sink(self, sink: Callable[[List[LogEvent]], Any]) -> None:
+        """
+        Add a function called from the consumer thread with every batch of events
+        :param sink: function taking a list of events, it must not block for long
+        :return: None
+        """
+        self.sinks.append(sink)
+
+    def push(self, message: str, level: str = 'info') -> None:
+        """
+        Add an event to the buffer, callable from any thread
+        :param message: message of the event
+        :param level: level of the event
+        :return: None
+        """
+        if len(self.buffer) == self.buffer.maxlen:
+            self.dropped += 1
+        self.buffer.append(LogEvent(time.time(), current_thread().name, level, message))
+
+    def add_log(self, log: str) -> None:
+        """
+        Buffer a log line of the server
+        :param log: log
+        :return: None
+        """
+        self.push(log.rstrip())
+
+    def start(self) -> None:
+        """
+        Open the log file and start the consumer thread
+        :return: None
+        """
+        if self.path is not None:
+            self.writer = RotatingWriter(self.path, self.max_bytes, self.backups)
+        self.thread = Thread(target=self._run, name='log-pipeline', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Write the buffered events and stop the consumer thread
+        :return: None
+        """
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def flush(self) -> None:
+        """
+        Hand every buffered event to the file and the sinks in batches, called from the consumer thread
+        :return: None
+        """
+        while self.buffer:
+            batch = []
+            while self.buffer and len(batch) < self.batch_size:
+                batch.append(self.buffer.popleft())
+
+            dropped = self.dropped - self._reported_drops
+            if dropped > 0:
+                self._reported_drops += dropped
+                batch.append(LogEvent(time.time(), current_thread().name, 'warning',
+                                      f'{dropped} log event(s) dropped'))
+
+            if self.writer is not None:
+                try:
+                    self.writer.write([event.to_json() for event in batch])
+                except OSError as error:
+                    print(f'Log file {self.path} is not writable: {error}')
+                    self.writer = None
+
+            for sink in self.sinks:
+                sink(batch)
+
+    def _run(self) -> None:
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
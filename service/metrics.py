@@ -0,0 +1,314 @@
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from typing import Dict, List, Tuple, Union, Any, Optional, Callable, Sequence
+
+from io_loop import IOLoop, TimerHandle
+
+# upper bounds of the latency buckets in seconds, from half a millisecond to a minute
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+STATS_INTERVAL = 60.0  # default seconds between two stats dumps
+
+# controller methods timed once metrics are enabled, with the histogram of each
+TIMED_METHODS = {
+    'wait_clients': 'wait_clients',
+    'wait_for_answer_from_clients': 'answer_wait',
+    'compare_answers': 'scoring',
+    'send_results_to_clients': 'broadcast',
+    'send_question_to_clients': 'question_broadcast',
+}
+
+COUNTERS = {
+    'connections': 'TCP connections accepted',
+    'accepts': 'players who joined a game',
+    'handshake_timeouts': 'clients dropped before sending their join message in time',
+    'rejects': 'clients rejected with a reason',
+    'resumes': 'players who came back with their session token',
+    'rounds': 'rounds opened',
+    'bytes_in': 'bytes received from the players',
+    'bytes_out': 'bytes written to the players',
+    'heartbeat_failures': 'players dropped after a heartbeat timeout',
+}
+
+HISTOGRAMS = {
+    'accept_latency': 'seconds from accepting a connection to the player joining',
+    'answer_latency': 'seconds from sending a question to a player to receiving its answer',
+    'question_spread': 'seconds between the first and the last player getting a question',
+    'wait_clients': 'seconds spent waiting for the players of a game',
+    'answer_wait': 'seconds spent waiting for the answers of a round',
+    'scoring': 'seconds spent scoring a round',
+    'broadcast': 'seconds spent sending the results of a round',
+    'question_broadcast': 'seconds spent sending a question',
+}
+
+
+class Counter:
+    __slots__ = ('value', '_lock')
+
+    def __init__(self):
+        self.value = 0
+        self._lock = Lock()
+
+    def inc(self, amount: int = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    __slots__ = ('bounds', 'counts', 'sum', 'count', '_lock')
+
+    def __init__(self, bounds: Sequence[float] = LATENCY_BUCKETS):
+        """
+        Initialize a histogram with fixed buckets, the last bucket holds the values above every bound
+        :param bounds: upper bounds of the buckets, increasing
+        """
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = Lock()
+
+    def observe(self, value: float) -> None:
+        """
+        Add a value to its bucket
+        :param value: value
+        :return: None
+        """
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        """
+        Get the number of values at or below every bound
+        :return: bound and count pairs, the last bound is infinity
+        """
+        with self._lock:
+            counts = list(self.counts)
+
+        result, total = [], 0
+        for bound, count in zip(self.bounds + (float('inf'),), counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def quantile(self, rank: float) -> Optional[float]:
+        """
+        Estimate a quantile by interpolating inside its bucket like histogram_quantile of Prometheus
+        :param rank: quantile between 0 and 1
+        :return: estimated value, None if the histogram is empty
+        """
+        buckets = self.cumulative()
+        total = buckets[-1][1]
+        if not total:
+            return None
+
+        target = rank * total
+        lower, below = 0.0, 0
+        for bound, count in buckets:
+            if count >= target:
+                # values above the last bound are reported as the last bound
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * (target - below) / max(count - below, 1)
+            lower, below = bound, count
+        return lower
+
+
+class Metrics:
+    def __init__(self, prefix: str = 'quiz'):
+        """
+        Initialize the counters and histograms of a server process, shared by every controller of the process
+        :param prefix: prefix of the exported metric names
+        """
+        self.prefix = prefix
+        self.started_at = time.time()
+        self.counters: Dict[str, Counter] = {name: Counter() for name in COUNTERS}
+        self.histograms: Dict[str, Histogram] = {name: Histogram() for name in HISTOGRAMS}
+        self.gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def inc(self, name: str, amount: int = 1) -> None:
+        """
+        Increase a counter
+        :param name: name of the counter, a key of COUNTERS
+        :param amount: amount to add
+        :return: None
+        """
+        self.counters[name].inc(amount)
+
+    def observe(self, name: str, value: float) -> None:
+        """
+        Add a value to a histogram
+        :param name: name of the histogram, a key of HISTOGRAMS
+        :param value: value in seconds
+        :return: None
+        """
+        self.histograms[name].observe(value)
+
+    def gauge(self, name: str, description: str, read: Callable[[], float]) -> None:
+        """
+        Export a value read when the metrics are rendered
+        :param name: name of the gauge
+        :param description: help text of the gauge
+        :param read: function returning the current value
+        :return: None
+        """
+        self.gauges[name] = (description, read)
+
+    def instrument(self, controller: Any) -> None:
+        """
+        Time the hot methods of a controller, the methods are replaced on the instance only
+        so that a controller without metrics runs the plain methods
+        :param controller: ServiceController
+        :return: None
+        """
+        for method, histogram in TIMED_METHODS.items():
+            setattr(controller, method, self.timed(getattr(controller, method), self.histograms[histogram]))
+
+    @staticmethod
+    def timed(function: Callable, histogram: Histogram) -> Callable:
+        """
+        Wrap a function to observe its duration
+        :param function: function to time
+        :param histogram: histogram of the durations
+        :return: wrapped function
+        """
+        @wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started)
+
+        return wrapper
+
+    def render(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format
+        :return: exposition text
+        """
+        lines: List[str] = []
+
+        for name, counter in self.counters.items():
+            full_name = f'{self.prefix}_{name}_total'
+            lines.append(f'# HELP {full_name} {COUNTERS[name]}')
+            lines.append(f'# TYPE {full_name} counter')
+            lines.append(f'{full_name} {counter.value}')
+
+        for name, (description, read) in self.gauges.items():
+            full_name = f'{self.prefix}_{name}'
+            lines.append(f'# HELP {full_name} {description}')
+            lines.append(f'# TYPE {full_name} gauge')
+            lines.append(f'{full_name} {read():g}')
+
+        for name, histogram in self.histograms.items():
+            full_name = f'{self.prefix}_{name}_seconds'
+            lines.append(f'# HELP {full_name} {HISTOGRAMS[name]}')
+            lines.append(f'# TYPE {full_name} histogram')
+            for bound, count in histogram.cumulative():
+                label = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{full_name}_bucket{{le="{label}"}} {count}')
+            lines.append(f'{full_name}_sum {histogram.sum:.9g}')
+            lines.append(f'{full_name}_count {histogram.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """
+        Summarize the metrics in one log line
+        :return: counters, gauges and the median and 99th percentile of the histograms which have values
+        """
+        parts = [f'{name} {counter.value}' for name, counter in self.counters.items()]
+        parts.extend(f'{name} {read():g}' for name, (_, read) in self.gauges.items())
+
+        for name, histogram in self.histograms.items():
+            if histogram.count:
+                parts.append(f'{name} p50 {histogram.quantile(0.5) * 1000:.2f} ms '
+                             f'p99 {histogram.quantile(0.99) * 1000:.2f} ms')
+        return 'Stats: ' + ', '.join(parts)
+
+
+class MetricsServer:
+    def __init__(self, metrics: Metrics, port: int, host: str = 'localhost'):
+        """
+        Initialize the HTTP endpoint serving the metrics at /metrics in the Prometheus text format
+        :param metrics: metrics to serve
+        :param port: port to listen
+        :param host: address to listen, local only by default
+        """
+        self.metrics = metrics
+        self.port = port
+        self.host = host
+        self.server: Union[ThreadingHTTPServer, None] = None
+        self.thread: Union[Thread, None] = None
+
+    def start(self) -> None:
+        """
+        Listen and serve the requests in a daemon thread
+        :return: None
+        """
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass  # scrapes are not logged
+
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.thread = Thread(target=self.server.serve_forever, name='metrics-http', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop serving
+        :return: None
+        """
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+class StatsDump:
+    def __init__(self, metrics: Metrics, loop: IOLoop, on_log: Callable[[str], Any],
+                 interval: float = STATS_INTERVAL):
+        """
+        Initialize the periodic log of the metrics summary on the I/O loop
+        :param metrics: metrics to summarize
+        :param loop: I/O loop to schedule the dumps on
+        :param on_log: function to call with the summary
+        :param interval: seconds between two dumps
+        """
+        self.metrics = metrics
+        self.loop = loop
+        self.on_log = on_log
+        self.interval = interval
+        self._timer: Union[TimerHandle, None] = None
+
+    def start(self) -> None:
+        self._timer = self.loop.call_later(self.interval, self._dump)
+
+    def stop(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _dump(self) -> None:
+        self.on_log(self.metrics.summary())
+        self._timer = self.loop.call_later(self.interval, self._dump)
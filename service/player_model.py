@@ -1,12 +1,46 @@
-from socket import socket
-from typing import Tuple
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+from socket import socket, socketpair
+from threading import Lock
+from typing import Tuple, List, Iterator, Union, NamedTuple, Optional, Callable, Any
+
+from common.protocol import FrameDecoder, Frame, encode_text
+
+DEFAULT_ARCHIVE_SIZE = 1024  # number of removed players remembered by a controller
+
+
+class PlayerRecord(NamedTuple):
+    # what is kept of a removed player once its connection is closed
+    name: str
+    address: Tuple[str, int]
+    total: float
+    removed_at: float
+    token: Optional[str]  # session token which lets the player come back
 
 
 class Player:
-    def __init__(self, name: str, client: socket, address: Tuple[str, int]):
+    # no per-instance __dict__, a room may hold tens of thousands of players
+    __slots__ = ('name', 'client', 'address', 'decoder', 'token', 'sender', 'send_lock', 'outbound',
+                 'outbound_size', 'is_write_watched', 'last_seen', 'total', 'score', 'answer')
+
+    def __init__(self, name: str, client: socket, address: Tuple[str, int],
+                 decoder: Union[FrameDecoder, None] = None, token: Optional[str] = None,
+                 sender: Optional[Callable[..., Any]] = None):
         self.name = name
         self.client = client
         self.address = address
+        self.decoder = decoder if decoder is not None else FrameDecoder()
+        self.token = token  # session token given to the client, sent back to resume the player
+        self.sender = sender  # Broadcaster.send of the controller owning the player
+
+        # buffers waiting for the socket to be writable, written by the broadcaster with send_lock held
+        self.send_lock = Lock()
+        self.outbound: List[Union[bytes, memoryview]] = []
+        self.outbound_size = 0
+        self.is_write_watched = False
+        self.last_seen = time.monotonic()  # last time anything is received from the client
 
         self.total = 0
         self.score = 0
@@ -15,20 +49,25 @@ class Player:
     def __str__(self):
         return self.name
 
-    def send(self, message: str) -> None:
+    def send(self, message: str) -> bool:
         """
-        Send a message to the client
-        :param message:
-        :return: None
+        Queue a text message for the client, it is written without blocking by the broadcaster
+        :param message: message to send
+        :return: False if the message is dropped or the player is disconnected, True otherwise
         """
-        self.client.send(message.encode())
+        if self.sender is None:
+            raise RuntimeError(f'Player {self.name} is not attached to a controller')
+        return self.sender(self, encode_text(message))
 
-    def receive(self) -> str:
+    def feed(self, data: bytes) -> Iterator[Frame]:
         """
-        Receive a message from the client
-        :return: received message
+        Decode bytes read from the client socket by the I/O loop
+        :param data: received bytes
+        :return: iterator of complete frames
         """
-        return self.client.recv(1024).decode()
+        self.last_seen = time.monotonic()
+        self.decoder.feed(data)
+        return self.decoder.frames()
 
     def close(self) -> None:
         """
@@ -36,3 +75,99 @@ class Player:
         :return: None
         """
         self.client.close()
+
+    def archive(self) -> PlayerRecord:
+        """
+        Get the record kept after the player is removed
+        :return: record of the player
+        """
+        return PlayerRecord(self.name, self.address, self.total, time.monotonic(), self.token)
+
+
+class PlayerArchive:
+    def __init__(self, size: int = DEFAULT_ARCHIVE_SIZE):
+        """
+        Initialize the archive of the recently removed players, the oldest records are dropped
+        once the archive is full so that memory does not grow with the churn of players
+        :param size: number of records to keep
+        """
+        self.size = size
+        self._records: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._records
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def add(self, player: Player) -> PlayerRecord:
+        """
+        Archive a removed player
+        :param player: removed player
+        :return: record of the player
+        """
+        record = player.archive()
+        self._records.pop(player.name, None)
+        self._records[player.name] = record
+
+        while len(self._records) > self.size:
+            self._records.popitem(last=False)
+        return record
+
+    def get(self, name: str) -> Optional[PlayerRecord]:
+        """
+        Get the record of a removed player
+        :param name: name of the player
+        :return: record, None if the player is not archived
+        """
+        return self._records.get(name)
+
+    def pop(self, name: str) -> Optional[PlayerRecord]:
+        """
+        Remove the record of a player who comes back
+        :param name: name of the player
+        :return: record, None if the player is not archived
+        """
+        return self._records.pop(name, None)
+
+    def values(self) -> Iterator[PlayerRecord]:
+        return iter(self._records.values())
+
+    def clear(self) -> None:
+        """
+        Forget every removed player
+        :return: None
+        """
+        self._records.clear()
+
+
+def measure_player_memory(count: int = 10000) -> Tuple[float, int]:
+    """
+    Measure the memory used by the players of a room, sockets share one connection so that only
+    the Python side of each connection is measured, kernel buffers of the sockets are not included
+    :param count: number of players to create
+    :return: bytes allocated per player and size of a socket object
+    """
+    server_side, client_side = socketpair()
+    try:
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        players = {f'player-{index}': Player(f'player-{index}', server_side, ('127.0.0.1', 50000 + index % 10000))
+                   for index in range(count)}
+        after = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+
+        allocated = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+        del players
+        return allocated / count, sys.getsizeof(server_side)
+    finally:
+        server_side.close()
+        client_side.close()
+
+
+if __name__ == '__main__':
+    per_player, socket_size = measure_player_memory(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
+    print(f'{per_player:.0f} bytes per player, {socket_size} bytes per socket object')
@@ -0,0 +1,195 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from threading import Thread, Event, RLock
+from typing import Dict, List, Tuple, Union, Any, Optional, Callable, Iterable
+
+SAMPLE_INTERVAL = 0.005  # seconds between two samples, 200 Hz
+MAX_STACKS = 10000  # distinct stacks kept, later stacks are counted as truncated
+MAX_DEPTH = 64  # frames kept from the innermost frame of a stack
+PROFILE_ROUNDS = 5  # default number of rounds covered by a profile
+TRUNCATED_STACK = '[truncated]'
+# threads running the game and the I/O loop with the heartbeat
+SERVER_THREADS = ('MainThread', 'game', 'io-loop')
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = SAMPLE_INTERVAL, output_dir: str = '.',
+                 thread_names: Optional[Iterable[str]] = None, max_stacks: int = MAX_STACKS,
+                 max_depth: int = MAX_DEPTH, on_log: Callable[[str], Any] = print):
+        """
+        Initialize the profiler which samples the stacks of the server threads from its own thread while it runs,
+        nothing runs and nothing is recorded while it is stopped
+        :param interval: seconds between two samples
+        :param output_dir: directory of the collapsed stack files, one file per profile
+        :param thread_names: names of the threads to sample, every thread but the profiler by default
+        :param max_stacks: distinct stacks kept in memory, later stacks are counted as truncated
+        :param max_depth: frames kept from the innermost frame of a stack
+        :param on_log: function to call with log lines
+        """
+        self.interval = interval
+        self.output_dir = output_dir
+        self.thread_names = set(thread_names) if thread_names is not None else None
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.on_log = on_log
+
+        self.stacks: Counter = Counter()
+        self.sample_count = 0
+        self.rounds_left: Optional[int] = None  # rounds before the profile is exported, None to run until stopped
+        self.thread: Union[Thread, None] = None
+        self._stopped = Event()
+        self._lock = RLock()  # reentrant, a signal handler may interrupt the thread holding it
+        self._labels: Dict[Any, str] = {}  # frame labels by code object, built once per function
+
+    @property
+    def is_running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive() and not self._stopped.is_set()
+
+    def start(self, rounds: Optional[int] = None) -> bool:
+        """
+        Start sampling
+        :param rounds: number of rounds to cover before exporting the profile, None to sample until stop
+        :return: False if the profiler is already running
+        """
+        with self._lock:
+            if self.is_running:
+                return False
+
+            self.stacks = Counter()
+            self.sample_count = 0
+            self.rounds_left = rounds
+            self._stopped = Event()
+            self.thread = Thread(target=self._run, args=(self._stopped,), name='profiler', daemon=True)
+            self.thread.start()
+
+        covered = f'the next {rounds} round(s)' if rounds else 'until it is stopped'
+        self.on_log(f'Profiling {covered} at {1 / self.interval:g} Hz')
+        return True
+
+    def stop(self) -> bool:
+        """
+        Stop sampling, the profile is exported by the sampling thread as it exits
+        :return: False if the profiler is not running
+        """
+        with self._lock:
+            if not self.is_running:
+                return False
+            self._stopped.set()
+            return True
+
+    def toggle(self, rounds: Optional[int] = None) -> None:
+        """
+        Stop the profiler if it runs, start it otherwise, used by signals and control commands
+        :param rounds: rounds to cover when the profiler is started
+        :return: None
+        """
+        if not self.stop():
+            self.start(rounds)
+
+    def round_finished(self) -> None:
+        """
+        Count a finished round, the profile is exported after the requested number of rounds
+        :return: None
+        """
+        if self.rounds_left is None or not self.is_running:
+            return
+
+        self.rounds_left -= 1
+        if self.rounds_left <= 0:
+            self.stop()
+
+    def scores_updated(self, scores: Dict[str, float]) -> None:
+        """
+        Observer event of a controller called at the end of every round
+        :param scores: total scores of the players
+        :return: None
+        """
+        self.round_finished()
+
+    def sample(self) -> None:
+        """
+        Record the current stack of every sampled thread
+        :return: None
+        """
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        own = threading.get_ident()
+
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, str(ident))
+            if ident == own or (self.thread_names is not None and name not in self.thread_names):
+                continue
+
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(self._label(frame.f_code))
+                frame = frame.f_back
+            labels.append(name.replace(';', ':'))
+            stack = ';'.join(reversed(labels))
+
+            # the number of distinct stacks is bounded, the samples of new stacks are still counted
+            if stack not in self.stacks and len(self.stacks) >= self.max_stacks:
+                stack = f'{name};{TRUNCATED_STACK}'
+            self.stacks[stack] += 1
+
+        self.sample_count += 1
+
+    def collapsed(self) -> List[str]:
+        """
+        Get the profile in the collapsed stack format read by flamegraph.pl, speedscope and similar tools
+        :return: lines of semicolon separated frames, outermost first, followed by the sample count
+        """
+        return [f'{stack} {count}' for stack, count in self.stacks.most_common()]
+
+    def export(self, path: Optional[str] = None) -> str:
+        """
+        Write the collapsed stacks to a file
+        :param path: path of the file, a timestamped file in the output directory by default
+        :return: path of the file
+        """
+        if path is None:
+            path = os.path.join(self.output_dir, time.strftime('profile-%Y%m%d-%H%M%S.folded'))
+
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(self.collapsed()) + '\n')
+        return path
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # semicolons separate the frames in the collapsed format
+            label = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':')
+            self._labels[code] = label
+        return label
+
+    def _run(self, stopped: Event) -> None:
+        started = time.monotonic()
+        while not stopped.wait(self.interval):
+            self.sample()
+
+        try:
+            path = self.export()
+        except OSError as error:
+            self.on_log(f'Profile could not be written: {error}')
+            return
+        self.on_log(f'Profile of {self.sample_count} samples in {time.monotonic() - started:.1f} s written to {path}')
+
+
+def parse_profile_command(command: str) -> Tuple[str, Optional[int]]:
+    """
+    Parse a profiler control command, profile to toggle, profile start [rounds] or profile stop
+    :param command: command line
+    :return: action, toggle, start or stop, and the number of rounds
+    """
+    words = command.split()
+    if not words or words[0] != 'profile' or len(words) > 3:
+        raise ValueError(f'Unknown command {command.strip()}')
+
+    action = words[1] if len(words) > 1 else 'toggle'
+    if action not in ('toggle', 'start', 'stop'):
+        raise ValueError(f'Unknown profile action {action}')
+
+    rounds = int(words[2]) if len(words) > 2 else None
+    return action, rounds
@@ -0,0 +1,311 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+from array import array
+from typing import Dict, List, Tuple, Union, Optional
+
+DEFAULT_QUESTIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'questions.txt')
+
+# compiled bank: header | offsets of the questions (count + 1) | answers (count) | utf-8 text of the questions
+# every number is little endian and 8 bytes wide so the tables stay aligned in the mapped file
+BANK_MAGIC = b'QBNK'
+BANK_VERSION = 1
+BANK_EXTENSION = '.qbank'
+BANK_HEADER = struct.Struct('<4sHHQQ')  # magic | version | reserved | question count | text size
+BANK_SPAN = struct.Struct('<QQ')
+BANK_ANSWER = struct.Struct('<q')
+
+
+class QuestionBank:
+    def __init__(self):
+        """
+        Initialize an empty question bank, every question is stored once in a single utf-8 buffer
+        and addressed by its index through an offset table
+        """
+        self._chunks: List[bytes] = []  # encoded questions added since the buffer is built
+        self._text: bytes = b''
+        self._offsets: array = array('Q', [0])  # question i is text[offsets[i]:offsets[i + 1]]
+        self._answers: array = array('q')
+
+        # optional indexes from a category or a difficulty to question indexes
+        self._categories: Dict[str, array] = {}
+        self._difficulties: Dict[int, array] = {}
+
+    @classmethod
+    def load(cls, path: str) -> 'QuestionBank':
+        """
+        Load questions from a file where each question line is followed by its answer line
+        :param path: path of the questions file
+        :return: question bank
+        """
+        bank = cls()
+        with open(path, 'r') as file:
+            question = None
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+
+                # lines alternate between questions and answers
+                if question is None:
+                    question = line
+                else:
+                    bank.add(question, int(line))
+                    question = None
+
+        return bank
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def add(self, question: str, answer: int, category: Optional[str] = None,
+            difficulty: Optional[int] = None) -> int:
+        """
+        Add a question to the bank
+        :param question: text of the question
+        :param answer: answer of the question
+        :param category: category of the question, indexed if given
+        :param difficulty: difficulty of the question, indexed if given
+        :return: index of the question
+        """
+        index = len(self._answers)
+        encoded = question.encode()
+
+        self._chunks.append(encoded)
+        self._offsets.append(self._offsets[-1] + len(encoded))
+        self._answers.append(answer)
+
+        if category is not None:
+            self._categories.setdefault(category, array('I')).append(index)
+        if difficulty is not None:
+            self._difficulties.setdefault(difficulty, array('I')).append(index)
+
+        return index
+
+    def get(self, index: int) -> Tuple[str, int]:
+        """
+        Get a question by its index
+        :param index: index of the question
+        :return: question and answer
+        """
+        self._join_chunks()
+        question = self._text[self._offsets[index]:self._offsets[index + 1]].decode()
+        return question, self._answers[index]
+
+    def _join_chunks(self) -> None:
+        # join the questions added since the last lookup into the buffer
+        if self._chunks:
+            self._text += b''.join(self._chunks)
+            self._chunks = []
+
+    @property
+    def categories(self) -> List[str]:
+        """
+        Get the indexed categories
+        :return: categories
+        """
+        return list(self._categories)
+
+    def sampler(self, category: Optional[str] = None, difficulty: Optional[int] = None,
+                rng: Optional[random.Random] = None) -> 'QuestionSampler':
+        """
+        Create a sampler drawing questions of the bank in random order without replacement
+        :param category: draw only questions of this category
+        :param difficulty: draw only questions of this difficulty
+        :param rng: random number generator, the global one by default
+        :return: sampler
+        """
+        indexes: Union[array, None] = None
+
+        if category is not None:
+            indexes = self._categories.get(category, array('I'))
+        if difficulty is not None:
+            by_difficulty = self._difficulties.get(difficulty, array('I'))
+            if indexes is None:
+                indexes = by_difficulty
+            else:
+                allowed = set(by_difficulty)
+                indexes = array('I', (index for index in indexes if index in allowed))
+
+        return QuestionSampler(self, indexes, rng)
+
+    def save(self, path: str) -> None:
+        """
+        Write the bank in the compiled format which MappedQuestionBank reads
+        :param path: path of the compiled bank
+        :return: None
+        """
+        self._join_chunks()
+
+        offsets, answers = array('Q', self._offsets), array('q', self._answers)
+        if sys.byteorder != 'little':
+            offsets.byteswap()
+            answers.byteswap()
+
+        with open(path, 'wb') as file:
+            file.write(BANK_HEADER.pack(BANK_MAGIC, BANK_VERSION, 0, len(self), len(self._text)))
+            file.write(offsets.tobytes())
+            file.write(answers.tobytes())
+            file.write(self._text)
+
+
+class MappedQuestionBank:
+    def __init__(self, path: str):
+        """
+        Open a compiled question bank, the file is mapped read only so questions are read from the page cache
+        on demand and processes opening the same file share its pages
+        :param path: path of the compiled bank
+        """
+        with open(path, 'rb') as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._map) < BANK_HEADER.size:
+            raise ValueError(f'{path} is not a compiled question bank')
+
+        magic, version, _, self._count, text_size = BANK_HEADER.unpack_from(self._map)
+        if magic != BANK_MAGIC or version != BANK_VERSION:
+            raise ValueError(f'{path} is not a compiled question bank')
+
+        # start of the tables in the file
+        self._offsets = BANK_HEADER.size
+        self._answers = self._offsets + (self._count + 1) * 8
+        self._text = self._answers + self._count * 8
+
+        if len(self._map) != self._text + text_size:
+            raise ValueError(f'{path} is truncated')
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, index: int) -> Tuple[str, int]:
+        """
+        Get a question by its index
+        :param index: index of the question
+        :return: question and answer
+        """
+        if not 0 <= index < self._count:
+            raise IndexError('Question index out of range')
+
+        start, end = BANK_SPAN.unpack_from(self._map, self._offsets + index * 8)
+        answer, = BANK_ANSWER.unpack_from(self._map, self._answers + index * 8)
+        question = self._map[self._text + start:self._text + end].decode()
+        return question, answer
+
+    @property
+    def categories(self) -> List[str]:
+        """
+        Get the indexed categories, compiled banks have no category index
+        :return: categories
+        """
+        return []
+
+    def sampler(self, category: Optional[str] = None, difficulty: Optional[int] = None,
+                rng: Optional[random.Random] = None) -> 'QuestionSampler':
+        """
+        Create a sampler drawing questions of the bank in random order without replacement
+        :param category: not supported by compiled banks
+        :param difficulty: not supported by compiled banks
+        :param rng: random number generator, the global one by default
+        :return: sampler
+        """
+        if category is not None or difficulty is not None:
+            raise ValueError('Compiled question banks have no category or difficulty index')
+        return QuestionSampler(self, None, rng)
+
+    def close(self) -> None:
+        """
+        Unmap the file
+        :return: None
+        """
+        self._map.close()
+
+
+def open_question_bank(path: str) -> Union[QuestionBank, MappedQuestionBank]:
+    """
+    Open a question bank, compiled banks are mapped and text files are loaded into memory
+    :param path: path of the questions file or the compiled bank
+    :return: question bank
+    """
+    if path.endswith(BANK_EXTENSION):
+        return MappedQuestionBank(path)
+    return QuestionBank.load(path)
+
+
+def compile_questions(source: str, destination: str) -> int:
+    """
+    Compile a questions file into a bank which can be mapped
+    :param source: path of the questions file
+    :param destination: path of the compiled bank
+    :return: number of questions
+    """
+    bank = QuestionBank.load(source)
+    bank.save(destination)
+    return len(bank)
+
+
+class QuestionSampler:
+    def __init__(self, bank: Union[QuestionBank, MappedQuestionBank], indexes: Optional[array] = None,
+                 rng: Optional[random.Random] = None):
+        """
+        Initialize a sampler which walks a random permutation of the questions, the permutation is built
+        lazily so that each draw costs O(1) time and memory whatever the size of the bank
+        :param bank: question bank
+        :param indexes: question indexes to draw from, every question of the bank by default
+        :param rng: random number generator, the global one by default
+        """
+        self.bank = bank
+        self.indexes = indexes
+        self.rng = rng or random
+
+        self._size = len(bank) if indexes is None else len(indexes)
+        self._drawn = 0
+        self._swaps: Dict[int, int] = {}  # positions of the permutation which differ from the identity
+
+    def __len__(self) -> int:
+        """
+        Get the number of questions which are not drawn yet
+        :return: number of questions left
+        """
+        return self._size - self._drawn
+
+    def reset(self) -> None:
+        """
+        Start a new permutation of the questions
+        :return: None
+        """
+        self._drawn = 0
+        self._swaps = {}
+
+    def draw(self) -> Tuple[str, int]:
+        """
+        Draw the next question, start a new permutation if every question is drawn
+        :return: question and answer
+        """
+        if self._size == 0:
+            raise IndexError('There is no question to draw')
+        if self._drawn == self._size:
+            self.reset()
+
+        # Fisher-Yates step over the positions which are not drawn yet
+        last = self._size - self._drawn - 1
+        position = self.rng.randint(0, last)
+        selected = self._swaps.get(position, position)
+        self._swaps[position] = self._swaps.pop(last, last)
+        self._drawn += 1
+
+        index = selected if self.indexes is None else self.indexes[selected]
+        return self.bank.get(index)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compile a questions file into a bank the server can map')
+    parser.add_argument('source', nargs='?', default=DEFAULT_QUESTIONS_PATH, help='path of the questions file')
+    parser.add_argument('destination', nargs='?', default=None,
+                        help=f'path of the compiled bank, the source with the {BANK_EXTENSION} extension by default')
+    args = parser.parse_args()
+
+    destination = args.destination or os.path.splitext(args.source)[0] + BANK_EXTENSION
+    print(f'{compile_questions(args.source, destination)} questions compiled into {destination}')
@@ -0,0 +1,269 @@
+import time
+from socket import socket
+from typing import Dict, Tuple, Union, Optional, Callable, Any
+
+from common.protocol import FrameDecoder
+from controller import ServiceController
+from events import ServiceObserver
+from io_loop import IOLoop, TimerHandle
+from player_model import Player
+
+DEFAULT_ROOM = 'default'  # room of the clients which only send their name
+
+
+class Room(ServiceObserver):
+    def __init__(self, name: str, controller: ServiceController, loop: IOLoop,
+                 on_log: Callable[[str], None], on_close: Callable[['Room'], None],
+                 on_scores: Optional[Callable[[str, Dict[str, float]], None]] = None):
+        """
+        Initialize a room which plays the games of its controller on a shared I/O loop
+        :param name: name of the room
+        :param controller: controller holding the players, questions and scores of the room
+        :param loop: shared I/O loop, every method of the room runs in its thread
+        :param on_log: function to call with the logs of the room
+        :param on_close: function to call when the room is closed
+        :param on_scores: function to call with the name of the room and the total scores after every round
+        """
+        self.name = name
+        self.controller = controller
+        self.loop = loop
+        self.on_log = on_log
+        self.on_close = on_close
+        self.on_scores = on_scores
+
+        self.is_playing = False
+        self.is_closed = False
+        self._correct_answer: Union[int, None] = None  # answer of the question whose round is open
+        self._timer: Union[TimerHandle, None] = None
+
+        # rooms are driven by loop callbacks, the waits timed by the controller in single mode are timed here
+        self._waiting_since = time.perf_counter()
+        self._round_started_at: Optional[float] = None
+
+        self.controller.subscribe(self)
+        self.controller.attach(loop)
+        self.controller.read_questions()
+
+    def __len__(self) -> int:
+        return len(self.controller.players)
+
+    def join(self, name: str, client: socket, address: Tuple[str, int], decoder: FrameDecoder,
+             token: Optional[str] = None) -> bool:
+        """
+        Add a client to the room and start the game if enough players joined,
+        a client joining during the game is seated at once since the room plays on the loop thread
+        :param name: name of the client
+        :param client: socket of the client
+        :param address: address of the client
+        :param decoder: decoder holding the bytes received after the join message
+        :param token: session token sent by the client to resume its player, None for a new player
+        :return: True if the client joined, False otherwise
+        """
+        if not self.controller.join(name, client, address, decoder, token):
+            # do not keep a room created for a client which cannot join
+            if not self.controller.players and not self.is_playing:
+                self.close()
+            return False
+
+        if self.is_playing:
+            self.controller.admit_joiners()
+        else:
+            self._start_if_ready()
+        return True
+
+    def add_log(self, log: str) -> None:
+        """
+        Forward logs of the controller with the name of the room
+        :param log: log
+        :return: None
+        """
+        self.on_log(f'[{self.name}] {log}')
+
+    def scores_updated(self, scores: Dict[str, float]) -> None:
+        """
+        Forward total scores of the controller with the name of the room
+        :param scores: total scores of the players
+        :return: None
+        """
+        if self.on_scores is not None:
+            self.on_scores(self.name, scores)
+
+    def player_disconnected(self, player: Player) -> None:
+        """
+        Remove the disconnected player and end the game if only one player is left
+        :param player: disconnected player
+        :return: None
+        """
+        self.controller.check_connections()
+
+        if self.is_playing and self.controller._is_game_over:
+            self._finish()
+        elif not self.is_playing and not self.controller.players:
+            self.close()
+
+    def close(self) -> None:
+        """
+        Close the connections of the players and remove the room
+        :return: None
+        """
+        if self.is_closed:
+            return
+        self.is_closed = True
+
+        self._cancel_timer()
+        self.controller.close_round()
+        self.controller.terminate()
+        self.controller.close()
+
+        # write the queued messages, like the terminate message, before closing the connections
+        for player in list(self.controller.players.values()):
+            self.loop.unregister(player.client)
+            self.controller.broadcaster.drain(player)
+            player.close()
+
+        self.on_close(self)
+
+    def _start_if_ready(self) -> None:
+        """
+        Start the game once the minimum number of players joined
+        :return: None
+        """
+        min_players = self.controller.min_players or 2
+        if not self.is_playing and len(self.controller.players) >= min_players:
+            self._start()
+
+    def _start(self) -> None:
+        """
+        Start a game and ask the first question after a delay given to the players
+        :return: None
+        """
+        self._observe('wait_clients', self._waiting_since)
+        self.is_playing = True
+        self.controller._is_started = True
+        self.controller._is_game_over = False
+        self.controller.asked_question_count = 0
+
+        self.controller.log("All players connected. Game started\n")
+        self.controller.notify('game_started')
+        self.controller.send_message_to_clients('start')
+
+        self._timer = self.loop.call_later(1, self._ask)
+
+    def _ask(self) -> None:
+        """
+        Ask the next question, the round ends when the last answer arrives
+        :return: None
+        """
+        self._timer = None
+        if len(self.controller.players) <= 1 or self.controller._is_game_over:
+            self._finish()
+            return
+
+        # the round is ended on the next iteration of the loop, once the correct answer is stored
+        self._round_started_at = time.perf_counter()
+        self._correct_answer = self.controller.ask_question(self.controller.asked_question_count,
+                                                            on_close=lambda: self.loop.call_soon(self._end_round))
+
+    def _end_round(self) -> None:
+        """
+        Score the answers and send results, called when every player answered
+        :return: None
+        """
+        # the game may be finished while the round was open
+        if self._correct_answer is None or not self.is_playing:
+            return
+
+        answer, self._correct_answer = self._correct_answer, None
+        self.controller.close_round()
+        self._observe('answer_wait', self._round_started_at)
+        self.controller.score_answers(answer)
+        self.controller.send_results(answer)
+
+        if self.controller.asked_question_count >= self.controller.total_question_count:
+            self._finish()
+        else:
+            self._ask()
+
+    def _finish(self) -> None:
+        """
+        End the game and restart or close the room
+        :return: None
+        """
+        self._cancel_timer()
+        self._correct_answer = None
+        self.controller.close_round()
+        self.is_playing = False
+
+        self.controller.finish_game()
+        # names of the players who left are free again while the room waits for players, as in wait_clients
+        self.controller.removed_players.clear()
+
+        if self.controller._is_terminated:
+            self.close()
+        else:
+            self._waiting_since = time.perf_counter()
+            self._start_if_ready()
+
+    def _observe(self, histogram: str, started_at: Optional[float]) -> None:
+        """
+        Observe the seconds since a start time in a histogram of the metrics of the controller
+        :param histogram: name of the histogram
+        :param started_at: perf_counter time, None to observe nothing
+        :return: None
+        """
+        if self.controller.metrics is not None and started_at is not None:
+            self.controller.metrics.observe(histogram, time.perf_counter() - started_at)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class RoomRegistry:
+    def __init__(self, create_room: Callable[[str], Room], max_rooms: Optional[int] = None):
+        """
+        Initialize the registry which maps room names to rooms
+        :param create_room: function which creates a room with the given name
+        :param max_rooms: number of rooms allowed at the same time, None for no limit
+        """
+        self.create_room = create_room
+        self.max_rooms = max_rooms
+        self.rooms: Dict[str, Room] = {}
+
+    def __len__(self) -> int:
+        return len(self.rooms)
+
+    def __iter__(self) -> Any:
+        return iter(list(self.rooms.values()))
+
+    def get(self, name: str) -> Optional[Room]:
+        """
+        Get a room by its name
+        :param name: name of the room
+        :return: room, None if there is no room with this name
+        """
+        return self.rooms.get(name)
+
+    def get_or_create(self, name: str) -> Optional[Room]:
+        """
+        Get a room by its name, create it if it does not exist
+        :param name: name of the room
+        :return: room, None if the room does not exist and the room limit is reached
+        """
+        room = self.rooms.get(name)
+        if room is None:
+            if self.max_rooms is not None and len(self.rooms) >= self.max_rooms:
+                return None
+            room = self.create_room(name)
+            self.rooms[name] = room
+        return room
+
+    def remove(self, room: Room) -> None:
+        """
+        Remove a room from the registry
+        :param room: room to remove
+        :return: None
+        """
+        if self.rooms.get(room.name) is room:
+            del self.rooms[room.name]
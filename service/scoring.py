@@ -0,0 +1,226 @@
+import heapq
+from array import array
+from typing import Dict, List, Tuple, Union, Optional
+
+try:
+    import numpy
+except ImportError:  # scores are computed with plain Python loops
+    numpy = None
+
+# answers are clamped so that the distance to the correct answer fits in 64 bits
+ANSWER_LIMIT = 2 ** 61
+
+# points of the closest, second closest and third closest answers of the top3 rule
+TOP3_POINTS = (1.0, 0.5, 0.25)
+
+SCORING_RULES = ('closest', 'proportional', 'top3')
+
+Awards = List[Tuple[str, float]]
+
+
+def _clamp(answer: int) -> int:
+    return max(-ANSWER_LIMIT, min(ANSWER_LIMIT, answer))
+
+
+class ScoreTable:
+    def __init__(self, rule: str = 'closest', use_numpy: Optional[bool] = None, capacity: int = 64):
+        """
+        Initialize the table which keeps the answers and the totals of the players in contiguous arrays,
+        every player owns a slot and a round is scored in one pass over the arrays
+        :param rule: scoring rule, closest splits one point between the closest answers, proportional gives
+        every answer (1 + closest distance) / (1 + distance) points and top3 rewards the three closest answers
+        :param use_numpy: score with numpy, by default numpy is used if it is installed
+        :param capacity: number of slots allocated at first
+        """
+        if rule not in SCORING_RULES:
+            raise ValueError(f'Unknown scoring rule {rule}')
+        if use_numpy and numpy is None:
+            raise ValueError('numpy is not installed')
+
+        self.rule: str = rule
+        self.use_numpy: bool = numpy is not None if use_numpy is None else use_numpy
+
+        self.slots: Dict[str, int] = {}
+        self.names: List[Union[str, None]] = []
+        self._free: List[int] = []
+
+        if self.use_numpy:
+            self._answers = numpy.zeros(capacity, dtype=numpy.int64)
+            self._answered = numpy.zeros(capacity, dtype=bool)
+            self._totals = numpy.zeros(capacity, dtype=numpy.float64)
+        else:
+            self._answers = array('q')
+            self._answered = array('B')
+            self._totals = array('d')
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.slots
+
+    def add(self, name: str, total: float = 0) -> int:
+        """
+        Give a slot to a player
+        :param name: name of the player
+        :param total: total score of the player, kept by a player who comes back during a game
+        :return: slot of the player
+        """
+        slot = self.slots.get(name)
+        if slot is not None:
+            return slot
+
+        if self._free:
+            slot = self._free.pop()
+            self.names[slot] = name
+        else:
+            slot = len(self.names)
+            self.names.append(name)
+            self._grow(slot + 1)
+
+        self.slots[name] = slot
+        self._answered[slot] = False
+        self._totals[slot] = total
+        return slot
+
+    def remove(self, name: str) -> None:
+        """
+        Free the slot of a player
+        :param name: name of the player
+        :return: None
+        """
+        slot = self.slots.pop(name, None)
+        if slot is None:
+            return
+
+        self.names[slot] = None
+        self._answered[slot] = False
+        self._free.append(slot)
+
+    def set_answer(self, name: str, answer: int) -> None:
+        """
+        Record the answer of a player
+        :param name: name of the player
+        :param answer: answer of the player
+        :return: None
+        """
+        slot = self.slots[name]
+        self._answers[slot] = _clamp(answer)
+        self._answered[slot] = True
+
+    def clear_answers(self) -> None:
+        """
+        Forget the answers of the previous round
+        :return: None
+        """
+        if self.use_numpy:
+            self._answered[:] = False
+        else:
+            self._answered = array('B', bytes(len(self._answered)))
+
+    def total(self, name: str) -> float:
+        """
+        Get the total score of a player
+        :param name: name of the player
+        :return: total score
+        """
+        return self._totals[self.slots[name]]
+
+    def reset_totals(self) -> None:
+        """
+        Set every total score to zero
+        :return: None
+        """
+        if self.use_numpy:
+            self._totals[:] = 0
+        else:
+            self._totals = array('d', bytes(len(self._totals) * 8))
+
+    def score(self, correct_answer: int) -> Tuple[List[str], Awards]:
+        """
+        Score the answers of the round and add the points to the totals
+        :param correct_answer: correct answer of the question
+        :return: names of the players with the closest answer and the points given to each player
+        """
+        correct_answer = _clamp(correct_answer)
+        if self.use_numpy:
+            return self._score_numpy(correct_answer)
+        return self._score_python(correct_answer)
+
+    def _grow(self, size: int) -> None:
+        if not self.use_numpy:
+            self._answers.append(0)
+            self._answered.append(False)
+            self._totals.append(0)
+            return
+
+        if size <= len(self._answers):
+            return
+
+        capacity = max(size, 2 * len(self._answers))
+        self._answers = numpy.resize(self._answers, capacity)
+        self._answered = numpy.resize(self._answered, capacity)
+        self._totals = numpy.resize(self._totals, capacity)
+
+    def _score_numpy(self, correct_answer: int) -> Tuple[List[str], Awards]:
+        slots = numpy.flatnonzero(self._answered)
+        if not slots.size:
+            return [], []
+
+        distances = numpy.abs(self._answers[slots] - correct_answer)
+        closest = distances.min()
+        is_winner = distances == closest
+
+        if self.rule == 'closest':
+            points = is_winner / numpy.count_nonzero(is_winner)
+        elif self.rule == 'proportional':
+            points = (1.0 + closest) / (1.0 + distances)
+        else:
+            points = numpy.zeros(slots.size)
+            remaining = distances.copy()
+            limit = numpy.iinfo(numpy.int64).max
+            for value in TOP3_POINTS:
+                distance = remaining.min()
+                if distance == limit:
+                    break
+                selected = remaining == distance
+                points[selected] = value / numpy.count_nonzero(selected)
+                remaining[selected] = limit
+
+        self._totals[slots] += points
+
+        names = self.names
+        winners = [names[slot] for slot in slots[is_winner].tolist()]
+        awarded = numpy.flatnonzero(points)
+        awards = [(names[slot], value) for slot, value in zip(slots[awarded].tolist(), points[awarded].tolist())]
+        return winners, awards
+
+    def _score_python(self, correct_answer: int) -> Tuple[List[str], Awards]:
+        answers, answered = self._answers, self._answered
+        distances = {slot: abs(answers[slot] - correct_answer) for slot in range(len(answered)) if answered[slot]}
+        if not distances:
+            return [], []
+
+        closest = min(distances.values())
+        winners = [slot for slot, distance in distances.items() if distance == closest]
+
+        if self.rule == 'closest':
+            points = {slot: 1 / len(winners) for slot in winners}
+        elif self.rule == 'proportional':
+            points = {slot: (1.0 + closest) / (1.0 + distance) for slot, distance in distances.items()}
+        else:
+            points = {}
+            levels = heapq.nsmallest(len(TOP3_POINTS), set(distances.values()))
+            groups: Dict[int, List[int]] = {distance: [] for distance in levels}
+            for slot, distance in distances.items():
+                if distance in groups:
+                    groups[distance].append(slot)
+            for value, distance in zip(TOP3_POINTS, levels):
+                for slot in groups[distance]:
+                    points[slot] = value / len(groups[distance])
+
+        for slot, value in points.items():
+            self._totals[slot] += value
+
+        names = self.names
+        return [names[slot] for slot in winners], [(names[slot], value) for slot, value in points.items()]
@@ -0,0 +1,265 @@
+import time
+from socket import socket, AF_INET, SOCK_STREAM
+from threading import Event
+from typing import Tuple, List, Dict, Union, Any, Optional, Callable
+
+from common.heartbeat import HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT
+from common.protocol import FrameDecoder, Frame, MessageType, ProtocolError, decode_join
+from controller import ServiceController, ANSWER_TIMEOUT
+from handshake import Acceptor, Handshake, LISTEN_BACKLOG, HANDSHAKE_TIMEOUT
+from io_loop import IOLoop
+from metrics import Metrics
+from question_bank import QuestionBank, MappedQuestionBank, DEFAULT_QUESTIONS_PATH, open_question_bank
+from rooms import Room, RoomRegistry, DEFAULT_ROOM
+
+
+def parse_join_message(frame: Frame) -> Tuple[str, str, Optional[str]]:
+    """
+    Get the name, the room and the session token of a client from its first frame
+    :param frame: first frame sent by the client
+    :return: name, room and token, a client sending only its name joins the default room without a token
+    """
+    message_type, payload = frame
+
+    if message_type == MessageType.TEXT:
+        return payload.decode(), DEFAULT_ROOM, None
+
+    if message_type == MessageType.JOIN:
+        name, room, token = decode_join(payload)
+        return name, room or DEFAULT_ROOM, token
+
+    raise ValueError('Invalid join message')
+
+
+class GameServer:
+    def __init__(self, port: int, question_count: int, observers: Optional[List[Any]] = None,
+                 auto_restart: bool = False, min_players: int = 2, max_players: Optional[int] = None,
+                 max_rooms: Optional[int] = None, questions_path: Optional[str] = None,
+                 heartbeat_interval: float = HEARTBEAT_INTERVAL, heartbeat_timeout: Optional[float] = HEARTBEAT_TIMEOUT,
+                 on_scores: Optional[Callable[[str, Dict[str, float]], None]] = None, scoring_rule: str = 'closest',
+                 answer_timeout: Optional[float] = ANSWER_TIMEOUT, slow_consumer_policy: str = 'disconnect',
+                 delivery_mode: str = 'staged', metrics: Optional[Metrics] = None,
+                 handshake_timeout: Optional[float] = HANDSHAKE_TIMEOUT, late_join: bool = True,
+                 on_close_room: Optional[Callable[[str], None]] = None):
+        """
+        Initialize the server which hosts many rooms on one port and one I/O loop
+        :param port: Port to listen
+        :param question_count: number of questions in a game of a room
+        :param observers: observers receiving the logs of every room
+        :param auto_restart: start a new game in a room after a game ends instead of closing the room
+        :param min_players: number of players which starts the game of a room
+        :param max_players: number of players allowed in a room, None for no limit
+        :param max_rooms: number of rooms allowed at the same time, None for no limit
+        :param questions_path: path of the questions file or of a compiled .qbank bank
+        :param heartbeat_interval: seconds between two pings sent to every player
+        :param heartbeat_timeout: seconds of silence before a player is dropped
+        :param on_scores: function called with the room name and total scores after every round
+        :param scoring_rule: rule scoring the answers of a round, closest, proportional or top3
+        :param answer_timeout: seconds given to answer a question, None to wait for every player
+        :param slow_consumer_policy: disconnect the players who do not read their messages, or drop their messages
+        :param delivery_mode: staged or sequential writes of the questions, see ServiceController
+        :param metrics: counters and histograms shared by every room, None to disable the instrumentation
+        :param handshake_timeout: seconds a client is given to send its join message, None to wait forever
+        :param late_join: let new players join the game of a room after it started
+        :param on_close_room: function called with the room name when a room is closed
+        """
+        self.server: Union[socket, None] = None
+        self.port: int = port
+        self.question_count: int = question_count
+        self.observers: List[Any] = observers or []
+
+        # settings of the rooms
+        self.auto_restart: bool = auto_restart
+        self.min_players: int = min_players
+        self.max_players: Optional[int] = max_players
+        self.questions_path: Optional[str] = questions_path
+        self.question_bank: Union[QuestionBank, MappedQuestionBank, None] = None  # loaded once and shared by every room
+        self.heartbeat_interval: float = heartbeat_interval
+        self.heartbeat_timeout: Optional[float] = heartbeat_timeout
+        self.on_scores: Optional[Callable[[str, Dict[str, float]], None]] = on_scores
+        self.on_close_room: Optional[Callable[[str], None]] = on_close_room
+        self.scoring_rule: str = scoring_rule
+        self.answer_timeout: Optional[float] = answer_timeout
+        self.slow_consumer_policy: str = slow_consumer_policy
+        self.delivery_mode: str = delivery_mode
+        self.metrics: Optional[Metrics] = metrics
+        self.handshake_timeout: Optional[float] = handshake_timeout
+        self.late_join: bool = late_join
+
+        self.loop: IOLoop = IOLoop()
+        self.acceptor: Union[Acceptor, None] = None
+        self.registry: RoomRegistry = RoomRegistry(self.create_room, max_rooms)
+        self.terminated: Event = Event()
+
+    def connect(self) -> None:
+        """
+        Listen on the port and start accepting clients on the I/O loop
+        :return: None
+        """
+        self.server = socket(AF_INET, SOCK_STREAM)
+        self.server.bind(('localhost', self.port))
+        self.server.listen(LISTEN_BACKLOG)
+
+        self.start()
+        self.acceptor = Acceptor(self.loop, self.server, self.on_join, self.log, self.handshake_timeout,
+                                 metrics=self.metrics)
+        self.acceptor.start()
+        if self.metrics is not None:
+            self.metrics.gauge('rooms', 'open rooms', lambda: len(self.registry))
+            self.metrics.gauge('players', 'players in every room', lambda: sum(len(room) for room in self.registry))
+        print('Server is listening')
+
+    def start(self) -> None:
+        """
+        Load the questions and start the I/O loop without listening, clients are handed over with adopt
+        :return: None
+        """
+        self.load_questions()
+        self.loop.start()
+
+    def run(self) -> None:
+        """
+        Block the calling thread until the server is terminated
+        :return: None
+        """
+        self.terminated.wait()
+
+    def terminate(self) -> None:
+        """
+        Close every room and stop the server
+        :return: None
+        """
+        self.loop.call_soon(self._close_rooms)
+        self.terminated.set()
+
+    def close(self) -> None:
+        """
+        Stop the I/O loop and close the listening socket
+        :return: None
+        """
+        self.loop.stop()
+        if self.server is not None:
+            self.server.close()
+            print('Server closed')
+
+    def log(self, log: str) -> None:
+        """
+        Send a log line to the observers
+        :param log: log
+        :return: None
+        """
+        for observer in self.observers:
+            handler = getattr(observer, 'add_log', None)
+            if handler is not None:
+                handler(log)
+
+    def load_questions(self) -> None:
+        """
+        Load the question bank shared by the rooms unless it is already loaded
+        :return: None
+        """
+        if self.question_bank is None:
+            self.question_bank = open_question_bank(self.questions_path or DEFAULT_QUESTIONS_PATH)
+            self.log(f'{len(self.question_bank)} questions read from file')
+
+    def create_room(self, name: str) -> Room:
+        """
+        Create a room with the settings of the server
+        :param name: name of the room
+        :return: room
+        """
+        controller = ServiceController(self.port, self.question_count, auto_restart=self.auto_restart,
+                                       min_players=self.min_players, max_players=self.max_players,
+                                       questions_path=self.questions_path, question_bank=self.question_bank,
+                                       heartbeat_interval=self.heartbeat_interval,
+                                       heartbeat_timeout=self.heartbeat_timeout, scoring_rule=self.scoring_rule,
+                                       answer_timeout=self.answer_timeout,
+                                       slow_consumer_policy=self.slow_consumer_policy,
+                                       delivery_mode=self.delivery_mode, metrics=self.metrics,
+                                       late_join=self.late_join)
+        room = Room(name, controller, self.loop, self.log, self.remove_room, self.on_scores)
+        self.log(f'Room {name} created, {len(self.registry) + 1} room(s) open')
+        return room
+
+    def remove_room(self, room: Room) -> None:
+        """
+        Forget a closed room, called by the room
+        :param room: closed room
+        :return: None
+        """
+        self.registry.remove(room)
+        if self.on_close_room is not None:
+            self.on_close_room(room.name)
+
+    def on_join(self, handshake: Handshake, frame: Frame) -> None:
+        """
+        Route a client which sent its join message into its room, called by the I/O loop
+        :param handshake: handshake of the client
+        :param frame: join message of the client
+        :return: None
+        """
+        if self.route(handshake.client, handshake.address, frame, handshake.decoder) and self.metrics is not None:
+            self.metrics.observe('accept_latency', time.monotonic() - handshake.accepted_at)
+
+    def adopt(self, client: socket, address: Tuple[str, int], data: bytes) -> None:
+        """
+        Take over a client accepted by another process, called by the I/O loop
+        :param client: socket of the client
+        :param address: address of the client
+        :param data: bytes already received from the client, starting with its join message
+        :return: None
+        """
+        client.setblocking(True)
+        decoder = FrameDecoder()
+        decoder.feed(data)
+        try:
+            frame = decoder.next_frame()
+        except ProtocolError:
+            frame = None
+
+        if frame is None:
+            self.reject(client, 'Invalid join message')
+            return
+
+        self.route(client, address, frame, decoder)
+
+    def route(self, client: socket, address: Tuple[str, int], frame: Frame, decoder: FrameDecoder) -> bool:
+        """
+        Add a client to the room named in its join message
+        :param client: socket of the client
+        :param address: address of the client
+        :param frame: join message of the client
+        :param decoder: decoder holding the bytes received after the join message
+        :return: True if the client joined its room, False otherwise
+        """
+        try:
+            name, room_name, token = parse_join_message(frame)
+        except ValueError:
+            self.reject(client, 'Invalid join message')
+            return False
+
+        room = self.registry.get_or_create(room_name)
+        if room is None:
+            self.log(f'Client {address} rejected because there are too many rooms')
+            self.reject(client, 'Too many rooms')
+            return False
+
+        return room.join(name, client, address, decoder, token)
+
+    def reject(self, client: socket, message: str) -> None:
+        """
+        Reject a client before it reaches a room
+        :param client: socket of the client
+        :param message: reason of the rejection
+        :return: None
+        """
+        if self.metrics is not None:
+            self.metrics.inc('rejects')
+        ServiceController.reject_client(client, message)
+
+    def _close_rooms(self) -> None:
+        if self.acceptor is not None:
+            self.acceptor.close()
+        for room in self.registry:
+            room.controller.send_message_to_clients('terminate')
+            room.close()
@@ -0,0 +1,311 @@
+import heapq
+import multiprocessing
+import selectors
+import socket
+import struct
+import zlib
+from collections import deque
+from queue import Empty
+from threading import Thread, Event, Lock
+from typing import Dict, List, Tuple, Union, Any, Optional, Deque
+
+from common.protocol import Frame
+from controller import ServiceController
+from events import ConsoleObserver
+from handshake import Acceptor, Handshake, LISTEN_BACKLOG, HANDSHAKE_TIMEOUT
+from io_loop import IOLoop
+from log_pipeline import LogPipeline
+from server import GameServer, parse_join_message
+
+# hand-off message: host length | host | port | bytes received from the client
+HANDOFF_ADDRESS = struct.Struct('!H')
+HANDOFF_PORT = struct.Struct('!H')
+HANDOFF_SIZE = 256 * 1024
+MAX_PENDING_HANDOFFS = 1024  # clients queued for a worker whose channel is full before new clients are rejected
+
+
+def pack_handoff(address: Tuple[str, int], data: bytes) -> bytes:
+    """
+    Pack the address and the received bytes of a client handed over to a worker
+    :param address: address of the client
+    :param data: bytes received from the client
+    :return: packed message
+    """
+    host = address[0].encode()
+    return HANDOFF_ADDRESS.pack(len(host)) + host + HANDOFF_PORT.pack(address[1]) + data
+
+
+def unpack_handoff(message: bytes) -> Tuple[Tuple[str, int], bytes]:
+    """
+    Unpack a hand-off message
+    :param message: packed message
+    :return: address of the client and the bytes received from it
+    """
+    length, = HANDOFF_ADDRESS.unpack_from(message)
+    offset = HANDOFF_ADDRESS.size
+    host = message[offset:offset + length].decode()
+    offset += length
+    port, = HANDOFF_PORT.unpack_from(message, offset)
+    return (host, port), message[offset + HANDOFF_PORT.size:]
+
+
+def run_worker(index: int, channel: socket.socket, updates: Any, settings: Dict[str, Any]) -> None:
+    """
+    Entry point of a worker process which hosts the rooms handed over by the parent
+    :param index: index of the worker
+    :param channel: unix socket receiving clients from the parent
+    :param updates: queue receiving the total scores of the rooms of the worker
+    :param settings: keyword arguments of GameServer
+    :return: None
+    """
+    # the logs of the rooms are printed by the pipeline thread of the worker, not by its I/O loop
+    pipeline = LogPipeline()
+    pipeline.add_sink(ConsoleObserver().write_events)
+    pipeline.start()
+
+    # a closed room is reported without scores so that the parent forgets it
+    server = GameServer(observers=[pipeline], on_scores=lambda room, scores: updates.put((room, scores)),
+                        on_close_room=lambda room: updates.put((room, None)), **settings)
+    server.start()
+
+    def receive_client(mask: int) -> None:
+        try:
+            message, fds, _, _ = socket.recv_fds(channel, HANDOFF_SIZE, 1)
+        except OSError:
+            message, fds = b'', []
+
+        # parent sent the empty stop message or closed the channel
+        if not message:
+            server.loop.unregister(channel)
+            server.terminate()
+            return
+
+        address, data = unpack_handoff(message)
+        for fd in fds:
+            server.adopt(socket.socket(fileno=fd), address, data)
+
+    server.loop.register(channel, receive_client)
+    server.log(f'Worker {index} started')
+
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        server.terminate()
+    finally:
+        server.close()
+        pipeline.stop()
+
+
+class GlobalLeaderboard:
+    def __init__(self):
+        """
+        Initialize the leaderboard aggregating the total scores reported by every worker,
+        only the last scores of the open rooms are kept
+        """
+        self.totals: Dict[str, Dict[str, float]] = {}  # total scores by room
+        self.lock = Lock()
+
+    def update(self, room: str, scores: Dict[str, float]) -> None:
+        """
+        Store the total scores of a room, replacing its previous scores
+        :param room: name of the room
+        :param scores: total scores of the players of the room
+        :return: None
+        """
+        with self.lock:
+            self.totals[room] = dict(scores)
+
+    def remove(self, room: str) -> None:
+        """
+        Forget the scores of a closed room
+        :param room: name of the room
+        :return: None
+        """
+        with self.lock:
+            self.totals.pop(room, None)
+
+    def top(self, count: int = 10) -> List[Tuple[str, str, float]]:
+        """
+        Get the best players of every room
+        :param count: number of players
+        :return: room, name and total score of the players, best first
+        """
+        with self.lock:
+            return heapq.nlargest(count, ((room, name, total) for room, scores in self.totals.items()
+                                          for name, total in scores.items()), key=lambda item: item[2])
+
+
+class WorkerPool:
+    def __init__(self, port: int, workers: int, observers: Optional[List[Any]] = None, **settings: Any):
+        """
+        Initialize a pool of worker processes sharing one port, each worker owns the rooms hashed to it
+        :param port: Port to listen
+        :param workers: number of worker processes
+        :param observers: observers receiving the logs of the parent, each worker prints its own logs
+        :param settings: keyword arguments of GameServer used by every worker
+        """
+        self.server: Union[socket.socket, None] = None
+        self.port: int = port
+        self.observers: List[Any] = observers or []
+        self.settings: Dict[str, Any] = dict(settings, port=port)
+
+        self.loop: IOLoop = IOLoop()
+        self.acceptor: Union[Acceptor, None] = None
+        self.processes: List[multiprocessing.Process] = []
+        self.channels: List[socket.socket] = []
+        # clients waiting for a worker whose channel is full, with their hand-off message
+        self.pending: List[Deque[Tuple[socket.socket, Tuple[str, int], bytes]]] = []
+        self.updates: Any = multiprocessing.Queue()
+        self.leaderboard: GlobalLeaderboard = GlobalLeaderboard()
+        self.terminated: Event = Event()
+
+        self.worker_count: int = workers
+
+    def connect(self) -> None:
+        """
+        Start the workers, then listen on the port and hand every client over to the worker of its room
+        :return: None
+        """
+        for index in range(self.worker_count):
+            parent_channel, worker_channel = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+            process = multiprocessing.Process(target=run_worker, name=f'worker-{index}', daemon=True,
+                                              args=(index, worker_channel, self.updates, self.settings))
+            process.start()
+            worker_channel.close()
+
+            # a stalled worker must not block the accepts and the handshakes of the loop
+            parent_channel.setblocking(False)
+            self.processes.append(process)
+            self.channels.append(parent_channel)
+            self.pending.append(deque())
+
+        # aggregate scores reported by the workers
+        Thread(target=self._collect_scores, name='leaderboard', daemon=True).start()
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(('localhost', self.port))
+        self.server.listen(LISTEN_BACKLOG)
+
+        # the raw bytes of the join message are handed over with the client
+        self.loop.start()
+        self.acceptor = Acceptor(self.loop, self.server, self.on_join, self.log,
+                                 self.settings.get('handshake_timeout', HANDSHAKE_TIMEOUT),
+                                 max_join_size=HANDOFF_SIZE // 2, keep_received=True)
+        self.acceptor.start()
+        print('Server is listening')
+
+    def run(self) -> None:
+        """
+        Block the calling thread until the pool is terminated
+        :return: None
+        """
+        self.terminated.wait()
+
+    def terminate(self) -> None:
+        """
+        Stop the pool, workers close their rooms when the pool is closed
+        :return: None
+        """
+        self.terminated.set()
+
+    def close(self) -> None:
+        """
+        Stop the workers and close the listening socket
+        :return: None
+        """
+        self.loop.call_soon(self.acceptor.close)
+        self.loop.stop()
+        self.server.close()
+
+        # an empty datagram asks the worker to close its rooms, clients still waiting for it are dropped
+        for channel, pending in zip(self.channels, self.pending):
+            for client, _, _ in pending:
+                client.close()
+            pending.clear()
+            try:
+                channel.settimeout(1)
+                channel.send(b'')
+            except OSError:
+                pass
+            channel.close()
+        for process in self.processes:
+            process.join(timeout=5)
+
+        print('Server closed')
+
+    def log(self, log: str) -> None:
+        """
+        Send a log line to the observers
+        :param log: log
+        :return: None
+        """
+        for observer in self.observers:
+            handler = getattr(observer, 'add_log', None)
+            if handler is not None:
+                handler(log)
+
+    def on_join(self, handshake: Handshake, frame: Frame) -> None:
+        """
+        Hand a client which sent its join message over to the worker of its room, called by the I/O loop
+        :param handshake: handshake of the client, holding the bytes received from it
+        :param frame: join message of the client
+        :return: None
+        """
+        client, address = handshake.client, handshake.address
+        try:
+            _, room, _ = parse_join_message(frame)
+        except ValueError:
+            ServiceController.reject_client(client, 'Invalid join message')
+            return
+
+        # the same room is always owned by the same worker, the clients of a busy worker wait in order
+        index = zlib.crc32(room.encode()) % len(self.channels)
+        pending = self.pending[index]
+        if len(pending) >= MAX_PENDING_HANDOFFS:
+            self.log(f'Worker {index} is busy, client {address} rejected')
+            ServiceController.reject_client(client, 'Server is busy')
+            return
+
+        pending.append((client, address, pack_handoff(address, bytes(handshake.received))))
+        if len(pending) == 1:
+            self._hand_off(index)
+
+    def _hand_off(self, index: int) -> None:
+        """
+        Send the waiting clients to a worker until its channel is full, called by the I/O loop
+        :param index: index of the worker
+        :return: None
+        """
+        channel, pending = self.channels[index], self.pending[index]
+        while pending:
+            client, address, message = pending[0]
+            try:
+                socket.send_fds(channel, [message], [client.fileno()])
+            except BlockingIOError:
+                # the worker is behind, the rest is sent once its channel is writable again
+                self.loop.register(channel, lambda mask: self._hand_off(index), selectors.EVENT_WRITE)
+                return
+            except OSError:
+                self.log(f'Worker {index} is not available, client {address} rejected')
+                ServiceController.reject_client(client, 'Server is not available')
+            else:
+                # the worker owns a duplicate of the socket now
+                client.close()
+            pending.popleft()
+
+        self.loop.unregister(channel)
+
+    def _collect_scores(self) -> None:
+        """
+        Thread which stores the scores reported by the workers in the global leaderboard
+        :return: None
+        """
+        while not self.terminated.is_set():
+            try:
+                room, scores = self.updates.get(timeout=1)
+            except Empty:
+                continue
+            if scores is None:
+                self.leaderboard.remove(room)
+            else:
+                self.leaderboard.update(room, scores)
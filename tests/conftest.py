@@ -0,0 +1,68 @@
+import os
+import sys
+import time
+from collections import deque
+from socket import create_connection
+
+import pytest
+
+# the service modules import each other by name and the shared protocol from the root of the repository
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'service')]
+
+from common.protocol import FrameDecoder, MessageType, decode_message
+from io_loop import IOLoop
+
+
+@pytest.fixture
+def loop():
+    loop = IOLoop()
+    loop.start()
+    yield loop
+    loop.stop()
+
+
+class Client:
+    # client side of a connection, reads time out so that a broken server fails the test instead of hanging it
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.settimeout(5)
+        self.decoder = FrameDecoder()
+        self.frames = deque()
+
+    @classmethod
+    def connect(cls, port, join):
+        client = cls(create_connection(('localhost', port)))
+        client.send(join)
+        return client
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def read(self):
+        # next frame which is not a ping or a pong, None once the server closed the connection
+        while True:
+            while not self.frames:
+                data = self.sock.recv(65536)
+                if not data:
+                    return None
+                self.decoder.feed(data)
+                self.frames.extend(self.decoder.frames())
+
+            frame = self.frames.popleft()
+            if frame[0] not in (MessageType.PING, MessageType.PONG):
+                return frame
+
+    def read_message(self):
+        frame = self.read()
+        return None if frame is None else decode_message(frame)
+
+    def close(self):
+        self.sock.close()
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
@@ -0,0 +1,169 @@
+import selectors
+
+import pytest
+
+from broadcast import Broadcaster, DeliveryStats
+from player_model import Player
+
+
+class FakeLoop:
+    def __init__(self):
+        self.events = {}
+
+    def modify(self, sock, events):
+        self.events[sock] = events
+
+
+class FakeSocket:
+    """
+    Socket accepting a limited number of bytes before it would block
+    """
+
+    def __init__(self, capacity=0):
+        self.capacity = capacity
+        self.received = bytearray()
+        self.error = None
+        self.calls = 0
+
+    def sendmsg(self, buffers, ancillary=(), flags=0):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if not self.capacity:
+            raise BlockingIOError
+        data = b''.join(bytes(buffer) for buffer in buffers)[:self.capacity]
+        self.capacity -= len(data)
+        self.received += data
+        return len(data)
+
+    def shutdown(self, how):
+        pass
+
+
+def make_broadcaster(**kwargs):
+    errors, logs = [], []
+    broadcaster = Broadcaster(FakeLoop(), errors.append, on_log=logs.append, **kwargs)
+    return broadcaster, errors, logs
+
+
+def make_player(capacity=0, name='alice'):
+    return Player(name, FakeSocket(capacity), ('127.0.0.1', 1))
+
+
+def test_partial_write_keeps_the_rest_queued():
+    broadcaster, errors, _ = make_broadcaster()
+    player = make_player(capacity=7)
+
+    assert broadcaster.send(player, b'hello', b'world')
+    assert bytes(player.client.received) == b'hellowo'
+    assert [bytes(buffer) for buffer in player.outbound] == [b'rld']
+    assert player.outbound_size == 3
+    assert broadcaster.loop.events[player.client] == selectors.EVENT_READ | selectors.EVENT_WRITE
+
+    player.client.capacity = 100
+    broadcaster.on_writable(player)
+    assert bytes(player.client.received) == b'helloworld'
+    assert player.outbound == [] and player.outbound_size == 0
+    assert broadcaster.loop.events[player.client] == selectors.EVENT_READ
+    assert errors == []
+
+
+def test_frames_keep_their_order_behind_queued_bytes():
+    broadcaster, _, _ = make_broadcaster()
+    player = make_player()
+
+    for index in range(5):
+        broadcaster.send(player, f'frame{index};'.encode())
+    assert player.outbound_size == 35
+
+    player.client.capacity = 1000
+    broadcaster.on_writable(player)
+    assert bytes(player.client.received) == b''.join(f'frame{index};'.encode() for index in range(5))
+
+
+def test_failed_connection_is_reported():
+    broadcaster, errors, _ = make_broadcaster()
+    player = make_player()
+    player.client.error = ConnectionResetError()
+
+    assert not broadcaster.send(player, b'data')
+    assert errors == [player]
+    assert player.outbound == [] and player.outbound_size == 0
+
+
+def test_slow_consumer_is_disconnected():
+    broadcaster, errors, logs = make_broadcaster(high_watermark=10)
+    player = make_player()
+
+    assert broadcaster.send(player, b'12345678')
+    assert not broadcaster.send(player, b'12345678')
+    assert errors == [player]
+    assert player.outbound == [] and 'slow consumer' in logs[0]
+
+
+def test_slow_consumer_frames_are_dropped():
+    broadcaster, errors, logs = make_broadcaster(high_watermark=10, policy='drop')
+    player = make_player()
+
+    assert broadcaster.send(player, b'12345678')
+    assert not broadcaster.send(player, b'12345678')
+    assert errors == []
+    assert player.outbound_size == 8 and 'dropped' in logs[0]
+
+
+def test_large_frame_is_sent_to_a_player_which_keeps_up():
+    broadcaster, errors, _ = make_broadcaster(high_watermark=10)
+    player = make_player(capacity=100)
+
+    assert broadcaster.send(player, b'x' * 50)
+    assert len(player.client.received) == 50 and errors == []
+
+
+@pytest.mark.parametrize('is_staged', [True, False])
+def test_fan_out_stamps_every_player(is_staged):
+    broadcaster, _, _ = make_broadcaster()
+    players = [make_player(capacity=1000, name=f'player{index}') for index in range(3)]
+    players[1].client.capacity = 0
+    broadcaster.send(players[1], b'queued;')
+
+    stamps = broadcaster.fan_out(players, lambda sent_at: b'prefix;', b'shared;', is_staged=is_staged)
+
+    assert {player for player, _ in stamps} == set(players)
+    assert bytes(players[0].client.received) == b'prefix;shared;'
+    assert players[1].outbound_size == len(b'queued;prefix;shared;')
+    assert b''.join(bytes(buffer) for buffer in players[1].outbound) == b'queued;prefix;shared;'
+
+
+def test_delivery_stats():
+    stats = DeliveryStats()
+    assert stats.percentiles() == {}
+    assert stats.record([(None, 1.0), (None, 1.5), (None, 1.25)]) == 0.5
+    assert stats.percentiles((50, 100)) == {'offset_p50': 0.25, 'offset_p100': 0.5,
+                                            'spread_p50': 0.5, 'spread_p100': 0.5}
+
+
+def test_player_send_goes_through_the_broadcaster():
+    broadcaster, _, _ = make_broadcaster()
+    player = make_player(capacity=100)
+    player.sender = broadcaster.send
+
+    assert player.send('hello')
+    assert bytes(player.client.received) == b'\x00\x00\x00\x05\x01hello'
+
+
+def test_fan_out_queues_behind_bytes_sent_during_the_pass():
+    broadcaster, _, _ = make_broadcaster()
+    players = [make_player(name=f'player{index}') for index in range(2)]
+
+    def encode_prefix(sent_at):
+        # another thread queues a ping for the second player while the first one is written to
+        if not players[1].outbound:
+            broadcaster.send(players[1], b'ping;')
+        return b'prefix;'
+
+    stamps = broadcaster.fan_out(players, encode_prefix, b'shared;')
+
+    assert {player for player, _ in stamps} == set(players)
+    for player in players:
+        assert player.outbound_size == sum(len(buffer) for buffer in player.outbound)
+    assert b''.join(bytes(buffer) for buffer in players[1].outbound) == b'ping;prefix;shared;'
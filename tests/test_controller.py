@@ -0,0 +1,268 @@
+import threading
+import time
+from socket import create_server, create_connection
+
+from common.heartbeat import PING_FRAME
+from common.protocol import MessageType, encode_frame, encode_join, encode_text
+from conftest import Client, wait_for
+from controller import ServiceController
+from player_model import Player
+from scoring import ANSWER_LIMIT
+
+
+def run_in_loop(loop, callback=lambda: None):
+    # run a function in the loop thread and wait for it, the callbacks scheduled before it run first
+    done, result = threading.Event(), []
+    loop.call_soon(lambda: (result.append(callback()), done.set()))
+    assert done.wait(5)
+    return result[0]
+
+
+def tcp_pair():
+    # players are tcp connections, keepalive cannot be set on a unix socket pair
+    with create_server(('127.0.0.1', 0)) as server:
+        client_side = create_connection(server.getsockname())
+        server_side, _ = server.accept()
+    return server_side, Client(client_side)
+
+
+def make_controller(loop, **kwargs):
+    kwargs.setdefault('heartbeat_timeout', None)
+    controller = ServiceController(0, 1, **kwargs)
+    controller.attach(loop)
+    return controller
+
+
+def welcome(loop, controller, name):
+    server_side, client = tcp_pair()
+    player = Player(name, server_side, ('127.0.0.1', 1), sender=controller.broadcaster.send)
+    run_in_loop(loop, lambda: controller.welcome(player, is_resumed=False))
+    return player, client
+
+
+def join_players(loop, controller, *names):
+    clients = []
+    for name in names:
+        _, client = welcome(loop, controller, name)
+        assert client.read_message() == 'Connected'
+        assert client.read()[0] == MessageType.SESSION
+        clients.append(client)
+    return clients
+
+
+def test_game_is_played_over_sockets():
+    controller = ServiceController(0, 2, min_players=2, auto_restart=False, heartbeat_timeout=None)
+    controller.connect()
+    game = threading.Thread(target=controller.run, name='game', daemon=True)
+    game.start()
+
+    port = controller.server.getsockname()[1]
+    clients = [Client.connect(port, encode_text(name)) for name in ('alice', 'bob')]
+    for client in clients:
+        assert client.read_message() == 'Connected'
+        assert client.read_message()['total'] == 0
+        assert client.read_message() == 'start'
+
+    totals = {}
+    for question in range(2):
+        for index, client in enumerate(clients):
+            assert client.read()[0] == MessageType.QUESTION
+            client.send(encode_text(str(index)))
+        for name, client in zip(('alice', 'bob'), clients):
+            results = client.read_message()
+            assert results['players'] == 2 and results['is_end'] == (question == 1)
+            totals[name] = results['total']
+
+    # one point is shared by the closest answers of every round
+    assert sum(totals.values()) == 2.0
+    for client in clients:
+        assert client.read_message() == 'terminate'
+
+    game.join(5)
+    assert not game.is_alive()
+    controller.close()
+    for client in clients:
+        client.close()
+
+
+def test_invalid_names_are_rejected():
+    controller = ServiceController(0, 1, max_players=2, heartbeat_timeout=None)
+    controller.connect()
+    controller.acceptor.start()
+    port = controller.server.getsockname()[1]
+
+    players = [Client.connect(port, encode_text(name)) for name in ('alice', 'bob')]
+    for client in players:
+        assert client.read_message() == 'Connected'
+
+    for name, reason in [('alice', 'Name already exists'), ('', 'Name cannot be empty'), ('carol', 'Game is full')]:
+        client = Client.connect(port, encode_text(name))
+        assert client.read_message() == reason
+        assert client.read() is None
+        client.close()
+
+    client = Client.connect(port, encode_frame(MessageType.TEXT, b'\xff\xfe'))
+    assert client.read_message() == 'Invalid name'
+    assert client.read() is None
+    client.close()
+
+    assert list(controller.players) == ['alice', 'bob']
+    controller.close()
+    for client in players:
+        client.close()
+
+
+def test_dead_players_are_closed_in_the_loop_thread(loop, monkeypatch):
+    controller = make_controller(loop)
+    player, client = welcome(loop, controller, 'alice')
+
+    closed_in = []
+    close = Player.close
+    monkeypatch.setattr(Player, 'close', lambda self: (closed_in.append(loop.in_loop_thread()), close(self)))
+
+    # the game thread removes the player, the loop thread is the only one to close its socket
+    controller.disconnect_player(player)
+    controller.check_connections()
+    assert 'alice' not in controller.players
+    run_in_loop(loop)
+
+    assert closed_in == [True]
+    assert player.client.fileno() == -1
+    assert run_in_loop(loop, lambda: len(loop.selector.get_map())) == 1  # only the waker is left
+    client.close()
+
+
+def test_closed_connections_are_removed(loop):
+    controller = make_controller(loop)
+    alice, bob = join_players(loop, controller, 'alice', 'bob')
+    assert controller.start_game()
+
+    bob.close()
+    wait_for(lambda: controller.check_connections() or 'bob' not in controller.players)
+    assert 'bob' in controller.removed_players
+    assert controller._is_game_over
+    assert alice.read_message() == 'only_one_player'
+    alice.close()
+
+
+def test_silent_players_are_dropped_by_the_heartbeat(loop):
+    controller = make_controller(loop, heartbeat_interval=0.05, heartbeat_timeout=0.3)
+    alice, bob = join_players(loop, controller, 'alice', 'bob')
+
+    # anything sent by a client keeps it alive, bob stays silent
+    deadline = time.monotonic() + 1
+    while time.monotonic() < deadline:
+        alice.send(PING_FRAME)
+        time.sleep(0.05)
+        controller.check_connections()
+
+    assert list(controller.players) == ['alice']
+    assert bob.read() is None
+    for client in (alice, bob):
+        client.close()
+
+
+def test_rounds_end_at_the_answer_deadline(loop):
+    controller = make_controller(loop, answer_timeout=0.2)
+    alice, bob = join_players(loop, controller, 'alice', 'bob')
+    controller.read_questions()
+    controller.ask_question()
+    assert alice.read()[0] == MessageType.QUESTION
+
+    # bob does not answer, the deadline timer of the loop ends the round
+    alice.send(encode_text('5'))
+    started = time.monotonic()
+    controller.wait_for_answer_from_clients()
+    assert time.monotonic() - started < 1
+
+    assert controller.players['alice'].answer == 5
+    assert controller.players['bob'].answer is None
+    for client in (alice, bob):
+        client.close()
+
+
+def test_oversized_answers_are_clamped(loop):
+    controller = make_controller(loop)
+    alice, bob = join_players(loop, controller, 'alice', 'bob')
+    controller.read_questions()
+    answer = controller.ask_question()
+    for client in (alice, bob):
+        assert client.read()[0] == MessageType.QUESTION
+
+    alice.send(encode_text('9' * 30))
+    bob.send(encode_text('-' + '9' * 30))
+    controller.wait_for_answer_from_clients(timeout=5)
+    assert controller.players['alice'].answer == ANSWER_LIMIT
+    assert controller.players['bob'].answer == -ANSWER_LIMIT
+
+    controller.score_answers(answer)
+    controller.send_results(answer)
+    results = [client.read_message() for client in (alice, bob)]
+    assert [result['answer'] for result in results] == [answer, answer]
+    assert sum(result['total'] for result in results) == 1.0
+    for client in (alice, bob):
+        client.close()
+
+
+def test_late_joiners_get_connected_before_the_question(loop, monkeypatch):
+    controller = make_controller(loop)
+    clients = join_players(loop, controller, 'alice', 'bob')
+    assert controller.start_game()
+    controller.read_questions()
+    controller.ask_question()
+
+    # the game thread seats a joiner as soon as it is notified, before the loop thread is done with it
+    notify_all = controller.round_condition.notify_all
+    monkeypatch.setattr(controller.round_condition, 'notify_all',
+                        lambda: (notify_all(), controller.admit_joiners()))
+    player, carol = welcome(loop, controller, 'carol')
+
+    frames = [carol.read() for _ in range(3)]
+    assert [message_type for message_type, _ in frames] == [MessageType.TEXT, MessageType.SESSION,
+                                                            MessageType.QUESTION]
+    assert frames[0][1] == b'Connected'
+    assert player in controller._pending_answers
+    for client in clients + [carol]:
+        client.close()
+
+
+def test_sessions_are_resumed():
+    controller = ServiceController(0, 1, heartbeat_timeout=None)
+    controller.connect()
+    controller.acceptor.start()
+    port = controller.server.getsockname()[1]
+
+    clients, tokens = {}, {}
+    for name in ('alice', 'bob', 'carol'):
+        clients[name] = Client.connect(port, encode_text(name))
+        assert clients[name].read_message() == 'Connected'
+        tokens[name] = clients[name].read_message()['token']
+    assert controller.start_game()
+    controller.players['alice'].total = 3
+
+    # a player who left during the game comes back with its score, a wrong token does not take its name
+    clients['alice'].close()
+    wait_for(lambda: controller.check_connections() or 'alice' not in controller.players)
+    client = Client.connect(port, encode_join('alice', None, 'wrong'))
+    assert client.read_message() == 'Name already exists'
+    client.close()
+
+    clients['alice'] = Client.connect(port, encode_join('alice', None, tokens['alice']))
+    assert clients['alice'].read_message() == 'Connected'
+    session = clients['alice'].read_message()
+    assert session['is_resumed'] and session['is_started'] and session['total'] == 3
+    wait_for(lambda: controller.admit_joiners() or 'alice' in controller.players)
+    assert controller.players['alice'].total == 3
+
+    # a new connection of a player who did not leave replaces the old one
+    previous = clients['bob']
+    clients['bob'] = Client.connect(port, encode_join('bob', None, tokens['bob']))
+    assert clients['bob'].read_message() == 'Connected'
+    assert clients['bob'].read_message()['is_resumed']
+    assert previous.read() is None
+    assert controller.players['bob'].token == tokens['bob']
+    assert controller._dead_players == set()
+
+    controller.close()
+    for client in list(clients.values()) + [previous]:
+        client.close()
@@ -0,0 +1,74 @@
+import struct
+from socket import create_server
+
+import pytest
+
+from common.protocol import MessageType, encode_text
+from conftest import Client, wait_for
+from handshake import Acceptor
+
+
+class Joins:
+    # joins and logs reported by an acceptor, written by the loop thread
+    def __init__(self):
+        self.joins = []
+        self.logs = []
+
+    def on_join(self, handshake, frame):
+        self.joins.append((handshake, frame))
+
+
+@pytest.fixture
+def acceptor(loop):
+    server = create_server(('127.0.0.1', 0))
+    joins = Joins()
+    acceptor = Acceptor(loop, server, joins.on_join, joins.logs.append, timeout=0.2, max_join_size=64)
+    acceptor.start()
+    yield acceptor, joins
+    loop.call_soon(acceptor.close)
+    for handshake, _ in joins.joins:
+        handshake.client.close()
+    server.close()
+
+
+def connect(acceptor, data=b''):
+    return Client.connect(acceptor[0].server.getsockname()[1], data)
+
+
+def test_silent_clients_do_not_hold_the_others(acceptor):
+    _, joins = acceptor
+    silent = connect(acceptor)
+    clients = [connect(acceptor, encode_text(f'player{index}')) for index in range(20)]
+
+    wait_for(lambda: len(joins.joins) == 20)
+    assert sorted(frame for _, frame in joins.joins) == sorted((MessageType.TEXT, f'player{index}'.encode())
+                                                               for index in range(20))
+
+    # the silent client is dropped at the handshake timeout
+    assert silent.read() is None
+    assert any('did not send a name' in log for log in joins.logs)
+    for client in clients + [silent]:
+        client.close()
+
+
+def test_join_messages_are_read_across_segments(acceptor):
+    _, joins = acceptor
+    frame = encode_text('alice')
+    client = connect(acceptor, frame[:3])
+    client.send(frame[3:] + encode_text('answer'))
+
+    wait_for(lambda: joins.joins)
+    handshake, join = joins.joins[0]
+    assert join == (MessageType.TEXT, b'alice')
+    # the bytes sent after the join message are kept for the player
+    assert handshake.decoder.next_frame() == (MessageType.TEXT, b'answer')
+    client.close()
+
+
+def test_large_join_messages_are_dropped(acceptor):
+    _, joins = acceptor
+    client = connect(acceptor, struct.pack('!IB', 1000, MessageType.TEXT) + b'x' * 100)
+
+    assert client.read() is None
+    assert joins.joins == []
+    client.close()
@@ -0,0 +1,65 @@
+import random
+
+from leaderboard import Leaderboard
+
+
+def expected_order(totals):
+    return sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+
+
+def expected_rank(totals, name):
+    return 1 + sum(1 for total in totals.values() if total > totals[name])
+
+
+def test_random_updates_match_a_sorted_list():
+    rng = random.Random(408)
+    leaderboard, totals = Leaderboard(), {}
+
+    for step in range(3000):
+        name = f'player{rng.randrange(200)}'
+        if rng.random() < 0.2:
+            leaderboard.remove(name)
+            totals.pop(name, None)
+        else:
+            # few distinct totals so that many players tie
+            total = rng.randrange(20) / 2
+            leaderboard.update(name, total)
+            totals[name] = total
+
+        if step % 100 == 0:
+            assert len(leaderboard) == len(totals)
+            assert leaderboard.top(len(totals)) == expected_order(totals)
+            for name in totals:
+                assert leaderboard.rank(name) == expected_rank(totals, name)
+                assert leaderboard.total(name) == totals[name]
+
+
+def test_ties_share_a_rank():
+    leaderboard = Leaderboard()
+    for name, total in (('a', 1.0), ('b', 3.0), ('c', 3.0), ('d', 0.5)):
+        leaderboard.update(name, total)
+
+    assert [leaderboard.rank(name) for name in 'abcd'] == [3, 1, 1, 4]
+    assert leaderboard.top(2) == [('b', 3.0), ('c', 3.0)]
+
+
+def test_update_moves_a_player():
+    leaderboard = Leaderboard()
+    leaderboard.update('a', 1.0)
+    leaderboard.update('b', 2.0)
+    leaderboard.update('a', 5.0)
+
+    assert leaderboard.top() == [('a', 5.0), ('b', 2.0)]
+    assert len(leaderboard) == 2
+
+
+def test_remove_and_clear():
+    leaderboard = Leaderboard()
+    leaderboard.update('a', 1.0)
+    leaderboard.remove('missing')
+    leaderboard.remove('a')
+    assert 'a' not in leaderboard and leaderboard.top() == []
+
+    leaderboard.update('b', 1.0)
+    leaderboard.clear()
+    assert len(leaderboard) == 0 and leaderboard.top() == []
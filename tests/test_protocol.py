@@ -0,0 +1,84 @@
+import pytest
+
+from common.protocol import (FrameDecoder, MessageType, ProtocolError, Verdict, encode_frame, encode_text,
+                             encode_join, decode_join, encode_scoreboard, encode_results, encode_question_prefix,
+                             decode_question, decode_results, decode_message)
+
+
+def test_decoder_handles_partial_reads():
+    data = encode_text('hello') + encode_frame(MessageType.PING)
+    decoder = FrameDecoder()
+    frames = []
+    for index in range(len(data)):
+        decoder.feed(data[index:index + 1])
+        frames.extend(decoder.frames())
+
+    assert frames == [(MessageType.TEXT, b'hello'), (MessageType.PING, b'')]
+    assert decoder.next_frame() is None
+
+
+def test_decoder_splits_coalesced_frames():
+    decoder = FrameDecoder()
+    decoder.feed(b''.join(encode_text(str(number)) for number in range(100)))
+
+    assert [payload for _, payload in decoder.frames()] == [str(number).encode() for number in range(100)]
+
+
+def test_decoder_keeps_the_rest_of_a_frame_across_feeds():
+    decoder = FrameDecoder()
+    first, second = encode_text('first'), encode_text('second')
+    decoder.feed(first + second[:3])
+    assert decoder.next_frame() == (MessageType.TEXT, b'first')
+    assert decoder.next_frame() is None
+
+    decoder.feed(second[3:])
+    assert decoder.next_frame() == (MessageType.TEXT, b'second')
+
+
+def test_decoder_rejects_large_payloads():
+    decoder = FrameDecoder(max_payload_size=4)
+    decoder.feed(encode_text('too long'))
+    with pytest.raises(ProtocolError):
+        decoder.next_frame()
+
+
+def test_join_round_trip():
+    assert decode_join(encode_join('alice', 'room', 'token')[5:]) == ('alice', 'room', 'token')
+    assert decode_join(encode_join('bob', None)[5:]) == ('bob', None, None)
+    assert decode_message((MessageType.JOIN, encode_join('bob', 'lobby')[5:])) == {'name': 'bob', 'room': 'lobby'}
+
+
+@pytest.mark.parametrize('payload', [b'[]', b'{}', b'"alice"', b'{"room": "lobby"}'])
+def test_decode_join_rejects_invalid_messages(payload):
+    with pytest.raises(ValueError):
+        decode_join(payload)
+
+
+def test_results_round_trip():
+    scoreboard = encode_scoreboard(42, [('alice', 2.5), ('böb', 1.0)], 3, True)
+    decoder = FrameDecoder()
+    decoder.feed(encode_results(Verdict.TIED, 40, 1, 2.5, scoreboard))
+    message_type, payload = decoder.next_frame()
+
+    assert message_type == MessageType.RESULTS
+    assert decode_results(payload) == {'message': 'You tied with 40.', 'answer': 42,
+                                       'scores': {'alice': 2.5, 'böb': 1.0}, 'rank': 1, 'total': 2.5,
+                                       'players': 3, 'is_end': True}
+
+
+def test_results_without_answer():
+    scoreboard = encode_scoreboard(7, [], 0, False)
+    results = decode_results(encode_results(Verdict.LOST, None, 2, 0.0, scoreboard)[5:])
+
+    assert results['message'] == 'You did not answer this round.'
+    assert results['scores'] == {}
+
+
+def test_question_round_trip():
+    text = 'How many?'.encode()
+    decoder = FrameDecoder()
+    decoder.feed(encode_question_prefix(1234.5, len(text)) + text)
+    message_type, payload = decoder.next_frame()
+
+    assert message_type == MessageType.QUESTION
+    assert decode_question(payload) == ('How many?', 1234.5)
@@ -0,0 +1,103 @@
+import random
+
+import pytest
+
+from question_bank import (QuestionBank, MappedQuestionBank, QuestionSampler, BANK_HEADER, DEFAULT_QUESTIONS_PATH,
+                           open_question_bank, compile_questions)
+
+
+def make_bank(count=20):
+    bank = QuestionBank()
+    for index in range(count):
+        bank.add(f'Question {index} ü?', index * 10, category='even' if index % 2 == 0 else 'odd',
+                 difficulty=index % 3)
+    return bank
+
+
+def test_sampler_draws_every_question_once_per_permutation():
+    bank = make_bank()
+    sampler = bank.sampler(rng=random.Random(408))
+
+    first = [sampler.draw() for _ in range(len(bank))]
+    assert len(sampler) == 0
+    assert sorted(first, key=lambda question: question[1]) == [bank.get(index) for index in range(len(bank))]
+
+    # a new permutation starts once every question is drawn
+    second = [sampler.draw() for _ in range(len(bank))]
+    assert sorted(second) == sorted(first)
+
+
+def test_sampler_is_reproducible_with_a_seed():
+    bank = make_bank()
+    draws = [[bank.sampler(rng=random.Random(seed)).draw() for _ in range(5)] for seed in (1, 1)]
+    assert draws[0] == draws[1]
+
+
+def test_sampler_filters_by_category_and_difficulty():
+    bank = make_bank()
+    sampler = bank.sampler(category='even', difficulty=0, rng=random.Random(408))
+    answers = sorted(sampler.draw()[1] for _ in range(len(sampler)))
+
+    assert answers == [index * 10 for index in range(20) if index % 2 == 0 and index % 3 == 0]
+    assert sorted(bank.categories) == ['even', 'odd']
+
+
+def test_empty_sampler():
+    with pytest.raises(IndexError):
+        QuestionBank().sampler().draw()
+    with pytest.raises(IndexError):
+        make_bank().sampler(category='missing').draw()
+
+
+def test_bank_reads_questions_added_after_a_lookup():
+    bank = make_bank(2)
+    assert bank.get(1) == ('Question 1 ü?', 10)
+    bank.add('Last', -5)
+    assert bank.get(2) == ('Last', -5)
+
+
+def test_compiled_bank_round_trip(tmp_path):
+    bank = make_bank()
+    path = str(tmp_path / 'questions.qbank')
+    bank.save(path)
+
+    mapped = open_question_bank(path)
+    assert isinstance(mapped, MappedQuestionBank)
+    assert len(mapped) == len(bank)
+    assert [mapped.get(index) for index in range(len(bank))] == [bank.get(index) for index in range(len(bank))]
+
+    sampler = mapped.sampler(rng=random.Random(408))
+    assert isinstance(sampler, QuestionSampler) and len(sampler) == len(bank)
+    with pytest.raises(ValueError):
+        mapped.sampler(category='even')
+    with pytest.raises(IndexError):
+        mapped.get(len(bank))
+    mapped.close()
+
+
+def test_compile_the_default_questions(tmp_path):
+    path = str(tmp_path / 'default.qbank')
+    count = compile_questions(DEFAULT_QUESTIONS_PATH, path)
+    text, mapped = QuestionBank.load(DEFAULT_QUESTIONS_PATH), MappedQuestionBank(path)
+
+    assert count == len(text) == len(mapped) > 0
+    assert [mapped.get(index) for index in range(count)] == [text.get(index) for index in range(count)]
+    mapped.close()
+
+
+def test_invalid_compiled_banks_are_rejected(tmp_path):
+    path = tmp_path / 'bank.qbank'
+    make_bank().save(str(path))
+    data = path.read_bytes()
+
+    path.write_bytes(data[:-1])
+    with pytest.raises(ValueError, match='truncated'):
+        MappedQuestionBank(str(path))
+
+    path.write_bytes(b'XXXX' + data[4:])
+    with pytest.raises(ValueError, match='not a compiled'):
+        MappedQuestionBank(str(path))
+
+    path.write_bytes(data[:BANK_HEADER.size - 1])
+    with pytest.raises(ValueError, match='not a compiled'):
+        MappedQuestionBank(str(path))
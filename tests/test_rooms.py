@@ -0,0 +1,50 @@
+import pytest
+
+from common.protocol import MessageType, encode_join, encode_text
+from conftest import Client, wait_for
+from server import GameServer
+
+
+@pytest.fixture
+def server():
+    server = GameServer(0, 1, heartbeat_timeout=None)
+    server.connect()
+    yield server
+    server.terminate()
+    server.close()
+
+
+def join(server, name, room):
+    client = Client.connect(server.server.getsockname()[1], encode_join(name, room))
+    assert client.read_message() == 'Connected'
+    assert client.read()[0] == MessageType.SESSION
+    return client
+
+
+def test_rooms_play_their_own_games(server):
+    alice, bob = join(server, 'alice', 'quiz'), join(server, 'bob', 'quiz')
+    # names only have to be unique in their room
+    other = join(server, 'alice', 'lobby')
+
+    for index, client in enumerate((alice, bob)):
+        assert client.read_message() == 'start'
+        assert client.read()[0] == MessageType.QUESTION
+        client.send(encode_text(str(index)))
+    for client in (alice, bob):
+        results = client.read_message()
+        assert results['players'] == 2 and results['is_end']
+        assert client.read_message() == 'terminate'
+
+    # the room closes once its game ends without a restart, the other room still waits for players
+    wait_for(lambda: server.registry.get('quiz') is None)
+    assert len(server.registry) == 1 and len(server.registry.get('lobby')) == 1
+    for client in (alice, bob, other):
+        client.close()
+
+
+def test_empty_rooms_are_closed(server):
+    client = join(server, 'alice', 'quiz')
+    assert len(server.registry) == 1
+
+    client.close()
+    wait_for(lambda: len(server.registry) == 0)
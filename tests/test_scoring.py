@@ -0,0 +1,109 @@
+import random
+
+import pytest
+
+import scoring
+from scoring import ScoreTable
+
+BACKENDS = [False, pytest.param(True, marks=pytest.mark.skipif(scoring.numpy is None, reason='numpy is not installed'))]
+
+
+def score(table, answers, correct_answer):
+    table.clear_answers()
+    for name, answer in answers.items():
+        table.set_answer(name, answer)
+    winners, awards = table.score(correct_answer)
+    return sorted(winners), dict(awards)
+
+
+def make_table(rule, use_numpy, names):
+    table = ScoreTable(rule, use_numpy=use_numpy, capacity=2)
+    for name in names:
+        table.add(name)
+    return table
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_closest_splits_one_point(use_numpy):
+    table = make_table('closest', use_numpy, 'abcd')
+    winners, awards = score(table, {'a': 8, 'b': 12, 'c': 20}, 10)
+
+    assert winners == ['a', 'b']
+    assert awards == {'a': 0.5, 'b': 0.5}
+    assert table.total('a') == 0.5 and table.total('c') == 0 and table.total('d') == 0
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_proportional_rewards_every_answer(use_numpy):
+    table = make_table('proportional', use_numpy, 'abc')
+    winners, awards = score(table, {'a': 10, 'b': 13, 'c': 7}, 11)
+
+    assert winners == ['a']
+    assert awards == pytest.approx({'a': 1.0, 'b': 2 / 3, 'c': 2 / 5})
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_top3_rewards_the_three_closest_distances(use_numpy):
+    table = make_table('top3', use_numpy, 'abcde')
+    winners, awards = score(table, {'a': 10, 'b': 12, 'c': 8, 'd': 15, 'e': 50}, 10)
+
+    assert winners == ['a']
+    assert awards == {'a': 1.0, 'b': 0.25, 'c': 0.25, 'd': 0.25}
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_no_answer_gives_no_points(use_numpy):
+    table = make_table('closest', use_numpy, 'ab')
+    assert score(table, {}, 10) == ([], {})
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_slots_are_reused_without_leaking_answers(use_numpy):
+    table = make_table('closest', use_numpy, 'abc')
+    table.set_answer('b', 10)
+    table.remove('b')
+    slot = table.add('z', total=3.0)
+
+    assert slot == 1 and 'b' not in table and len(table) == 3
+    assert table.total('z') == 3.0
+    # the answer of the removed player is not given to the player taking its slot
+    assert table.score(10) == ([], [])
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_totals_accumulate_and_reset(use_numpy):
+    table = make_table('closest', use_numpy, 'ab')
+    score(table, {'a': 1, 'b': 5}, 1)
+    score(table, {'a': 1, 'b': 5}, 5)
+    score(table, {'a': 1}, 5)
+    assert (table.total('a'), table.total('b')) == (2.0, 1.0)
+
+    table.reset_totals()
+    assert (table.total('a'), table.total('b')) == (0.0, 0.0)
+
+
+@pytest.mark.parametrize('use_numpy', BACKENDS)
+def test_huge_answers_are_clamped(use_numpy):
+    table = make_table('closest', use_numpy, 'ab')
+    winners, _ = score(table, {'a': 10 ** 30, 'b': -10 ** 30}, 0)
+    assert winners == ['a', 'b']
+
+
+@pytest.mark.skipif(scoring.numpy is None, reason='numpy is not installed')
+@pytest.mark.parametrize('rule', scoring.SCORING_RULES)
+def test_backends_agree(rule):
+    rng = random.Random(408)
+    names = [f'player{index}' for index in range(50)]
+    tables = [make_table(rule, use_numpy, names) for use_numpy in (False, True)]
+
+    for _ in range(20):
+        answers = {name: rng.randrange(100) for name in names if rng.random() < 0.8}
+        correct_answer = rng.randrange(100)
+        python_result, numpy_result = (score(table, answers, correct_answer) for table in tables)
+        assert python_result[0] == numpy_result[0]
+        assert python_result[1] == pytest.approx(numpy_result[1])
+
+
+def test_unknown_rule():
+    with pytest.raises(ValueError):
+        ScoreTable('fastest')
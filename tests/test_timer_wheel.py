@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from io_loop import TimerHandle, TimerWheel
+
+
+def run_wheel(wheel, timers, end, step):
+    """
+    Advance a wheel until end and collect the time every timer expired at
+    :return: expiry time by timer
+    """
+    for timer in timers:
+        wheel.add(timer)
+
+    expired_at = {}
+    now = 0.0
+    while now <= end:
+        for timer in wheel.expire(now):
+            assert timer not in expired_at
+            expired_at[timer] = now
+        now += step
+    return expired_at
+
+
+@pytest.mark.parametrize('slot_bits, levels', [(8, 4), (2, 3), (1, 2)])
+def test_timers_expire_on_time_across_levels(slot_bits, levels):
+    rng = random.Random(408)
+    wheel = TimerWheel(resolution=0.01, slot_bits=slot_bits, levels=levels, start=0.0)
+    # small wheels put most timers in the upper levels or beyond their range
+    timers = [TimerHandle(rng.uniform(0, 30), None, ()) for _ in range(2000)]
+
+    expired_at = run_wheel(wheel, timers, 31.0, 0.01)
+
+    assert len(expired_at) == len(timers)
+    assert len(wheel) == 0
+    for timer, now in expired_at.items():
+        # never early and at most one tick late, with room for float rounding
+        assert timer.when <= now + 1e-9
+        assert now - timer.when <= 0.02 + 1e-9
+
+
+def test_large_steps_expire_everything_due():
+    wheel = TimerWheel(resolution=0.01, slot_bits=2, levels=2, start=0.0)
+    timers = [TimerHandle(when, None, ()) for when in (0.05, 0.5, 3.0, 70.0)]
+    for timer in timers:
+        wheel.add(timer)
+
+    assert wheel.expire(0.04) == []
+    assert set(wheel.expire(5.0)) == set(timers[:3])
+    assert wheel.expire(69.99) == []
+    assert wheel.expire(70.0) == [timers[3]]
+
+
+def test_timer_added_after_the_wheel_advanced():
+    wheel = TimerWheel(resolution=0.01, start=0.0)
+    wheel.add(TimerHandle(1.0, None, ()))
+    wheel.expire(2.0)
+
+    late = TimerHandle(0.5, None, ())  # already due, expires on the next tick
+    wheel.add(late)
+    assert wheel.expire(2.0) == []
+    assert wheel.expire(2.015) == [late]
+
+
+def test_cancelled_timers_are_returned_marked():
+    wheel = TimerWheel(resolution=0.01, start=0.0)
+    timer = TimerHandle(0.1, print, ('x',))
+    wheel.add(timer)
+    timer.cancel()
+
+    assert wheel.expire(0.1) == [timer]
+    assert timer.is_cancelled and timer.callback is None
+
+
+def test_next_timeout_is_a_lower_bound():
+    wheel = TimerWheel(resolution=0.01, start=0.0)
+    assert wheel.next_timeout(0.0) is None
+
+    wheel.add(TimerHandle(5.0, None, ()))
+    now = 0.0
+    while not wheel.expire(now):
+        timeout = wheel.next_timeout(now)
+        assert timeout is not None and now + timeout <= 5.0 + 1e-9
+        now += max(timeout, 0.01)
+    assert now >= 5.0 - 1e-9